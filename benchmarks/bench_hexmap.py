@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+# NAME
+#       bench_hexmap, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Benchmarks of HexMap4Gimp that run without GIMP. It times the pure
+#       geometry (hex centers, label layout, large grid polylines and SVG
+#       export) and
+#       counts the GIMP calls issued by each drawing routine, and by the
+#       creation of whole maps, running them against the stand-in of
+#       pdbrecorder.py, which also adds up the megabytes of layer pixels they
+#       write. The hits, misses and evictions of the label and template
+#       caches are shown too, as h/m/e. Run it from anywhere:
+#
+#           python3 benchmarks/bench_hexmap.py
+#           python3 benchmarks/bench_hexmap.py --sizes 16,256 --json out.jsonl
+#
+#       Sizes are the number of rows and of columns of the square maps used.
+#       test_bench_hexmap.py runs the same benchmarks under pytest, checking
+#       the number of calls.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import argparse, atexit, json, os, shutil, sys, tempfile, time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+import pdbrecorder
+pdbrecorder.install()
+
+import hexmap4gimp, hexsvg
+from hexgeometry import HexGeometry
+
+def timed(function, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def geometry(size):
+    geom = HexGeometry(36, 31)
+    geom.set_dims(size, size)
+    geom.lgrid_setup(4, size // 2, size // 2)
+    return geom
+
+def centers(geom):
+    if hexmap4gimp.hexraster is None:
+        return geom.hex_center_list(0, geom.cols, 0, geom.rows)
+    return geom.hex_centers(0, geom.cols, 0, geom.rows)
+
+def label_layout(geom):
+    if hexmap4gimp.hexraster is None:
+        return None
+    layout = geom.label_grid(0, 0, geom.cols - 1, geom.rows - 1, 0, 0, "")
+    widths = {f"{i:02d}": 10 for i in range(max(geom.rows, geom.cols))}
+    return hexmap4gimp.hexraster.label_placements(geom, layout, widths)
+
+def lgrid_polylines(geom):
+    return geom.lgrid_polylines()
+
+def lgrid_nested_polylines(geom):
+    # Large hexes of 4 and 16 hexes
+    return geom.lgrid_polylines(scales=[4, 16])
+
+def svg_export(geom):
+    spec = hexmap4gimp.complete_spec({"rows": geom.rows, "cols": geom.cols,
+                                      "numbering": True, "large_grid": True})
+    with open(os.devnull, "w") as f:
+        hexsvg.write_svg(f, geom.hex_w, geom.hex_h, spec)
+
+# Geometry benchmarks, each taking the geometry of a map
+geometry_benchmarks = {
+    "hex centers": centers,
+    "label layout": label_layout,
+    "large grid polylines": lgrid_polylines,
+    "large grid (2 levels)": lgrid_nested_polylines,
+    "svg export": svg_export,
+}
+
+def map_image(hexgrid):
+    img = hexmap4gimp.Gimp.Image.new(hexgrid.img_w, hexgrid.img_h, None)
+    for name in ("Terrain", "Grid", "LargeGrid", "Numbers"):
+        layer = hexmap4gimp.Gimp.Layer.new(img, name, hexgrid.img_w,
+                                           hexgrid.img_h, None, 100, None)
+        img.insert_layer(layer, None, 0)
+    return img
+
+def cold_brush_size(hexgrid, img):
+    # Brush size looked up without a cache file, scanning the brush folders
+    hexmap4gimp.brush_cache = None
+    path = os.path.join(pdbrecorder.gimp_dir, hexmap4gimp.brush_cache_file)
+    if os.path.exists(path):
+        os.remove(path)
+    return hexmap4gimp.brush_size("hex blank")
+
+def cold_labels(hexgrid, img):
+    # Labels drawn without a label cache file, rendering every sprite
+    hexmap4gimp.label_cache = None
+    path = os.path.join(pdbrecorder.gimp_dir, hexmap4gimp.label_cache_file)
+    if os.path.exists(path):
+        os.remove(path)
+    last = hexgrid.rows - 1
+    hexgrid.draw_labels(img, 0, 0, last, last, 0, 0, "")
+
+def cold_template(spec):
+    # Map made with an empty template cache, which saves it
+    hexmap4gimp.template_cache = None
+    shutil.rmtree(os.path.join(pdbrecorder.gimp_dir,
+                               hexmap4gimp.template_cache_dir), True)
+    return hexmap4gimp.template_hex_map(spec)
+
+def drawing_routines(size):
+    # Each drawing routine run on a fresh map of the given size
+    last = size - 1
+    routines = {
+        "draw (loop)": lambda g, img: g.draw(img, hexmap4gimp.draw_loop),
+        "draw (tiled)": lambda g, img: g.draw(img, hexmap4gimp.draw_tiled),
+        "draw_labels (cold cache)": cold_labels,
+        "draw_labels": lambda g, img: g.draw_labels(img, 0, 0, last, last,
+                                                    0, 0, ""),
+        "draw_labels (merged)": lambda g, img: g.draw_labels_merged(
+            img, 0, 0, last, last, 0, 0, ""),
+        "draw_large_grid": lambda g, img: g.draw_large_grid(img),
+    }
+    if hexmap4gimp.hexraster is not None:
+        routines["draw (raster)"] = lambda g, img: g.draw(
+            img, hexmap4gimp.draw_raster)
+    plain = hexmap4gimp.complete_spec({"rows": size, "cols": size})
+    full = hexmap4gimp.complete_spec({"rows": size, "cols": size,
+                                      "numbering": True, "large_grid": True})
+    routines["brush size (cold cache)"] = cold_brush_size
+    routines["brush size (warm cache)"] = (
+        lambda g, img: hexmap4gimp.brush_size("hex blank"))
+    routines["brush size (get_info)"] = (
+        lambda g, img: hexmap4gimp.Gimp.Brush.get_by_name(
+            "hex blank").get_info())
+    routines["create_hex_map"] = (
+        lambda g, img: hexmap4gimp.create_hex_map(plain))
+    routines["create_hex_map (all)"] = (
+        lambda g, img: hexmap4gimp.create_hex_map(full))
+    # The hit loads the map saved by the miss, run just before
+    routines["create_hex_map (cache miss)"] = (
+        lambda g, img: cold_template(full))
+    routines["create_hex_map (cache hit)"] = (
+        lambda g, img: hexmap4gimp.template_hex_map(full))
+    if hexmap4gimp.hexraster is not None:
+        parallel = dict(full, draw_mode=hexmap4gimp.draw_parallel)
+        routines["create_hex_map (parallel)"] = (
+            lambda g, img: hexmap4gimp.create_hex_map(parallel))
+    return routines
+
+def reset_cache_counts():
+    # The caches count their hits, misses and evictions from zero
+    for cache in (hexmap4gimp.label_cache, hexmap4gimp.template_cache):
+        if cache is not None:
+            cache.hits = cache.misses = cache.evictions = 0
+
+def cache_counts():
+    # Hits, misses and evictions of the open caches, as "h/m/e"
+    return {name: f"{stats['hits']}/{stats['misses']}/{stats['evictions']}"
+            for name, stats in hexmap4gimp.cache_stats().items()}
+
+def count_calls(size, routine):
+    brush = hexmap4gimp.Gimp.Brush.get_by_name("hex blank")
+    hexgrid = hexmap4gimp.HexGrid(brush)
+    hexgrid.set_dims(size, size)
+    hexgrid.lgrid_setup(4, size // 2, size // 2)
+    img = map_image(hexgrid)
+    pdbrecorder.reset()
+    reset_cache_counts()
+    start = time.perf_counter()
+    routine(hexgrid, img)
+    elapsed = time.perf_counter() - start
+    megabytes = pdbrecorder.bytes_written() / 2**20
+    return (pdbrecorder.pdb_calls(), pdbrecorder.gegl_calls(), megabytes,
+            elapsed, cache_counts())
+
+# Terrain brushes of the hex fill benchmark: two color brushes, composited,
+# and a plain mask brush, stamped with the pencil
+pdbrecorder.add_brush("hex forest", 36, 31, (40, 120, 40))
+pdbrecorder.add_brush("hex hills", 36, 31, (150, 120, 60))
+pdbrecorder.add_brush("hex marsh", 36, 31)
+
+def write_fill(path, size):
+    # Hex fill file painting every hex of a size x size map, forest and
+    # hills alternating, and marsh on the first column
+    with open(path, "w") as f:
+        f.write("col,row,brush\n")
+        for r in range(size):
+            for c in range(size):
+                brush = ("hex marsh" if c == 0 else
+                         ("hex forest", "hex hills")[(c + r) % 2])
+                f.write(f"{c},{r},{brush}\n")
+
+def count_map_edit(size, edit):
+    # Calls made by edit(img) on a map of the given size, with labels and
+    # large grid, such as growing it or regenerating its grid
+    spec = hexmap4gimp.complete_spec({"rows": size, "cols": size,
+                                      "numbering": True, "large_grid": True})
+    img = hexmap4gimp.create_hex_map(spec)
+    pdbrecorder.reset()
+    reset_cache_counts()
+    start = time.perf_counter()
+    edit(img)
+    elapsed = time.perf_counter() - start
+    megabytes = pdbrecorder.bytes_written() / 2**20
+    return (pdbrecorder.pdb_calls(), pdbrecorder.gegl_calls(), megabytes,
+            elapsed, cache_counts())
+
+def map_edits(size, folder):
+    # Edits of a map, each taking the image, writing their files to folder
+    edits = {f"extend_hex_map (+{add_rows}, +{add_cols})":
+             lambda img, r=add_rows, c=add_cols:
+                 hexmap4gimp.extend_hex_map(img, r, c)
+             for add_rows, add_cols in ((0, 2), (2, 2))}
+    edits["regenerate_hex_map"] = hexmap4gimp.regenerate_hex_map
+    edits["export_map_tiles"] = lambda img: hexmap4gimp.export_map_tiles(
+        img, folder)
+    fill_path = os.path.join(folder, f"fill-{size}.csv")
+    write_fill(fill_path, size)
+    edits["fill_hex_map"] = lambda img: hexmap4gimp.fill_hex_map(img,
+                                                                 fill_path)
+    return edits
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="16,256,1000",
+                        help="map sizes for the geometry benchmarks")
+    parser.add_argument("--draw-sizes", default="16,256",
+                        help="map sizes for counting the calls of the "
+                             "drawing routines")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results, one JSON "
+                                       "object per line, to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'benchmark':<28} {'size':>6} {'seconds':>9} "
+          f"{'pdb calls':>10} {'gegl calls':>10} {'MB written':>10} "
+          f"{'label cache':>11} {'templates':>9}")
+
+    def report(result):
+        results.append(result)
+        pdb = result.get("pdb_calls", "")
+        gegl = result.get("gegl_calls", "")
+        mb = result.get("mb_written", "")
+        mb = f"{mb:.1f}" if mb != "" else mb
+        caches = result.get("caches", {})
+        labels = caches.get("label_cache", "")
+        templates = caches.get("template_cache", "")
+        print(f"{result['benchmark']:<28} {result['size']:>6} "
+              f"{result['seconds']:>9.4f} {pdb:>10} {gegl:>10} {mb:>10} "
+              f"{labels:>11} {templates:>9}")
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        geom = geometry(size)
+        for name, function in geometry_benchmarks.items():
+            seconds = timed(lambda: function(geom), args.repeat)
+            report({"benchmark": name, "size": size, "seconds": seconds})
+
+    tiles_dir = tempfile.mkdtemp(prefix="bench-tiles-")
+    atexit.register(shutil.rmtree, tiles_dir, True)
+    for size in (int(s) for s in args.draw_sizes.split(",")):
+        for name, routine in drawing_routines(size).items():
+            pdb, gegl, mb, seconds, caches = count_calls(size, routine)
+            report({"benchmark": name, "size": size, "seconds": seconds,
+                    "pdb_calls": pdb, "gegl_calls": gegl,
+                    "mb_written": mb, "caches": caches})
+        for name, edit in map_edits(size, tiles_dir).items():
+            pdb, gegl, mb, seconds, caches = count_map_edit(size, edit)
+            report({"benchmark": name, "size": size, "seconds": seconds,
+                    "pdb_calls": pdb, "gegl_calls": gegl,
+                    "mb_written": mb, "caches": caches})
+
+    if args.json:
+        with open(args.json, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+if __name__ == "__main__":
+    main()
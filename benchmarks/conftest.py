@@ -0,0 +1,40 @@
+# NAME
+#       conftest, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Lets the checks of this folder import the plugin modules, hexmap4gimp
+#       running against the stand-in of pdbrecorder.py. Run them with
+#
+#           python3 -m pytest benchmarks
+#
+#       adding --slow for the checks on the biggest maps, which take minutes.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import os, sys
+
+import pytest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+import pdbrecorder
+pdbrecorder.install()
+
+def pytest_addoption(parser):
+    parser.addoption("--slow", action="store_true",
+                     help="also run the checks marked slow, which take "
+                          "minutes")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: only run with --slow")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--slow"):
+        return
+    skip = pytest.mark.skip(reason="slow, run with --slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,508 @@
+# NAME
+#       pdbrecorder, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Stand-in for the gi bindings of GIMP, so that hexmap4gimp.py can be
+#       imported and its drawing routines run from plain Python. Nothing is
+#       drawn: every call to the GIMP API (PDB procedures, and methods of
+#       images, layers and brushes) is counted under its name, and Gegl
+#       buffer accesses are counted apart, as they do not go through the PDB.
+#       The bytes of layer pixels written by whole layer fills and by buffer
+#       uploads are added up too, as a measure of the memory the layers take
+#       (GIMP keeps layer pixels in sparse buffers, only storing what has
+#       been written).
+#
+#       Call install() before importing hexmap4gimp. Brushes are made up from
+#       their size, see add_brush; "hex blank" is the 36x31 HexGimp brush.
+#       They are also written as brush files to the brushes folder of a
+#       temporary GIMP configuration folder, for the brush cache to find.
+#       Images saved with file_save are kept in memory, and file_load gives
+#       back a copy of them.
+#
+#       With painting set (it needs NumPy), layers also keep their pixels:
+#       buffer uploads write them, buffer reads give them back, and the
+#       pencil stamps the brush set in the context, or draws one pixel wide
+#       lines for strokes of more than one point, so that drawing routines
+#       not using selections can be compared pixel by pixel. Selections are
+#       not kept, edit_clear clears the whole layer.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import atexit, collections, os, shutil, struct, sys, tempfile, types
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+calls = collections.Counter()
+written = collections.Counter()
+
+# Whether layers keep their pixels, see the description
+painting = False
+
+# Brush set in the context, and those saved by context_push
+context = {"brush": None}
+context_stack = []
+
+# Color of the lines drawn by the pencil
+line_rgba = (150, 150, 150, 255)
+
+def record(name):
+    calls[name] += 1
+
+def reset():
+    calls.clear()
+    written.clear()
+
+def bytes_written():
+    return written["bytes"]
+
+def pdb_calls():
+    return sum(n for name, n in calls.items() if not name.startswith("Gegl."))
+
+def gegl_calls():
+    return sum(n for name, n in calls.items() if name.startswith("Gegl."))
+
+class AutoMeta(type):
+    # Unknown class attributes are enum values or recorded functions
+    def __getattr__(cls, name):
+        if name[:1].isupper():
+            return f"{cls.__name__}.{name}"
+        return recorder(f"{cls.__name__}.{name}")
+
+class Auto(metaclass=AutoMeta):
+    kind = "Object"
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return recorder(f"{self.kind}.{name}")
+
+def recorder(name):
+    def call(*args, **kwargs):
+        record(name)
+        return Auto()
+    return call
+
+def auto_module(name, prefix, classes=None):
+    module = types.ModuleType(name)
+    classes = dict(classes or {})
+
+    def getattr_(attr):
+        if attr not in classes:
+            if attr[:1].isupper():
+                classes[attr] = AutoMeta(prefix + attr, (Auto,),
+                                         {"kind": prefix + attr})
+            else:
+                return recorder(prefix + attr)
+        return classes[attr]
+
+    module.__getattr__ = getattr_
+    return module
+
+def hex_mask(w, h):
+    # Flat top hex filling a w x h box, as a 0/255 byte mask
+    rows = []
+    half = h // 2
+    for j in range(h):
+        inset = abs(j - half) * (w // 4) // max(1, half)
+        rows.append(b"\0" * inset + b"\xff" * (w - 2 * inset) + b"\0" * inset)
+    return b"".join(rows)
+
+brushes = {}
+gimp_dir = tempfile.mkdtemp(prefix="pdbrecorder-")
+atexit.register(shutil.rmtree, gimp_dir, True)
+brush_dir = os.path.join(gimp_dir, "brushes")
+os.makedirs(brush_dir)
+
+def add_brush(name, w, h, color=None):
+    # color, an RGB tuple, makes a color brush of that plain color
+    brushes[name] = (w, h, color)
+    encoded = name.encode() + b"\0"
+    header = struct.pack(">IIIII4sI", 28 + len(encoded), 2, w, h, 1, b"GIMP",
+                         25)
+    with open(os.path.join(brush_dir, name + ".gbr"), "wb") as f:
+        f.write(header + encoded + hex_mask(w, h))
+
+add_brush("hex blank", 36, 31)
+add_brush("1. Pixel", 1, 1)
+
+class Brush(Auto):
+    kind = "Brush"
+
+    def __init__(self, name, w, h, color=None):
+        self.name = name
+        self.w = w
+        self.h = h
+        self.color = color
+
+    @staticmethod
+    def get_by_name(name):
+        record("Brush.get_by_name")
+        if name not in brushes:
+            return None
+        return Brush(name, *brushes[name])
+
+    def get_info(self):
+        record("Brush.get_info")
+        return True, self.w, self.h, 1, 0
+
+    def get_pixels(self):
+        record("Brush.get_pixels")
+        if self.color is None:
+            return True, self.w, self.h, 1, hex_mask(self.w, self.h), 0, None
+        return (True, self.w, self.h, 1, hex_mask(self.w, self.h), 3,
+                bytes(self.color) * (self.w * self.h))
+
+    def get_name(self):
+        record("Brush.get_name")
+        return self.name
+
+def directory():
+    record("directory")
+    return gimp_dir
+
+def data_directory():
+    record("data_directory")
+    return os.path.join(gimp_dir, "data")
+
+def gimprc_query(token):
+    record("gimprc_query")
+    if token == "brush-path":
+        return "${gimp_dir}/brushes" + os.pathsep + "${gimp_data_dir}/brushes"
+    return None
+
+class Parasite:
+    def __init__(self, name, flags, data):
+        self.name = name
+        self.data = bytes(data)
+
+    @staticmethod
+    def new(name, flags, data):
+        record("Parasite.new")
+        return Parasite(name, flags, data)
+
+    def get_data(self):
+        return self.data
+
+class Rectangle:
+    def __init__(self, x, y, w, h):
+        self.x, self.y, self.width, self.height = x, y, w, h
+
+    @staticmethod
+    def new(x, y, w, h):
+        return Rectangle(x, y, w, h)
+
+def clip(layer, rect):
+    # Slices of the layer pixels and of rect where they overlap
+    x0, y0 = max(rect.x, 0), max(rect.y, 0)
+    x1 = min(rect.x + rect.width, layer.w)
+    y1 = min(rect.y + rect.height, layer.h)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return ((slice(y0, y1), slice(x0, x1)),
+            (slice(y0 - rect.y, y1 - rect.y), slice(x0 - rect.x, x1 - rect.x)))
+
+class Buffer:
+    def __init__(self, layer):
+        self.layer = layer
+
+    def get(self, rect, scale, pixel_format, abyss):
+        # Pixels out of the layer are transparent, the scale is not applied
+        record("Gegl.Buffer.get")
+        if not painting:
+            return bytes(rect.width * rect.height * 4)
+        pixels = np.zeros((rect.height, rect.width, 4), dtype=np.uint8)
+        slices = clip(self.layer, rect)
+        if slices is not None:
+            pixels[slices[1]] = self.layer.pixels()[slices[0]]
+        return pixels.tobytes()
+
+    def set(self, rect, pixel_format, data):
+        record("Gegl.Buffer.set")
+        written["bytes"] += rect.width * rect.height * 4
+        slices = clip(self.layer, rect)
+        if painting and slices is not None:
+            pixels = np.frombuffer(data, dtype=np.uint8)
+            pixels = pixels.reshape(rect.height, rect.width, 4)
+            self.layer.pixels()[slices[0]] = pixels[slices[1]]
+
+    def flush(self):
+        record("Gegl.Buffer.flush")
+
+class Layer(Auto):
+    kind = "Layer"
+
+    def __init__(self, img, name, w, h):
+        self.img = img
+        self.name = name
+        self.w = w
+        self.h = h
+        self.painted = None
+
+    @staticmethod
+    def new(img, name, w, h, image_type, opacity, mode):
+        record("Layer.new")
+        return Layer(img, name, w, h)
+
+    def pixels(self):
+        # RGBA pixels of the layer when painting, transparent until painted
+        if self.painted is None:
+            self.painted = np.zeros((self.h, self.w, 4), dtype=np.uint8)
+        return self.painted
+
+    def get_buffer(self):
+        record("Layer.get_buffer")
+        return Buffer(self)
+
+    def fill(self, fill_type):
+        record("Layer.fill")
+        written["bytes"] += self.w * self.h * 4
+
+    def edit_clear(self):
+        record("Layer.edit_clear")
+        written["bytes"] += self.w * self.h * 4
+        self.painted = None
+
+    def edit_fill(self, fill_type):
+        record("Layer.edit_fill")
+        written["bytes"] += self.w * self.h * 4
+
+    def get_width(self):
+        record("Layer.get_width")
+        return self.w
+
+    def get_height(self):
+        record("Layer.get_height")
+        return self.h
+
+    def get_name(self):
+        record("Layer.get_name")
+        return self.name
+
+    def resize_to_image_size(self):
+        record("Layer.resize_to_image_size")
+        old = self.painted
+        self.w, self.h = self.img.w, self.img.h
+        self.painted = None
+        if old is not None:
+            h, w = min(self.h, old.shape[0]), min(self.w, old.shape[1])
+            self.pixels()[:h, :w] = old[:h, :w]
+
+    def get_visible(self):
+        record("Layer.get_visible")
+        return True
+
+    def get_offsets(self):
+        record("Layer.get_offsets")
+        return True, 0, 0
+
+    def get_mask(self):
+        record("Layer.get_mask")
+        return None
+
+    @staticmethod
+    def new_from_visible(img, dest_img, name):
+        # When painting, the pixels of upper layers cover those below where
+        # they are not transparent, modes and opacities are not applied
+        record("Layer.new_from_visible")
+        visible = Layer(dest_img, name, img.w, img.h)
+        if painting:
+            for layer in reversed(img.layers):
+                pixels = layer.pixels()[:img.h, :img.w]
+                where = pixels[..., 3] != 0
+                visible.pixels()[:pixels.shape[0],
+                                 :pixels.shape[1]][where] = pixels[where]
+        return visible
+
+class TextLayer(Layer):
+    kind = "TextLayer"
+
+    @staticmethod
+    def new(img, text, font, size, unit):
+        record("TextLayer.new")
+        return TextLayer(img, text, 4 * len(text) + 2, int(size) + 2)
+
+class Image(Auto):
+    kind = "Image"
+
+    def __init__(self, w, h):
+        self.w = w
+        self.h = h
+        self.layers = []
+        self.parasites = {}
+
+    @staticmethod
+    def new(w, h, base_type):
+        record("Image.new")
+        return Image(w, h)
+
+    def insert_layer(self, layer, parent, position):
+        record("Image.insert_layer")
+        self.layers.insert(position, layer)
+
+    def remove_layer(self, layer):
+        record("Image.remove_layer")
+        self.layers.remove(layer)
+
+    def merge_down(self, layer, merge_type):
+        record("Image.merge_down")
+        self.layers.remove(layer)
+
+    def get_layer_by_name(self, name):
+        record("Image.get_layer_by_name")
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        return None
+
+    def get_layers(self):
+        record("Image.get_layers")
+        return list(self.layers)
+
+    def get_item_position(self, item):
+        record("Image.get_item_position")
+        return self.layers.index(item)
+
+    def get_width(self):
+        record("Image.get_width")
+        return self.w
+
+    def resize(self, w, h, offx, offy):
+        record("Image.resize")
+        self.w, self.h = w, h
+
+    def attach_parasite(self, parasite):
+        record("Image.attach_parasite")
+        self.parasites[parasite.name] = parasite
+
+    def get_parasite(self, name):
+        record("Image.get_parasite")
+        return self.parasites.get(name)
+
+    def get_height(self):
+        record("Image.get_height")
+        return self.h
+
+    def duplicate(self):
+        record("Image.duplicate")
+        return copy_image(self)
+
+    def merge_visible_layers(self, merge_type):
+        record("Image.merge_visible_layers")
+        self.layers = [Layer(self, "Merged", self.w, self.h)]
+        return self.layers[0]
+
+def copy_image(img):
+    copy = Image(img.w, img.h)
+    copy.layers = []
+    for layer in img.layers:
+        copy.layers.append(Layer(copy, layer.name, layer.w, layer.h))
+        if layer.painted is not None:
+            copy.layers[-1].painted = layer.painted.copy()
+    copy.parasites = dict(img.parasites)
+    return copy
+
+class File:
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def new_for_path(path):
+        return File(path)
+
+    def get_path(self):
+        return self.path
+
+def context_push():
+    record("context_push")
+    context_stack.append(dict(context))
+
+def context_pop():
+    record("context_pop")
+    context.update(context_stack.pop())
+
+def context_set_brush(brush):
+    record("context_set_brush")
+    context["brush"] = brush
+
+def pencil(layer, strokes):
+    # One point stamps the brush centered on it, in white or its colors,
+    # more points draw lines between them
+    record("pencil")
+    if not painting:
+        return
+    points = [(int(x), int(y)) for x, y in zip(strokes[0::2], strokes[1::2])]
+    if len(points) == 1:
+        stamp(layer, context["brush"], *points[0])
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        n = max(abs(x1 - x0), abs(y1 - y0))
+        for i in range(n + 1):
+            x = x0 + ((x1 - x0) * i * 2 + n) // (2 * n) if n else x0
+            y = y0 + ((y1 - y0) * i * 2 + n) // (2 * n) if n else y0
+            if 0 <= x < layer.w and 0 <= y < layer.h:
+                layer.pixels()[y, x] = line_rgba
+
+def stamp(layer, brush, x, y):
+    w, h = brush.w, brush.h
+    mask = np.frombuffer(hex_mask(w, h), dtype=np.uint8).reshape(h, w) != 0
+    rgba = np.full((h, w, 4), 255, dtype=np.uint8)
+    if brush.color is not None:
+        rgba[..., :3] = brush.color
+    slices = clip(layer, Rectangle(x - w // 2, y - h // 2, w, h))
+    if slices is not None:
+        pixels = layer.pixels()[slices[0]]
+        where = mask[slices[1]]
+        pixels[where] = rgba[slices[1]][where]
+
+# Images saved by file_save, by the number written to their file
+saved_images = []
+
+def file_save(run_mode, img, file, options):
+    # Keeps a copy of the image, and writes its number to the file
+    record("file_save")
+    saved_images.append(copy_image(img))
+    with open(file.get_path(), "w") as f:
+        f.write(str(len(saved_images) - 1))
+    return True
+
+def file_load(run_mode, file):
+    record("file_load")
+    with open(file.get_path()) as f:
+        return copy_image(saved_images[int(f.read())])
+
+def install():
+    # Registers the stand-in gi modules, to be done before importing the
+    # plugin, once
+    if getattr(sys.modules.get("gi"), "pdbrecorder", False):
+        return
+    gegl = auto_module("Gegl", "Gegl.", {"Rectangle": Rectangle})
+    gimp = auto_module("Gimp", "", {"Brush": Brush, "Layer": Layer,
+                                    "TextLayer": TextLayer, "Image": Image,
+                                    "Parasite": Parasite,
+                                    "directory": directory,
+                                    "data_directory": data_directory,
+                                    "gimprc_query": gimprc_query,
+                                    "file_save": file_save,
+                                    "context_push": context_push,
+                                    "context_pop": context_pop,
+                                    "context_set_brush": context_set_brush,
+                                    "pencil": pencil,
+                                    "file_load": file_load})
+    repository = types.ModuleType("gi.repository")
+    for name in ("GimpUi", "Gtk", "Gdk", "GLib", "Babl", "GObject"):
+        setattr(repository, name, auto_module(name, name + "."))
+    repository.Gio = auto_module("Gio", "Gio.", {"File": File})
+    repository.Gimp = gimp
+    repository.Gegl = gegl
+    gi = types.ModuleType("gi")
+    gi.require_version = lambda name, version: None
+    gi.pdbrecorder = True
+    gi.repository = repository
+    sys.modules["gi"] = gi
+    sys.modules["gi.repository"] = repository
@@ -0,0 +1,85 @@
+# NAME
+#       test_bench_hexmap, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       The benchmarks of bench_hexmap.py as checks, on square maps of 16, 256
+#       and 1000 rows and columns. The geometry is computed and timed, and
+#       the GIMP (PDB) calls of every drawing routine and map edit are
+#       counted and checked against call_budgets, the number they make now,
+#       so that a change making more of them fails. When a change makes
+#       fewer, lower the budget. Times and counts are kept as properties of
+#       the checks, see the --junitxml option of pytest. Counting the calls
+#       on the biggest maps takes minutes, it is only done with --slow.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import time
+
+import pytest
+
+import bench_hexmap, hexmap4gimp
+
+sizes = [16, 256, 1000]
+
+# PDB calls of each benchmark, on maps of each of sizes, with NumPy and two
+# worker processes in parallel mode. The biggest map is too big for the
+# template cache, so its cache hit makes it again.
+call_budgets = {
+    "draw (loop)": (268, 65548, 1000012),
+    "draw (tiled)": (76, 1036, 4012),
+    "draw_labels (cold cache)": (150, 1830, 7038),
+    "draw_labels": (33, 33, 33),
+    "draw_labels (merged)": (1540, 393220, 6000004),
+    "draw_large_grid": (19, 169, 635),
+    "draw (raster)": (69, 69, 69),
+    "brush size (cold cache)": (4, 4, 4),
+    "brush size (warm cache)": (0, 0, 0),
+    "brush size (get_info)": (2, 2, 2),
+    "create_hex_map": (89, 89, 89),
+    "create_hex_map (all)": (145, 295, 761),
+    "create_hex_map (cache miss)": (151, 301, 764),
+    "create_hex_map (cache hit)": (5, 5, 763),
+    "create_hex_map (parallel)": (97, 247, 749),
+    "extend_hex_map (+0, +2)": (106, 166, 352),
+    "extend_hex_map (+2, +2)": (149, 329, 887),
+    "regenerate_hex_map": (69, 219, 711),
+    "export_map_tiles": (86, 86, 86),
+    "fill_hex_map": (33, 273, 1056),
+}
+
+@pytest.mark.parametrize("size", sizes)
+@pytest.mark.parametrize("name", list(bench_hexmap.geometry_benchmarks))
+def test_geometry(name, size, record_property):
+    geom = bench_hexmap.geometry(size)
+    start = time.perf_counter()
+    result = bench_hexmap.geometry_benchmarks[name](geom)
+    record_property("seconds", time.perf_counter() - start)
+    if name == "hex centers" and hexmap4gimp.hexraster is not None:
+        assert [a.shape for a in result] == [(size, size)] * 2
+    elif name == "hex centers":
+        assert len(result) == size * size
+    elif name == "label layout" and result is not None:
+        # A column and a row number per hex
+        assert sum(len(tops) for tops, lefts in result.values()) == \
+            2 * size * size
+    elif name.startswith("large grid"):
+        assert result
+
+@pytest.mark.parametrize("size", [16, 256,
+                                  pytest.param(1000, marks=pytest.mark.slow)])
+def test_call_counts(size, monkeypatch, tmp_path, record_property):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(hexmap4gimp, "parallel_workers", 2)
+    counts = {}
+    for name, routine in bench_hexmap.drawing_routines(size).items():
+        counts[name] = bench_hexmap.count_calls(size, routine)[0]
+    for name, edit in bench_hexmap.map_edits(size, str(tmp_path)).items():
+        counts[name] = bench_hexmap.count_map_edit(size, edit)[0]
+    record_property("pdb_calls", counts)
+    assert counts.keys() == call_budgets.keys()
+    budgets = {name: budget[sizes.index(size)]
+               for name, budget in call_budgets.items()}
+    over = {name: (n, budgets[name]) for name, n in counts.items()
+            if n > budgets[name]}
+    assert not over, "calls made, and budget: " + repr(over)
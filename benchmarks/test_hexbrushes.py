@@ -0,0 +1,164 @@
+# NAME
+#       test_hexbrushes, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the brush cache: the headers and masks of the GIMP brush
+#       file versions, broken and missing brush files, and the cached sizes
+#       read again when their file changes.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import json, os, struct
+
+import pytest
+
+import hexbrushes
+from pdbrecorder import hex_mask
+
+def gbr_bytes(name, w, h, version=2, depth=1, pixels=None):
+    # A GIMP brush file, of version 1 without the magic and spacing fields
+    encoded = name.encode() + b"\0"
+    if version == 1:
+        header = struct.pack(">IIIII", 20 + len(encoded), 1, w, h, depth)
+    else:
+        header = struct.pack(">IIIII4sI", 28 + len(encoded), version, w, h,
+                             depth, b"GIMP", 10)
+    if pixels is None:
+        pixels = bytes(range(256)) * (w * h * depth // 256 + 1)
+    return header + encoded + pixels[:w * h * depth]
+
+def write_gbr(folder, file_name, *args, **kwargs):
+    path = os.path.join(str(folder), file_name)
+    with open(path, "wb") as f:
+        f.write(gbr_bytes(*args, **kwargs))
+    return path
+
+@pytest.mark.parametrize("version", [1, 2, 3])
+@pytest.mark.parametrize("depth", [1, 4])
+@pytest.mark.parametrize("name", ["hex ünï", "b", ""])
+def test_header_and_mask(tmp_path, version, depth, name):
+    # Short names end version 1 headers before the magic of version 2
+    pixels = bytes(range(7, 250)) * 2
+    path = write_gbr(tmp_path, "b.gbr", name, 9, 5, version, depth, pixels)
+    assert hexbrushes.read_gbr_header(path) == (name, 9, 5)
+    assert hexbrushes.read_gbr_mask(path) == (9, 5, depth,
+                                              pixels[:9 * 5 * depth])
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"GIMP" * 4,
+    gbr_bytes("b", 4, 3)[:19],
+    gbr_bytes("b", 4, 3).replace(b"GIMP", b"PMIG"),
+    gbr_bytes("b", 4, 3, version=4),
+    struct.pack(">IIIII4sI", 27, 2, 4, 3, 1, b"GIMP", 10),
+    struct.pack(">IIIII4sI", 10**6, 2, 4, 3, 1, b"GIMP", 10),
+])
+def test_not_a_brush(tmp_path, data):
+    path = tmp_path / "b.gbr"
+    path.write_bytes(data)
+    assert hexbrushes.read_gbr_header(str(path)) is None
+    assert hexbrushes.read_gbr_mask(str(path)) is None
+
+@pytest.mark.parametrize("depth", [2, 3])
+def test_unknown_depth(tmp_path, depth):
+    path = write_gbr(tmp_path, "b.gbr", "b", 4, 3, depth=depth)
+    assert hexbrushes.read_gbr_header(path) == ("b", 4, 3)
+    assert hexbrushes.read_gbr_mask(path) is None
+
+def test_truncated_pixels(tmp_path):
+    path = tmp_path / "b.gbr"
+    path.write_bytes(gbr_bytes("b", 4, 3, depth=4)[:-1])
+    assert hexbrushes.read_gbr_header(str(path)) == ("b", 4, 3)
+    assert hexbrushes.read_gbr_mask(str(path)) is None
+
+def brush_cache(tmp_path, *folders):
+    scans = []
+
+    def brush_dirs():
+        scans.append(1)
+        return [str(folder) for folder in folders]
+
+    return hexbrushes.BrushCache(str(tmp_path / "brushes.json"),
+                                 brush_dirs), scans
+
+def touch(path, seconds):
+    # Sets the modification time of path, seconds after an earlier one
+    mtime = os.stat(path).st_mtime_ns + seconds * 10**9
+    os.utime(path, ns=(mtime, mtime))
+
+def test_changed_brush_read_again(tmp_path):
+    folder = tmp_path / "brushes"
+    folder.mkdir()
+    path = write_gbr(folder, "a.gbr", "hex a", 36, 31)
+    write_gbr(folder, "b.gbr", "hex b", 38, 33, version=1)
+    cache, scans = brush_cache(tmp_path, folder)
+    assert cache.lookup("hex a") == (36, 31)
+    assert cache.lookup("hex b") == (38, 33)
+    assert len(scans) == 1
+    # A new cache reads the sizes from its file, without scanning
+    cache, scans = brush_cache(tmp_path, folder)
+    assert cache.lookup("hex a") == (36, 31) and not scans
+    # The file changes, and with it the size of its brush
+    write_gbr(folder, "a.gbr", "hex a", 20, 17)
+    touch(path, 5)
+    cache, scans = brush_cache(tmp_path, folder)
+    assert cache.lookup("hex a") == (20, 17)
+    assert cache.lookup("hex b") == (38, 33)
+    assert len(scans) == 1
+    cached = json.loads((tmp_path / "brushes.json").read_text())
+    assert cached["brushes"]["hex a"]["mtime"] == os.stat(path).st_mtime_ns
+
+def test_layout_read_again(tmp_path):
+    folder = tmp_path / "brushes"
+    folder.mkdir()
+    path = write_gbr(folder, "a.gbr", "hex a", 36, 31,
+                     pixels=hex_mask(36, 31))
+    cache, scans = brush_cache(tmp_path, folder)
+    layout = cache.layout("hex a")
+    assert layout is not None
+    assert cache.identity("hex a") == {"name": "hex a", "path": path,
+                                       "mtime": os.stat(path).st_mtime_ns}
+    write_gbr(folder, "a.gbr", "hex a", 20, 17, pixels=hex_mask(20, 17))
+    touch(path, 5)
+    cache, scans = brush_cache(tmp_path, folder)
+    assert cache.layout("hex a") != layout
+    assert cache.identity("hex a")["mtime"] == os.stat(path).st_mtime_ns
+
+def test_missing_and_removed_brushes(tmp_path):
+    folder = tmp_path / "brushes"
+    folder.mkdir()
+    path = write_gbr(folder, "a.gbr", "hex a", 36, 31)
+    (folder / "broken.gbr").write_bytes(b"not a brush")
+    cache, scans = brush_cache(tmp_path, folder, tmp_path / "missing")
+    assert cache.lookup("hex a") == (36, 31)
+    assert cache.lookup("hex x") is None
+    assert cache.layout("hex x") is None and cache.identity("hex x") is None
+    assert len(scans) == 1
+    os.remove(path)
+    cache, scans = brush_cache(tmp_path, folder)
+    assert cache.lookup("hex a") is None
+    assert "hex a" not in cache.brushes
+
+def test_first_folder_wins(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    write_gbr(second, "a.gbr", "hex a", 38, 33)
+    write_gbr(first, "z.gbr", "hex a", 36, 31)
+    cache, scans = brush_cache(tmp_path, first, second)
+    assert cache.lookup("hex a") == (36, 31)
+
+@pytest.mark.parametrize("content", ["", "{", "[]",
+                                     json.dumps({"version": 1,
+                                                 "brushes": {}})])
+def test_unreadable_cache_file(tmp_path, content):
+    folder = tmp_path / "brushes"
+    folder.mkdir()
+    write_gbr(folder, "a.gbr", "hex a", 36, 31)
+    (tmp_path / "brushes.json").write_text(content)
+    cache, scans = brush_cache(tmp_path, folder)
+    assert cache.brushes == {}
+    assert cache.lookup("hex a") == (36, 31)
+    cached = json.loads((tmp_path / "brushes.json").read_text())
+    assert cached["version"] == hexbrushes.cache_version
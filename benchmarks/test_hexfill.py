@@ -0,0 +1,101 @@
+# NAME
+#       test_hexfill, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the reading of hex fill files, JSON lists read in chunks
+#       as small as a character included.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import json
+
+import pytest
+
+import hexfill
+
+# Records with values of several characters, and spaces around them
+fill_records = [(12, 3, "hex forest"), (0, 0, "hex hills"),
+                (123, 45, "hex [marsh], 2"), (7, 1234, "hex forest")]
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def json_text(records, as_lists=False):
+    if as_lists:
+        items = [list(record) for record in records]
+    else:
+        items = [{"brush": brush, "row": row, "col": col}
+                 for col, row, brush in records]
+    return " [\n " + " ,\n  ".join(json.dumps(item) for item in items) + \
+        "\n ] \n"
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 5, 7, 64 * 1024])
+@pytest.mark.parametrize("as_lists", [False, True])
+def test_json_split_across_chunks(tmp_path, monkeypatch, chunk, as_lists):
+    monkeypatch.setattr(hexfill, "json_chunk", chunk)
+    path = write(tmp_path, "fill.json", json_text(fill_records, as_lists))
+    assert list(hexfill.records(path)) == fill_records
+
+@pytest.mark.parametrize("chunk", [1, 4, 64 * 1024])
+def test_json_empty_list(tmp_path, monkeypatch, chunk):
+    monkeypatch.setattr(hexfill, "json_chunk", chunk)
+    assert list(hexfill.records(write(tmp_path, "fill.json", " [ ] "))) == []
+
+@pytest.mark.parametrize("text", [
+    '{"col": 1, "row": 2, "brush": "b"}',
+    '[[1, 2, "b"] [3, 4, "c"]]',
+    '[[1, 2, "b"], [3, 4, "c"',
+    '[[1, 2, "b"], ]',
+    '[[1, 2]]',
+    '[{"col": "x", "row": 2, "brush": "b"}]',
+    '',
+])
+@pytest.mark.parametrize("chunk", [1, 3, 64 * 1024])
+def test_json_invalid(tmp_path, monkeypatch, text, chunk):
+    monkeypatch.setattr(hexfill, "json_chunk", chunk)
+    with pytest.raises(ValueError):
+        list(hexfill.records(write(tmp_path, "fill.json", text)))
+
+def test_jsonl(tmp_path):
+    lines = [json.dumps(list(record)) for record in fill_records[:2]]
+    lines.insert(1, "")
+    lines.append(json.dumps(dict(zip(("col", "row", "brush"),
+                                     fill_records[2]))))
+    path = write(tmp_path, "fill.jsonl", "\n".join(lines) + "\n")
+    assert list(hexfill.records(path)) == fill_records[:3]
+
+@pytest.mark.parametrize("text", [
+    "col,row,brush\n12,3,hex forest\n0,0,hex hills\n",
+    "Brush, Row ,COL,note\nhex forest,3,12,x\nhex hills,0,0,\n",
+    "# comment\n\n12,3,hex forest\n 0 , 0 , hex hills \n",
+])
+def test_csv(tmp_path, text):
+    path = write(tmp_path, "fill.csv", text)
+    assert list(hexfill.records(path)) == fill_records[:2]
+
+@pytest.mark.parametrize("text, line", [
+    ("col,row,brush\n1,2,b\n3,c,b\n", 3),
+    ("col,row,brush\n1,2\n", 2),
+    ("brush,col\nb,1\n", 1),
+])
+def test_csv_invalid(tmp_path, text, line):
+    path = write(tmp_path, "fill.csv", text)
+    with pytest.raises(ValueError, match=f"fill.csv:{line}:"):
+        list(hexfill.records(path))
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        list(hexfill.records(write(tmp_path, "fill.txt", "1,2,b\n")))
+
+def test_read_fill_groups_and_skips(tmp_path):
+    path = write(tmp_path, "fill.csv",
+                 "col,row,brush\n1,2,b\n-1,0,a\n0,0,a\n3,1,b\n4,0,a\n"
+                 "0,3,a\n")
+    groups, skipped = hexfill.read_fill(path, 3, 4)
+    assert list(groups) == ["b", "a"]
+    assert groups["b"].tolist() == [1, 2, 3, 1]
+    assert groups["a"].tolist() == [0, 0]
+    assert skipped == 3
@@ -0,0 +1,157 @@
+# NAME
+#       test_hexgeometry, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the hex grid geometry, which needs neither GIMP nor NumPy.
+#       With NumPy installed, its array code is checked against the code
+#       computing one hex at a time.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import pytest
+
+import hexgeometry
+from hexgeometry import HexGeometry, mask_layout
+
+# Sizes of blank hex brushes, the default one first
+brush_sizes = [(36, 31), (38, 33), (20, 17), (144, 125)]
+
+def lgrid_geometry(size, scale, levels, ccol=7, crow=5):
+    geom = HexGeometry(*size)
+    geom.set_dims(20, 20)
+    geom.lgrid_setup(scale, ccol, crow, levels)
+    return geom
+
+def level_vertices(geom, scale, cols, rows):
+    return {vertex for c in range(-cols, cols) for r in range(-rows, rows)
+            for vertex in geom.lgrid_hex_vertices(c, r, scale)}
+
+@pytest.mark.parametrize("size", brush_sizes)
+@pytest.mark.parametrize("scale", range(2, 11))
+@pytest.mark.parametrize("levels", [2, 3])
+@pytest.mark.parametrize("center", [(7, 5), (8, 4)])
+def test_lgrid_levels_share_vertices(size, scale, levels, center):
+    # Every vertex of a nested level is a vertex of the level below
+    if scale ** levels > 300:
+        pytest.skip("large hexes bigger than any map")
+    geom = lgrid_geometry(size, scale, levels, *center)
+    scales = geom.lgrid_scales()
+    for inner, outer in zip(scales, scales[1:]):
+        # The hexes of the level below around the outer ones checked
+        reach = 3 * outer // inner + 3
+        below = level_vertices(geom, inner, reach, reach)
+        for c in range(-2, 3):
+            for r in range(-2, 3):
+                for vertex in geom.lgrid_hex_vertices(c, r, outer):
+                    assert vertex in below, (outer, c, r, vertex)
+
+@pytest.mark.parametrize("size", brush_sizes)
+@pytest.mark.parametrize("scale", range(2, 11))
+@pytest.mark.parametrize("levels", [1, 2, 3])
+def test_lgrid_hexes_tile(size, scale, levels):
+    # Neighbouring large hexes share their vertices, and the left and right
+    # ones lie between the top and bottom sides
+    geom = lgrid_geometry(size, scale, levels)
+    for outer in geom.lgrid_scales():
+        for c in range(-3, 4):
+            for r in range(-3, 4):
+                v = geom.lgrid_hex_vertices(c, r, outer)
+                lower_right = geom.lgrid_hex_vertices(c + 1, r + c % 2, outer)
+                assert v[2] == lower_right[0] and v[3] == lower_right[5]
+                assert geom.lgrid_hex_vertices(c, r + 1, outer)[0] == v[4]
+                assert v[0][1] < v[2][1] < v[3][1]
+                assert v[0][1] < v[5][1] < v[3][1]
+
+def soft_hex_mask(w, h, samples=4):
+    # Mask of a flat top hex filling a w x h box, with anti-aliased edges:
+    # each pixel is as opaque as the part of it the hex covers
+    mask = bytearray()
+    for y in range(h):
+        for x in range(w):
+            inside = 0
+            for j in range(samples):
+                for i in range(samples):
+                    px = abs(x + (i + 0.5) / samples - w / 2)
+                    py = abs(y + (j + 0.5) / samples - h / 2)
+                    inside += py <= h / 2 and px <= w / 2 - py * w / (2 * h)
+            mask.append(255 * inside // samples ** 2)
+    return bytes(mask)
+
+@pytest.mark.parametrize("size", brush_sizes)
+def test_soft_brush_layout(size):
+    # Soft edges are rounded to whole pixels, as if the brush were hard
+    w, h = size
+    soft = soft_hex_mask(w, h)
+    hard = bytes(255 if value >= 128 else 0 for value in soft)
+    assert any(0 < value < 255 for value in soft)
+    assert mask_layout(w, h, soft) == mask_layout(w, h, hard)
+
+@pytest.mark.parametrize("size", [(10, 10), (20, 20), (36, 31)])
+def test_square_brush_rejected(size):
+    w, h = size
+    with pytest.raises(ValueError, match="not a hex"):
+        mask_layout(w, h, b"\xff" * (w * h))
+
+def segments(polylines):
+    return {frozenset((tuple(p), tuple(q)))
+            for points in polylines for p, q in zip(points, points[1:])
+            if p != q}
+
+def touching_sides(geom, bounds, rect=None):
+    # Sides of the large hexes of every level reaching into bounds, (x0, y0,
+    # x1, y1) inclusive, when drawn one by one
+    x0, y0, x1, y1 = bounds
+    sides = set()
+    for scale in geom.lgrid_scales():
+        col_min, col_max = geom.lgrid_col_range(rect, scale)
+        row_min, row_max = geom.lgrid_row_range(rect, scale)
+        for c in range(col_min - 2, col_max + 2):
+            for r in range(row_min - 2, row_max + 2):
+                v = geom.lgrid_hex_vertices(c, r, scale)
+                for p, q in zip(v, v[1:] + v[:1]):
+                    if (max(p[0], q[0]) >= x0 and min(p[0], q[0]) <= x1 and
+                            max(p[1], q[1]) >= y0 and min(p[1], q[1]) <= y1):
+                        sides.add(frozenset((p, q)))
+    return sides
+
+@pytest.mark.parametrize("size", brush_sizes[:3])
+@pytest.mark.parametrize("scale, levels, ccol, crow", [
+    (4, 1, 8, 8), (5, 1, 3, 20), (2, 1, 0, 19), (3, 2, 7, 5), (2, 3, 10, 3)])
+@pytest.mark.parametrize("rect", [None, (100, 50, 120, 90)])
+def test_lgrid_polylines_draw_every_side(size, scale, levels, ccol, crow,
+                                         rect):
+    # The polylines go along every side with pixels in rect, or the image,
+    # that drawing the large hexes one by one would draw, and at most along
+    # sides ending one pixel away
+    geom = lgrid_geometry(size, scale, levels, ccol, crow)
+    x, y, w, h = rect or (0, 0, geom.img_w, geom.img_h)
+    drawn = segments(geom.lgrid_polylines(rect))
+    assert touching_sides(geom, (x, y, x + w - 1, y + h - 1), rect) <= drawn
+    assert drawn <= touching_sides(geom, geom.clip_bounds(rect), rect)
+
+def polyline_points(polylines):
+    return [[tuple(point) for point in points] for points in polylines]
+
+@pytest.mark.parametrize("size", brush_sizes[:3])
+@pytest.mark.parametrize("rect", [None, (100, 50, 120, 90)])
+def test_array_paths_match_scalar(size, rect, monkeypatch):
+    # Centers and polylines are the same with and without NumPy
+    if hexgeometry.np is None:
+        pytest.skip("needs NumPy")
+    geom = lgrid_geometry(size, 3, 2)
+    hexes = [(c, r) for c in range(-1, 21) for r in (7, -1, 3)]
+    computed = [geom.hex_center_list(-1, 21, -1, 20),
+                geom.hex_centers_of(hexes),
+                polyline_points(geom.lgrid_polylines(rect))]
+    for scale in geom.lgrid_scales():
+        vertices = geom.lgrid_vertices(-3, 4, -2, 5, scale)
+        for r in range(-2, 5):
+            for c in range(-3, 4):
+                assert (vertices[r + 2, c + 3].tolist() ==
+                        [list(v) for v in geom.lgrid_hex_vertices(c, r,
+                                                                  scale)])
+    monkeypatch.setattr(hexgeometry, "np", None)
+    assert computed == [geom.hex_center_list(-1, 21, -1, 20),
+                        geom.hex_centers_of(hexes),
+                        polyline_points(geom.lgrid_polylines(rect))]
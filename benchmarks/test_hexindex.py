@@ -0,0 +1,68 @@
+# NAME
+#       test_hexindex, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the hex index: the pixel to hex lookup against the blank
+#       hexes stamped on the grid, and the .npy files, written without NumPy,
+#       as NumPy reads them.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import pytest
+
+from hexgeometry import HexGeometry, mask_rows
+from hexindex import HexIndex, index_paths, write_index
+from pdbrecorder import hex_mask
+
+# Sizes of blank hex brushes, the default one first
+brush_sizes = [(36, 31), (38, 33), (20, 17), (144, 125)]
+
+def index_spec(rows, cols, **spec):
+    return dict({"rows": rows, "cols": cols, "numbering": True, "x0": 1,
+                 "x1": cols - 2, "y0": 0, "y1": rows - 1, "ix": 7, "iy": 1,
+                 "separator": "."}, **spec)
+
+@pytest.mark.parametrize("size", brush_sizes)
+def test_stamped_pixels_map_to_their_hex(size):
+    # Every pixel of the blank hex stamped on a hex is found in that hex,
+    # and those of the hexes around the map in none
+    w, h = size
+    geom = HexGeometry(w, h)
+    geom.set_dims(4, 5)
+    rows = mask_rows(w, h, hex_mask(w, h))
+    for c in range(-1, geom.cols + 1):
+        for r in range(-1, geom.rows + 1):
+            inside = 0 <= c < geom.cols and 0 <= r < geom.rows
+            left, top = geom.stamp_origin(c, r)
+            for j, bits in enumerate(rows):
+                for i in range(w):
+                    if bits >> i & 1:
+                        found = geom.hex_at(left + i, top + j)
+                        assert found == ((c, r) if inside else None), \
+                            (c, r, i, j)
+
+@pytest.mark.parametrize("size", brush_sizes[:3])
+@pytest.mark.parametrize("spec", [index_spec(5, 6), index_spec(7, 3),
+                                  index_spec(4, 4, numbering=False),
+                                  index_spec(3, 12, x0=-2, ix=95,
+                                             separator="")])
+def test_index_files_read_by_numpy(size, spec, tmp_path):
+    np = pytest.importorskip("numpy")
+    geom = HexGeometry(*size)
+    geom.set_dims(spec["rows"], spec["cols"])
+    path = str(tmp_path / "map-index.json")
+    write_index(path, geom, spec)
+    records_path, labels_path = index_paths(path)
+    records = np.load(records_path, mmap_mode="r")
+    labels = np.load(labels_path)
+    assert records.shape == (spec["rows"], spec["cols"], 6)
+    assert labels.shape == (spec["rows"], spec["cols"])
+    index = HexIndex(path)
+    for r in range(spec["rows"]):
+        for c in range(spec["cols"]):
+            assert records[r, c].tolist() == list(index.record(c, r).values())
+            assert labels[r, c].decode() == index.label(c, r)
+            x, y = index.record(c, r)["x"], index.record(c, r)["y"]
+            assert index.hex_at(x, y) == (c, r)
+    assert any(labels.ravel()) == spec["numbering"]
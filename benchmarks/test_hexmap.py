@@ -0,0 +1,337 @@
+# NAME
+#       test_hexmap, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the plugin run against the GIMP stand-in of pdbrecorder.py.
+#       Those comparing the pixels drawn in different ways paint the layers
+#       of the stand-in, and need NumPy.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import json, os
+from array import array
+
+import pytest
+
+import hexmap4gimp, pdbrecorder
+
+@pytest.mark.parametrize("spec", [
+    {"draw_mode": "rastr"},
+    {"rows": 0},
+    {"cols": -2},
+    {"rows": "16"},
+    {"lgrid_scale": 1},
+    {"lgrid_scale": 11},
+    {"lgrid_levels": 4},
+    {"tile_cols": -1},
+    {"colums": 16},
+])
+def test_bad_spec_rejected(spec):
+    with pytest.raises(ValueError):
+        hexmap4gimp.complete_spec(spec)
+
+def test_spec_completed():
+    spec = hexmap4gimp.complete_spec({"rows": 1200, "cols": 9})
+    assert (spec["x1"], spec["y1"]) == (8, 1199)
+    assert (spec["lgrid_ccol"], spec["lgrid_crow"]) == (4, 600)
+
+def test_failed_map_deleted(monkeypatch):
+    # A map whose drawing fails is not left open
+    images = []
+    new_image = pdbrecorder.Image.new
+
+    def recorded_image(*args):
+        images.append(new_image(*args))
+        return images[-1]
+
+    def failing_draw(self, img, mode):
+        raise OSError("no space left")
+
+    monkeypatch.setattr(pdbrecorder.Image, "new", recorded_image)
+    monkeypatch.setattr(hexmap4gimp.HexGrid, "draw", failing_draw)
+    deleted = []
+    monkeypatch.setattr(pdbrecorder.Image, "delete",
+                        lambda img: deleted.append(img), raising=False)
+    with pytest.raises(OSError):
+        hexmap4gimp.create_hex_map(hexmap4gimp.complete_spec({}))
+    assert deleted == images
+
+def test_undo_group_closed_on_error(monkeypatch, tmp_path):
+    img = hexmap4gimp.create_hex_map(hexmap4gimp.complete_spec({}))
+    fill = tmp_path / "fill.csv"
+    fill.write_text("col,row,brush\n0,0,hex blank\n")
+
+    def failing_fill(self, layer, brushes, groups):
+        raise hexmap4gimp.hexprogress.Cancelled()
+
+    monkeypatch.setattr(hexmap4gimp.HexGrid, "fill_hexes", failing_fill)
+    pdbrecorder.reset()
+    with pytest.raises(hexmap4gimp.hexprogress.Cancelled):
+        hexmap4gimp.fill_hex_map(img, str(fill))
+    assert pdbrecorder.calls["Image.undo_group_start"] == 1
+    assert pdbrecorder.calls["Image.undo_group_end"] == 1
+
+def test_profile_reports_caches(tmp_path):
+    pytest.importorskip("numpy")
+    hexmap4gimp.create_hex_map(hexmap4gimp.complete_spec({"numbering": True}))
+    path = tmp_path / "profile.jsonl"
+    hexmap4gimp.report_profile(str(path), procedure="test")
+    stats = json.loads(path.read_text())["caches"]["label_cache"]
+    assert stats["hits"] + stats["misses"] > 0
+    assert stats["sprites"] > 0
+
+@pytest.fixture
+def painting(monkeypatch):
+    # Layers keep their pixels, and labels are drawn from made up sprites
+    np = pytest.importorskip("numpy")
+
+    def label_sprites(self, img, tokens):
+        return {token: np.random.default_rng(list(token.encode())).integers(
+                    0, 256, (9, 4 * len(token) + 2, 4), dtype=np.uint8)
+                for token in tokens}
+
+    monkeypatch.setattr(pdbrecorder, "painting", True)
+    monkeypatch.setattr(hexmap4gimp.HexGrid, "label_sprites", label_sprites)
+    return np
+
+def hex_grid(rows, cols, halo=False):
+    brush = pdbrecorder.Brush.get_by_name("hex blank")
+    hexgrid = hexmap4gimp.HexGrid(brush)
+    w, h = hexgrid.set_dims(rows, cols)
+    hexgrid.set_halo(halo, halo, halo, halo)
+    hexmap4gimp.Gimp.context_set_brush(brush)
+    return hexgrid, w, h
+
+def layer_pixels(img):
+    return {layer.name: layer.pixels() for layer in img.get_layers()}
+
+@pytest.mark.parametrize("rows, cols", [(1, 1), (2, 3), (5, 7), (16, 16),
+                                        (9, 10)])
+@pytest.mark.parametrize("halo", [False, True])
+def test_tiled_matches_loop(painting, rows, cols, halo):
+    # Copying the stamped period paints what stamping every hex paints
+    hexgrid, w, h = hex_grid(rows, cols, halo)
+    tiled = pdbrecorder.Layer(None, "Terrain", w, h)
+    looped = pdbrecorder.Layer(None, "Terrain", w, h)
+    hexgrid.stamp_tiled(tiled)
+    hexgrid.stamp_loop(looped)
+    assert painting.array_equal(tiled.pixels(), looped.pixels())
+
+@pytest.mark.parametrize("rows, cols", [(1, 1), (5, 7), (9, 10)])
+@pytest.mark.parametrize("halo", [False, True])
+def test_raster_matches_stamps(painting, rows, cols, halo):
+    hexgrid, w, h = hex_grid(rows, cols, halo)
+    terrain = pdbrecorder.Layer(None, "Terrain", w, h)
+    grid = pdbrecorder.Layer(None, "Grid", w, h)
+    looped = pdbrecorder.Layer(None, "Terrain", w, h)
+    hexgrid.draw_raster(terrain, grid)
+    hexgrid.stamp_loop(looped)
+    assert painting.array_equal(terrain.pixels(), looped.pixels())
+    # The grid fills what select_color + invert would select
+    blank = (looped.pixels() == 255).all(axis=-1)
+    assert (grid.pixels()[..., 3] != 0).tolist() == (~blank).tolist()
+
+def map_spec(**spec):
+    return hexmap4gimp.complete_spec(dict(
+        {"rows": 6, "cols": 7, "numbering": True, "large_grid": True,
+         "lgrid_scale": 3, "lgrid_levels": 2, "separator": ".",
+         "draw_mode": "raster"}, **spec))
+
+@pytest.mark.parametrize("rows, cols, add_rows, add_cols", [
+    (6, 7, 0, 2), (6, 7, 3, 0), (6, 8, 2, 3), (5, 4, 4, 5)])
+def test_extended_map_matches_new_one(painting, rows, cols, add_rows,
+                                      add_cols):
+    img = hexmap4gimp.create_hex_map(map_spec(rows=rows, cols=cols))
+    hexmap4gimp.extend_hex_map(img, add_rows, add_cols)
+    spec, grid = hexmap4gimp.image_spec(img)
+    new = hexmap4gimp.create_hex_map(spec)
+    extended, created = layer_pixels(img), layer_pixels(new)
+    assert extended.keys() == created.keys()
+    for name in created:
+        assert painting.array_equal(extended[name], created[name]), name
+
+@pytest.mark.parametrize("rows, cols, bands", [(7, 9, 1), (20, 13, 4)])
+def test_parallel_matches_raster(painting, monkeypatch, rows, cols, bands):
+    monkeypatch.setattr(hexmap4gimp, "parallel_workers", 2)
+    monkeypatch.setattr(hexmap4gimp, "parallel_bands_per_worker", bands)
+    raster = layer_pixels(hexmap4gimp.create_hex_map(
+        map_spec(rows=rows, cols=cols)))
+    parallel = layer_pixels(hexmap4gimp.create_hex_map(
+        map_spec(rows=rows, cols=cols, draw_mode="parallel")))
+    for name in raster:
+        assert painting.array_equal(parallel[name], raster[name]), name
+
+class Procedure:
+    def new_return_values(self, status, error):
+        return status
+
+@pytest.mark.parametrize("ok", [False, True])
+def test_procedure_dialog(monkeypatch, ok):
+    # A cancelled dialog stops the procedure, and the dialog is closed
+    closed = []
+
+    class Dialog:
+        def fill(self, names):
+            pass
+
+        def run(self):
+            return ok
+
+        def destroy(self):
+            closed.append(self)
+
+    monkeypatch.setattr(hexmap4gimp.GimpUi.ProcedureDialog, "new",
+                        lambda procedure, config, title: Dialog(),
+                        raising=False)
+    cancelled = hexmap4gimp.procedure_dialog(
+        Procedure(), hexmap4gimp.Gimp.RunMode.INTERACTIVE, None, "Title")
+    assert cancelled == (None if ok else
+                         hexmap4gimp.Gimp.PDBStatusType.CANCEL)
+    assert len(closed) == 1
+    assert hexmap4gimp.procedure_dialog(
+        Procedure(), hexmap4gimp.Gimp.RunMode.NONINTERACTIVE, None,
+        "Title") is None
+    assert len(closed) == 1
+
+@pytest.mark.parametrize("hexes", [[(0, 0)], [(3, 2), (4, 4), (3, 2)],
+                                   [(6, 5), (0, 5)]])
+def test_fill_matches_pencil(painting, monkeypatch, hexes):
+    # Color brushes composited on a few hexes paint what the pencil paints,
+    # reading and writing only the part of the layer the brushes cover
+    pdbrecorder.add_brush("hex test forest", 36, 31, (40, 120, 40))
+    pdbrecorder.add_brush("hex test hills", 38, 33, (150, 120, 60))
+    names = ["hex test forest", "hex test hills"]
+    brushes = {name: pdbrecorder.Brush.get_by_name(name) for name in names}
+    groups = {name: array("i", [v for pair in hexes[i::2] for v in pair])
+              for i, name in enumerate(names)}
+    hexgrid, w, h = hex_grid(6, 7)
+    filled = pdbrecorder.Layer(None, "Terrain", w, h)
+    pdbrecorder.reset()
+    hexgrid.fill_hexes(filled, brushes, groups)
+    assert pdbrecorder.bytes_written() < w * h * 4 // 4
+    monkeypatch.setattr(hexmap4gimp, "hexraster", None)
+    stamped = pdbrecorder.Layer(None, "Terrain", w, h)
+    hexgrid.fill_hexes(stamped, brushes, groups)
+    assert filled.pixels().any()
+    assert painting.array_equal(filled.pixels(), stamped.pixels())
+
+def tile_files(directory):
+    files = {}
+    for folder, dirs, names in os.walk(directory):
+        for name in names:
+            if name != "tiles.json":
+                path = os.path.join(folder, name)
+                files[os.path.relpath(path, directory)] = \
+                    open(path, "rb").read()
+    return files
+
+@pytest.mark.parametrize("numbering", [False, True])
+def test_tiles_from_same_source_match(painting, monkeypatch, tmp_path,
+                                      numbering):
+    # Linking tiles read from the same layer pixels writes what blending
+    # every tile writes, blending fewer tiles on a repeating grid
+    img = hexmap4gimp.create_hex_map(map_spec(rows=9, cols=10,
+                                              numbering=numbering))
+    pdbrecorder.reset()
+    linked = hexmap4gimp.export_map_tiles(img, str(tmp_path / "linked"), 64)
+    blended = pdbrecorder.calls["Layer.new_from_visible"]
+    monkeypatch.setattr(hexmap4gimp.hextiles.TileWriter, "reuse",
+                        lambda writer, z, x, y, source: False)
+    pdbrecorder.reset()
+    each = hexmap4gimp.export_map_tiles(img, str(tmp_path / "each"), 64)
+    files = tile_files(tmp_path / "linked")
+    assert files and files == tile_files(tmp_path / "each")
+    assert linked == each
+    assert blended < pdbrecorder.calls["Layer.new_from_visible"]
+
+@pytest.mark.parametrize("output", [
+    "map-{}.png", "map-{0}.png", "map-{colums}.png", "map-{rows.x}.png",
+    "map-{rows[0]}.png", "map-{rows:q}.png", "map-{index.png", "map-}.png",
+    5])
+def test_bad_output_rejected(output):
+    with pytest.raises(ValueError, match="Hex map 2 of 2"):
+        hexmap4gimp.batch_specs({}, [{}, {"output": output}])
+
+def test_batch_specs():
+    batch = hexmap4gimp.batch_specs(
+        {"rows": 4}, [{"output": "m-{index:02d}-{rows}x{cols}-{brush}.png"},
+                      {"cols": 5, "output": "m{index}.svg"}, {}])
+    assert [output for spec, output in batch] == \
+        ["m-00-4x16-hex blank.png", "m1.svg", ""]
+    assert [spec["cols"] for spec, output in batch] == [16, 5, 16]
+    for entries, write_index in [([{"rows": 0}], False),
+                                 ([{"brush": "hex none"}], False),
+                                 ([{"output": "m.png"}, {}], True)]:
+        with pytest.raises(ValueError):
+            hexmap4gimp.batch_specs({}, entries, write_index)
+
+class Config:
+    def __init__(self, **properties):
+        self.properties = properties
+
+    def get_property(self, name):
+        return self.properties.get(name, -1)
+
+def batch_config(specs, **properties):
+    # The arguments of the batch procedure, the default settings and specs
+    properties = dict({key.replace("_", "-"): value
+                       for key, value in hexmap4gimp.default_spec.items()
+                       if value is not None},
+                      **properties)
+    return Config(**dict(properties, **{
+        "run-mode": hexmap4gimp.Gimp.RunMode.NONINTERACTIVE, "specs": specs,
+        "index": False, "profile": ""}))
+
+@pytest.mark.parametrize("entries", [
+    [{"rows": 0}], [{"output": "map-{}.png"}], [{}, {"colums": 3}],
+    [{"brush": "hex none"}], "not a list"])
+def test_batch_bad_specs(tmp_path, monkeypatch, entries):
+    # Wrong specs are a calling error, found before any map is made
+    made = []
+    monkeypatch.setattr(hexmap4gimp, "template_hex_map", made.append)
+    specs = tmp_path / "specs.json"
+    specs.write_text(json.dumps(entries))
+    status = hexmap4gimp.HexMap4Gimp().batch_hex_maps(
+        Procedure(), batch_config(str(specs)), None)
+    assert status == hexmap4gimp.Gimp.PDBStatusType.CALLING_ERROR
+    assert made == []
+    status = hexmap4gimp.HexMap4Gimp().batch_hex_maps(
+        Procedure(), batch_config(str(tmp_path / "missing.json")), None)
+    assert status == hexmap4gimp.Gimp.PDBStatusType.CALLING_ERROR
+
+def test_batch_failure_is_execution_error(tmp_path, monkeypatch):
+    def failing_export(img, path):
+        raise OSError("no space left")
+
+    monkeypatch.setattr(hexmap4gimp, "export_hex_map", failing_export)
+    specs = tmp_path / "specs.json"
+    specs.write_text(json.dumps([{"rows": 2, "cols": 2,
+                                  "output": str(tmp_path / "m{index}.png")}]))
+    status = hexmap4gimp.HexMap4Gimp().batch_hex_maps(
+        Procedure(), batch_config(str(specs)), None)
+    assert status == hexmap4gimp.Gimp.PDBStatusType.EXECUTION_ERROR
+
+def test_templates_of_older_drawing_made_again(tmp_path, monkeypatch):
+    # Maps cached before the drawing version was raised are not reused
+    monkeypatch.setattr(hexmap4gimp, "template_cache", None)
+    monkeypatch.setattr(hexmap4gimp, "template_cache_dir",
+                        str(tmp_path / "templates"))
+    made = []
+    create_hex_map = hexmap4gimp.create_hex_map
+
+    def recorded_map(spec, tile=None):
+        made.append(spec)
+        return create_hex_map(spec, tile)
+
+    monkeypatch.setattr(hexmap4gimp, "create_hex_map", recorded_map)
+    spec = map_spec(rows=3, cols=4)
+    key = hexmap4gimp.template_key(spec)
+    hexmap4gimp.template_hex_map(spec)
+    hexmap4gimp.template_hex_map(spec)
+    assert len(made) == 1
+    monkeypatch.setattr(hexmap4gimp, "drawing_version",
+                        hexmap4gimp.drawing_version + 1)
+    assert hexmap4gimp.template_key(spec) != key
+    hexmap4gimp.template_hex_map(spec)
+    assert len(made) == 2
@@ -0,0 +1,43 @@
+# NAME
+#       test_hexprogress, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the progress reports and of stopping the work.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import pytest
+
+from hexprogress import Cancelled, Progress
+
+def test_parts_nested():
+    reports = []
+    progress = Progress(lambda fraction, text: reports.append((fraction,
+                                                                text)))
+    part = progress.parts([("a", 1), ("b", 3)])
+    with part("a", "A"):
+        progress.step(1, 1)
+    with part("b", "B"):
+        with progress.part(0.5, 1):
+            progress.step(1, 2)
+    assert reports[-1] == (1.0, "B")
+    assert (0.25, "A") in reports
+    fractions = [fraction for fraction, text in reports]
+    assert fractions == sorted(fractions)
+
+def test_cancelled():
+    progress = Progress(poll=lambda: True)
+    with pytest.raises(Cancelled):
+        with progress.part(0, 1):
+            pass
+
+def test_error_not_hidden():
+    # An error leaving a part is raised, although the user asked to stop
+    stop = []
+    progress = Progress(poll=lambda: bool(stop))
+    with pytest.raises(OSError):
+        with progress.part(0, 1):
+            stop.append(True)
+            raise OSError("disk full")
+    assert (progress.start, progress.end) == (0.0, 1.0)
@@ -0,0 +1,144 @@
+# NAME
+#       test_hexraster, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the NumPy rasterization against plain references: the
+#       stamps of the whole grid against one stamp per hex, and the labels
+#       against one sprite composited at a time.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import hexraster
+from hexgeometry import HexGeometry
+from pdbrecorder import hex_mask
+
+# Sizes of blank hex brushes, the default one first
+brush_sizes = [(36, 31), (38, 33), (20, 17), (144, 125)]
+
+def grid_of(size, rows=6, cols=7, halo=False):
+    grid = HexGeometry(*size)
+    grid.set_dims(rows, cols)
+    grid.set_halo(halo, halo, halo, halo)
+    return grid
+
+def brush_mask(size):
+    w, h = size
+    return np.frombuffer(hex_mask(w, h), dtype=np.uint8).reshape(h, w)
+
+def rects(grid):
+    # The whole image, a block inside, bands along its borders, a single
+    # pixel and a rect partly out of the image
+    w, h = grid.img_w, grid.img_h
+    return [(0, 0, w, h), (w // 3, h // 4, w // 2, h // 3), (w - 5, 0, 5, h),
+            (0, h - 1, w, 1), (3, 7, 1, 1), (w // 2, h // 2, w, h)]
+
+@pytest.mark.parametrize("size", brush_sizes)
+@pytest.mark.parametrize("halo", [False, True])
+def test_stamp_hexes_match_reference(size, halo):
+    grid = grid_of(size, halo=halo)
+    mask = brush_mask(size)
+    words = np.where(mask != 0, np.arange(mask.size).reshape(mask.shape) + 1,
+                     0).astype(np.uint32)
+    for stamp in (mask != 0, words):
+        for rect in rects(grid):
+            assert np.array_equal(
+                hexraster.stamp_hexes(grid, stamp, rect),
+                hexraster.stamp_hexes_reference(grid, stamp, rect)), rect
+
+@pytest.mark.parametrize("size", brush_sizes)
+@pytest.mark.parametrize("colored", [False, True])
+def test_grid_masks_match_reference(size, colored):
+    grid = grid_of(size, 5, 4)
+    mask = brush_mask(size)
+    color = None
+    if colored:
+        rng = np.random.default_rng(1)
+        color = rng.integers(0, 256, mask.shape + (3,), dtype=np.uint8)
+    pixels = hexraster.brush_pixels(mask, color)
+    stamp = np.where(mask != 0, hexraster.to_words(pixels), 0)
+    white = hexraster.to_words(np.full(4, 255, dtype=np.uint8))
+    for rect in rects(grid):
+        terrain, gap = hexraster.grid_masks(grid, mask, color, rect)
+        words = hexraster.stamp_hexes_reference(grid, stamp.astype(np.uint32),
+                                                rect)
+        assert np.array_equal(terrain, hexraster.to_rgba(words)), rect
+        assert np.array_equal(gap, words != white), rect
+
+def soft_mask(mask):
+    # The mask with anti-aliased edges: its outer pixels partly painted,
+    # and those around it faintly
+    hard = mask != 0
+    padded = np.pad(hard, 1)
+    inside = (padded[:-2, 1:-1] & padded[2:, 1:-1] &
+              padded[1:-1, :-2] & padded[1:-1, 2:])
+    around = (padded[:-2, 1:-1] | padded[2:, 1:-1] |
+              padded[1:-1, :-2] | padded[1:-1, 2:])
+    soft = np.where(hard, np.where(inside, 255, 160), np.where(around, 90, 0))
+    return soft.astype(np.uint8)
+
+@pytest.mark.parametrize("size", brush_sizes)
+@pytest.mark.parametrize("colored", [False, True])
+def test_soft_mask_rounded(size, colored):
+    # A soft edged brush paints as its mask thresholded at 128, the grid
+    # keeping its gaps
+    grid = grid_of(size, 5, 4)
+    mask = brush_mask(size)
+    soft = soft_mask(mask)
+    assert not hexraster.stamps_overlap(grid, soft)
+    color = None
+    if colored:
+        rng = np.random.default_rng(2)
+        color = rng.integers(0, 256, mask.shape + (3,), dtype=np.uint8)
+    stamp = np.where(soft >= 128, hexraster.to_words(
+        hexraster.brush_pixels(soft, color)), 0).astype(np.uint32)
+    white = hexraster.to_words(np.full(4, 255, dtype=np.uint8))
+    for rect in rects(grid):
+        terrain, gap = hexraster.grid_masks(grid, soft, color, rect)
+        words = hexraster.stamp_hexes_reference(grid, stamp, rect)
+        assert np.array_equal(terrain, hexraster.to_rgba(words)), rect
+        assert np.array_equal(gap, words != white), rect
+        assert np.array_equal(
+            gap, hexraster.grid_masks(grid, mask, color, rect)[1]), rect
+
+def token_sprites(tokens):
+    # Made up sprites, partly transparent, as wide as the tokens are long
+    rng = np.random.default_rng(7)
+    return {token: rng.integers(0, 256, (9, 4 * len(token) + 2, 4),
+                                dtype=np.uint8)
+            for token in sorted(tokens)}
+
+def compose_reference(placements, sprites, rect):
+    # One sprite copy composited at a time on the whole image, clipped to
+    # rect afterwards
+    x, y, w, h = rect
+    lx, ly, lw, lh = hexraster.placements_rect(placements, sprites)
+    x0, y0 = min(x, lx), min(y, ly)
+    x1, y1 = max(x + w, lx + lw), max(y + h, ly + lh)
+    pixels = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+    for token, (tops, lefts) in placements.items():
+        sprite = sprites[token]
+        sh, sw = sprite.shape[:2]
+        for top, left in zip(tops.tolist(), lefts.tolist()):
+            dst = pixels[top - y0:top - y0 + sh, left - x0:left - x0 + sw]
+            dst[...] = hexraster.over(sprite, dst)
+    return pixels[y - y0:y - y0 + h, x - x0:x - x0 + w]
+
+@pytest.mark.parametrize("size", brush_sizes[:3])
+@pytest.mark.parametrize("separator", ["", "."])
+def test_compose_labels_match_reference(size, separator):
+    grid = grid_of(size, 8, 12)
+    layout = grid.label_grid(0, 0, 11, 7, 95, 8, separator)
+    cx, cy, col_tokens, sep, row_tokens = layout
+    tokens = (set(col_tokens) | set(row_tokens) | {sep}) - {""}
+    sprites = token_sprites(tokens)
+    widths = {t: sprite.shape[1] for t, sprite in sprites.items()}
+    placements = hexraster.label_placements(grid, layout, widths)
+    for rect in rects(grid):
+        assert np.array_equal(
+            hexraster.compose_labels(placements, sprites, rect, chunk=5),
+            compose_reference(placements, sprites, rect)), rect
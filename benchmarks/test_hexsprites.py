@@ -0,0 +1,120 @@
+# NAME
+#       test_hexsprites, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the label sprite cache: the least recently used sprites
+#       dropped beyond its budget, its counters, and the sprites read back
+#       from its file.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import hexmap4gimp, hexsprites
+
+def sprite(value, width=5):
+    # A 3 x width RGBA sprite, of 60 bytes when 5 pixels wide
+    return np.full((3, width, 4), value, dtype=np.uint8)
+
+def key(text):
+    return hexsprites.sprite_key("Sans-serif", 7, "#646464", text)
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = hexsprites.SpriteCache(str(tmp_path / "labels.npz"), 180)
+    for i in range(3):
+        cache.store(key(str(i)), sprite(i))
+    assert cache.lookup(key("0")) is not None
+    cache.store(key("3"), sprite(3))
+    assert list(cache.sprites) == [key("2"), key("0"), key("3")]
+    assert cache.lookup(key("1")) is None
+    assert (cache.bytes, cache.evictions) == (180, 1)
+    # A wider sprite drops as many as needed to fit
+    cache.store(key("4"), sprite(4, 10))
+    assert list(cache.sprites) == [key("3"), key("4")]
+    assert (cache.bytes, cache.evictions) == (180, 3)
+
+def test_budget_kept(tmp_path):
+    cache = hexsprites.SpriteCache(str(tmp_path / "labels.npz"), 1000)
+    rng = np.random.default_rng(3)
+    for i in range(200):
+        cache.store(key(str(i % 40)), sprite(i, int(rng.integers(1, 20))))
+        assert cache.bytes == sum(s.nbytes for s in cache.sprites.values())
+        assert cache.bytes <= 1000
+    # A sprite bigger than the budget is not kept
+    cache.store(key("big"), sprite(1, 100))
+    assert (cache.sprites, cache.bytes) == ({}, 0)
+
+def test_counters(tmp_path):
+    cache = hexsprites.SpriteCache(str(tmp_path / "labels.npz"), 120)
+    assert cache.lookup(key("1")) is None
+    cache.store(key("1"), sprite(1))
+    assert np.array_equal(cache.lookup(key("1")), sprite(1))
+    assert cache.lookup(key("1")) is not None
+    cache.store(key("2"), sprite(2))
+    cache.store(key("3"), sprite(3))
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1,
+                             "sprites": 2, "bytes": 120}
+
+def test_reloaded_from_file(tmp_path):
+    path = str(tmp_path / "labels.npz")
+    cache = hexsprites.SpriteCache(path, 1000)
+    for i in range(4):
+        cache.store(key(str(i)), sprite(i, i + 1))
+    cache.lookup(key("1"))
+    cache.save()
+    assert not cache.changed and not os.path.exists(path + ".tmp")
+    loaded = hexsprites.SpriteCache(path, 1000)
+    assert list(loaded.sprites) == list(cache.sprites)
+    for k, s in cache.sprites.items():
+        assert np.array_equal(loaded.sprites[k], s)
+    assert loaded.bytes == cache.bytes
+    assert loaded.stats()["hits"] == 0
+    # Unchanged caches are not written again
+    mtime = os.stat(path).st_mtime_ns
+    os.utime(path, ns=(mtime - 10**9, mtime - 10**9))
+    loaded.lookup(key("1"))
+    loaded.save()
+    assert os.stat(path).st_mtime_ns == mtime - 10**9
+    # A smaller budget drops the least recently used sprites when a
+    # sprite is added
+    small = hexsprites.SpriteCache(path, 36)
+    small.store(key("4"), sprite(4, 1))
+    assert list(small.sprites) == [key("1"), key("4")]
+
+@pytest.mark.parametrize("content", [b"", b"not a zip file",
+                                     "other version"])
+def test_unreadable_file_ignored(tmp_path, monkeypatch, content):
+    path = str(tmp_path / "labels.npz")
+    if content == "other version":
+        cache = hexsprites.SpriteCache(path, 1000)
+        cache.store(key("1"), sprite(1))
+        monkeypatch.setattr(hexsprites, "cache_version", 2)
+        cache.save()
+        monkeypatch.setattr(hexsprites, "cache_version", 1)
+    else:
+        with open(path, "wb") as f:
+            f.write(content)
+    cache = hexsprites.SpriteCache(path, 1000)
+    assert (len(cache.sprites), cache.bytes) == (0, 0)
+    cache.store(key("1"), sprite(1))
+    cache.save()
+    assert len(hexsprites.SpriteCache(path, 1000).sprites) == 1
+
+@pytest.mark.parametrize("value, budget", [
+    (None, hexmap4gimp.label_cache_bytes), ("", hexmap4gimp.label_cache_bytes),
+    ("16", 16 * 1024 * 1024), (" 0.5 ", 512 * 1024), ("0", 0),
+    ("lots", hexmap4gimp.label_cache_bytes),
+    ("-1", hexmap4gimp.label_cache_bytes),
+    ("nan", hexmap4gimp.label_cache_bytes)])
+def test_budget_setting(monkeypatch, value, budget):
+    monkeypatch.delenv(hexmap4gimp.label_cache_env, raising=False)
+    if value is not None:
+        monkeypatch.setenv(hexmap4gimp.label_cache_env, value)
+    monkeypatch.setattr(hexmap4gimp, "label_cache", None)
+    assert hexmap4gimp.label_cache_budget() == budget
+    assert hexmap4gimp.label_sprite_cache().budget == budget
@@ -0,0 +1,47 @@
+# NAME
+#       test_hextemplates, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the budget of the template cache.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import os
+
+from hextemplates import TemplateCache
+
+def store(cache, key, size):
+    # Saves a map file of size bytes for key, as save_template does
+    with open(cache.prepare(key), "wb") as f:
+        f.write(b"\0" * size)
+    return cache.store(key)
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = TemplateCache(str(tmp_path), 100)
+    for key in ("a", "b", "c"):
+        assert store(cache, key, 40)
+    assert cache.lookup("a") is None
+    assert cache.lookup("b") is not None
+    assert store(cache, "d", 40)
+    assert cache.lookup("c") is None
+    assert cache.lookup("b") is not None
+    assert cache.stats()["bytes"] == 80
+    assert sorted(os.listdir(tmp_path)) == ["b.xcf", "d.xcf", "index.json"]
+
+def test_map_over_budget_not_kept(tmp_path):
+    cache = TemplateCache(str(tmp_path), 100)
+    assert store(cache, "a", 60)
+    assert not store(cache, "big", 101)
+    assert cache.lookup("big") is None
+    assert cache.lookup("a") is not None
+    assert cache.stats()["bytes"] == 60
+    assert sorted(os.listdir(tmp_path)) == ["a.xcf", "index.json"]
+
+def test_index_reloaded(tmp_path):
+    cache = TemplateCache(str(tmp_path), 100)
+    store(cache, "a", 10)
+    store(cache, "b", 20)
+    cache = TemplateCache(str(tmp_path), 100)
+    assert cache.stats()["bytes"] == 30
+    assert cache.lookup("a") == os.path.join(str(tmp_path), "a.xcf")
@@ -0,0 +1,115 @@
+# NAME
+#       test_hextiles, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Checks of the tile pyramid: the PNG encoder against a plain decoder,
+#       the tiles of each zoom level against the size of the map on it, and
+#       the tiles linked to the first one with the same pixels or source.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import json, math, os, random, struct, zlib
+
+import pytest
+
+import hextiles
+
+def png_pixels(data):
+    # Width, height and RGBA pixels of a PNG file of unfiltered 8 bit RGBA
+    # rows, as png_bytes writes them, checking its chunks
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, []
+    while pos < len(data):
+        length, = struct.unpack(">I", data[pos:pos + 4])
+        chunk = data[pos + 4:pos + 8 + length]
+        crc, = struct.unpack(">I", data[pos + 8 + length:pos + 12 + length])
+        assert zlib.crc32(chunk) & 0xffffffff == crc
+        chunks.append((chunk[:4], chunk[4:]))
+        pos += 12 + length
+    assert [kind for kind, body in chunks] == [b"IHDR", b"IDAT", b"IEND"]
+    width, height, depth, color, *methods = struct.unpack(">IIBBBBB",
+                                                          chunks[0][1])
+    assert (depth, color, methods) == (8, 6, [0, 0, 0])
+    raw = zlib.decompress(chunks[1][1])
+    stride = 4 * width + 1
+    assert len(raw) == height * stride
+    assert all(raw[y * stride] == 0 for y in range(height))
+    return width, height, b"".join(raw[y * stride + 1:(y + 1) * stride]
+                                   for y in range(height))
+
+@pytest.mark.parametrize("width, height", [(1, 1), (3, 2), (17, 5),
+                                           (256, 256)])
+def test_png_round_trip(width, height):
+    rng = random.Random(width * height)
+    rgba = bytes(rng.randrange(256) for i in range(width * height * 4))
+    assert png_pixels(hextiles.png_bytes(width, height, rgba)) == \
+        (width, height, rgba)
+
+@pytest.mark.parametrize("width, height, tile_w, tile_h", [
+    (100, 100, 256, 256), (256, 256, 256, 256), (257, 100, 256, 256),
+    (1000, 300, 256, 256), (5000, 7001, 256, 256), (720, 93, 72, 31),
+    (3, 1000, 2, 3)])
+def test_pyramid_tiles(width, height, tile_w, tile_h):
+    # Every zoom level is cut in just the tiles covering the map scaled to
+    # it, halving from full resolution down to a single tile
+    levels = {}
+    for z, x, y, scale in hextiles.pyramid_tiles(width, height, tile_w,
+                                                 tile_h):
+        level = levels.setdefault(z, (scale, set()))
+        assert level[0] == scale
+        assert (x, y) not in level[1]
+        level[1].add((x, y))
+    top = hextiles.max_zoom(width, height, tile_w, tile_h)
+    assert sorted(levels) == list(range(top + 1))
+    for z, (scale, tiles) in levels.items():
+        assert scale == 0.5 ** (top - z)
+        w, h = math.ceil(width * scale), math.ceil(height * scale)
+        cols = max(x for x, y in tiles) + 1
+        rows = max(y for x, y in tiles) + 1
+        assert tiles == {(x, y) for x in range(cols) for y in range(rows)}
+        assert (cols - 1) * tile_w < w <= cols * tile_w
+        assert (rows - 1) * tile_h < h <= rows * tile_h
+    assert levels[0][1] == {(0, 0)}
+    assert top == 0 or len(levels[1][1]) > 1
+
+def tile(value, alpha=255, width=4, height=3):
+    return bytes([value, value, value, alpha]) * (width * height)
+
+def test_same_tiles_linked(tmp_path):
+    writer = hextiles.TileWriter(str(tmp_path))
+    writer.write(1, 0, 0, 4, 3, tile(10))
+    writer.write(1, 1, 0, 4, 3, tile(20))
+    writer.write(1, 0, 1, 4, 3, tile(10))
+    writer.write(1, 1, 1, 4, 3, tile(10, alpha=0))
+    writer.write(0, 0, 0, 4, 3, tile(20))
+    assert os.path.samefile(writer.path(1, 0, 0), writer.path(1, 0, 1))
+    assert os.path.samefile(writer.path(1, 1, 0), writer.path(0, 0, 0))
+    assert not os.path.samefile(writer.path(1, 0, 0), writer.path(1, 1, 0))
+    assert not os.path.exists(writer.path(1, 1, 1))
+    assert png_pixels(open(writer.path(1, 0, 1), "rb").read())[2] == tile(10)
+    assert (writer.written, writer.reused, writer.empty) == (2, 2, 1)
+    manifest = writer.write_manifest(8, 6, 4, 3)
+    assert (manifest["tiles"], manifest["unique_tiles"]) == (4, 2)
+    assert json.loads((tmp_path / "tiles.json").read_text()) == manifest
+
+def test_same_sources_linked(tmp_path):
+    # Tiles from a source already seen are linked without their pixels,
+    # even when those were the same as an earlier tile's
+    writer = hextiles.TileWriter(str(tmp_path))
+    a, b, empty = (hextiles.tile_key(name) for name in (b"a", b"b", b"e"))
+    assert not writer.reuse(2, 0, 0, a)
+    writer.write(2, 0, 0, 4, 3, tile(10), a)
+    writer.write(2, 1, 0, 4, 3, tile(10), b)
+    writer.write(2, 2, 0, 4, 3, tile(0, alpha=0), empty)
+    assert writer.reuse(2, 0, 1, a) and writer.reuse(2, 1, 1, b)
+    assert writer.reuse(2, 2, 1, empty)
+    assert not writer.reuse(2, 3, 1, hextiles.tile_key(b"c"))
+    for x in (0, 1):
+        assert os.path.samefile(writer.path(2, 0, 0), writer.path(2, x, 1))
+    assert not os.path.exists(writer.path(2, 2, 1))
+    assert (writer.written, writer.reused, writer.empty) == (1, 3, 2)
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        hextiles.TileWriter(str(tmp_path), "jpeg")
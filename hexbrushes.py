@@ -0,0 +1,174 @@
+# NAME
+#       hexbrushes, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Cache of the size of the brushes, so that the blank hex brush can be
+#       checked, and the hex grid built, without asking GIMP. Sizes are read
+#       from the headers of the GIMP brush files (.gbr) in the brush folders
+#       and kept in a JSON file, along with the modification time of each
+#       brush file, whose header is only read again when it changes.
+#
+#       The tiling table of a blank hex brush, the HexLayout the grid is
+#       built on, is derived from its mask, read from the brush file the first
+#       time it is needed and cached along with its size.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import json, os, struct
+
+from hexgeometry import HexLayout, mask_layout
+
+# Version of the cache file format, older files are ignored. Version 2 rounds
+# soft brush edges when deriving the layouts.
+cache_version = 2
+
+def read_gbr_header(path):
+    # Name, width and height of a GIMP brush file, or None if it is not one.
+    # Version 1 files lack the magic and spacing fields of versions 2 and 3.
+    with open(path, "rb") as f:
+        head = f.read(28)
+        if len(head) < 20:
+            return None
+        header_size, version, width, height = struct.unpack(">IIII",
+                                                            head[:16])
+        if version == 1:
+            name_start = 20
+        elif version in (2, 3) and head[20:24] == b"GIMP":
+            name_start = 28
+        else:
+            return None
+        if not name_start <= header_size <= name_start + 4096:
+            return None
+        # Version 1 headers with short names end before the 28 bytes read
+        head += f.read(max(0, header_size - len(head)))
+    name = head[name_start:header_size].split(b"\0")[0]
+    return name.decode("utf-8", "replace"), width, height
+
+def read_gbr_mask(path):
+    # Width, height, bytes per pixel and pixels of a GIMP brush file, or
+    # None if it is not one: the mask, or RGBA pixels for color brushes
+    with open(path, "rb") as f:
+        head = f.read(20)
+        if len(head) < 20:
+            return None
+        header_size, version, width, height, depth = struct.unpack(">IIIII",
+                                                                   head)
+        if depth not in (1, 4) or read_gbr_header(path) is None:
+            return None
+        f.seek(header_size)
+        pixels = f.read(width * height * depth)
+    if len(pixels) < width * height * depth:
+        return None
+    return width, height, depth, pixels
+
+class BrushCache:
+    def __init__(self, path, brush_dirs):
+        # path is the cache file and brush_dirs a function returning the
+        # brush folders, only called if they have to be scanned
+        self.path = path
+        self.brush_dirs = brush_dirs
+        self.scanned = False
+        self.brushes = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != cache_version:
+            return {}
+        return data.get("brushes", {})
+
+    def save(self):
+        # Written aside and renamed, so that a plugin running at the same
+        # time never reads half a file
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"version": cache_version, "brushes": self.brushes},
+                          f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def lookup(self, name):
+        # (width, height) of the brush, or None when it is not in the brush
+        # folders. The folders are scanned at most once, when the brush is
+        # not cached or its file changed.
+        entry = self.brushes.get(name)
+        if entry is not None and self.is_fresh(entry):
+            return entry["width"], entry["height"]
+        if self.scanned:
+            return None
+        self.scan()
+        entry = self.brushes.get(name)
+        if entry is None:
+            return None
+        return entry["width"], entry["height"]
+
+    def identity(self, name):
+        # File and modification time of the brush, as a dict, or None when
+        # it is not in the brush folders
+        if self.lookup(name) is None:
+            return None
+        entry = self.brushes[name]
+        return {"name": name, "path": entry["path"], "mtime": entry["mtime"]}
+
+    def layout(self, name):
+        # HexLayout of the brush derived from its mask, or None when it is
+        # not in the brush folders. Raises ValueError when the brush does
+        # not tile as a hex grid.
+        if self.lookup(name) is None:
+            return None
+        entry = self.brushes[name]
+        if "layout" not in entry:
+            try:
+                brush = read_gbr_mask(entry["path"])
+            except OSError:
+                brush = None
+            if brush is None:
+                return None
+            width, height, depth, pixels = brush
+            entry["layout"] = mask_layout(width, height, pixels,
+                                          depth).to_dict()
+            self.save()
+        return HexLayout(**entry["layout"])
+
+    def is_fresh(self, entry):
+        try:
+            return os.stat(entry["path"]).st_mtime_ns == entry["mtime"]
+        except OSError:
+            return False
+
+    def scan(self):
+        # Reads the headers of the brush files that are new or changed since
+        # they were cached. When two files hold brushes with the same name the
+        # first one found, in the order of the brush folders, is kept.
+        self.scanned = True
+        known = {entry["path"]: (name, entry)
+                 for name, entry in self.brushes.items()}
+        brushes = {}
+        for folder in self.brush_dirs():
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                for file_name in sorted(files):
+                    if not file_name.lower().endswith(".gbr"):
+                        continue
+                    path = os.path.join(root, file_name)
+                    try:
+                        mtime = os.stat(path).st_mtime_ns
+                        name, entry = known.get(path, (None, None))
+                        if entry is None or entry["mtime"] != mtime:
+                            header = read_gbr_header(path)
+                            if header is None:
+                                continue
+                            name, width, height = header
+                            entry = {"path": path, "mtime": mtime,
+                                     "width": width, "height": height}
+                    except OSError:
+                        continue
+                    brushes.setdefault(name, entry)
+        self.brushes = brushes
+        self.save()
@@ -0,0 +1,151 @@
+# NAME
+#       hexfill, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Reading of hex fill files, lists of (col, row, brush) records giving
+#       the terrain brush painted on each hex of a map, independent of GIMP.
+#       Columns and rows count from 0, as the hexes of the map, not as their
+#       labels. A file is one of:
+#
+#           .csv    rows of col,row,brush, after an optional header naming
+#                   those columns (in any order, other columns are ignored)
+#           .json   a list of {"col": ..., "row": ..., "brush": ...}
+#                   objects, or of [col, row, brush] lists
+#           .jsonl  one such object or list per line
+#
+#       Files are read one record at a time, JSON lists included, and the
+#       hexes of each brush are kept as a packed array of integers, so a
+#       world of a million hexes takes a few MB. The plugin then sets each
+#       brush once and paints all its hexes, see fill_hex_map.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import array, csv, json, os
+
+fill_formats = {".csv": "csv", ".json": "json", ".jsonl": "jsonl",
+                ".ndjson": "jsonl"}
+
+# Characters read at a time from JSON lists
+json_chunk = 64 * 1024
+
+def fill_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in fill_formats:
+        raise ValueError(f"{path}: unknown hex fill format, expected one of "
+                         + ", ".join(sorted(fill_formats)))
+    return fill_formats[extension]
+
+def parse_record(values, where):
+    # (col, row, brush) from the three values of a record
+    try:
+        col, row, brush = values
+        return int(col), int(row), str(brush).strip()
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: expected col, row and brush, got "
+                         f"{values!r}") from None
+
+def csv_records(f, path):
+    columns = None
+    for line, values in enumerate(csv.reader(f), 1):
+        if not values or values[0].lstrip().startswith("#"):
+            continue
+        if columns is None:
+            names = [value.strip().lower() for value in values]
+            if {"col", "row", "brush"} <= set(names):
+                columns = [names.index(key) for key in ("col", "row", "brush")]
+                continue
+            columns = [0, 1, 2]
+        if len(values) <= max(columns):
+            raise ValueError(f"{path}:{line}: expected col, row and brush")
+        yield parse_record([values[i] for i in columns], f"{path}:{line}")
+
+def json_values(item):
+    if isinstance(item, dict):
+        return [item.get(key) for key in ("col", "row", "brush")]
+    return item
+
+def json_items(f, path):
+    # Items of the JSON list in f, decoded one at a time from chunks of the
+    # file instead of loading it whole
+    decoder = json.JSONDecoder()
+    text, pos, eof = "", 0, False
+
+    def more():
+        nonlocal text, pos, eof
+        chunk = f.read(json_chunk)
+        eof = not chunk
+        text, pos = text[pos:] + chunk, 0
+
+    def skip_space():
+        nonlocal pos
+        while True:
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+            if pos < len(text) or eof:
+                return
+            more()
+
+    skip_space()
+    if text[pos:pos + 1] != "[":
+        raise ValueError(f"{path}: expected a JSON list")
+    pos += 1
+    skip_space()
+    if text[pos:pos + 1] == "]":
+        return
+    while True:
+        while True:
+            try:
+                item, end = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f"{path}: invalid JSON") from None
+                more()
+                continue
+            # A number at the end of the chunk may go on in the next one
+            if end < len(text) or eof:
+                break
+            more()
+        pos = end
+        yield item
+        skip_space()
+        if text[pos:pos + 1] == "]":
+            return
+        if text[pos:pos + 1] != ",":
+            raise ValueError(f"{path}: expected , or ] in the JSON list")
+        pos += 1
+        skip_space()
+
+def records(path):
+    # Yields the (col, row, brush) records of a hex fill file
+    kind = fill_format(path)
+    with open(path, newline="" if kind == "csv" else None,
+              encoding="utf-8") as f:
+        if kind == "csv":
+            yield from csv_records(f, path)
+        elif kind == "json":
+            for i, item in enumerate(json_items(f, path)):
+                yield parse_record(json_values(item), f"{path}: item {i}")
+        else:
+            for line, text in enumerate(f, 1):
+                if text.strip():
+                    yield parse_record(json_values(json.loads(text)),
+                                       f"{path}:{line}")
+
+def read_fill(path, rows, cols):
+    # Hexes of a rows x cols map to paint with each brush, as {brush:
+    # array of col, row pairs}, brushes in the order they first appear and
+    # hexes in the order of the file, and the number of records skipped as
+    # they fall outside the map
+    groups = {}
+    skipped = 0
+    for col, row, brush in records(path):
+        if not (0 <= col < cols and 0 <= row < rows):
+            skipped += 1
+            continue
+        hexes = groups.get(brush)
+        if hexes is None:
+            hexes = groups[brush] = array.array("i")
+        hexes.append(col)
+        hexes.append(row)
+    return groups, skipped
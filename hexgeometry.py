@@ -0,0 +1,650 @@
+# NAME
+#       hexgeometry, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Geometry of the hex map, independent of GIMP: the position of every
+#       hex from the dimensions of the blank hex brush, the image size, the
+#       placement of the hex labels and the sides of the large grid. HexGrid,
+#       in hexmap4gimp.py, adds the drawing on GIMP layers on top of it, so
+#       this module can be used (and profiled) from plain Python.
+#
+#       With NumPy the coordinates of whole blocks of hexes, and of the large
+#       grid vertices, are computed as arrays. Without it they are computed
+#       one hex at a time.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def make_label_tokens(coord_separator, x, y):
+    # Pieces of a CCRR label, which is their concatenation
+    return f"{x:02d}", coord_separator, f"{y:02d}"
+
+def make_label(coord_separator, x, y):
+    return "".join(make_label_tokens(coord_separator, x, y))
+
+def map_tiles(rows, cols, tile_rows, tile_cols):
+    # Splits a map into sub-maps of at most tile_rows x tile_cols hexes,
+    # yielding the row and column of each tile and its (c0, c1, r0, r1)
+    # column and row ranges. Tiles start on even columns, so that every hex
+    # keeps the column parity it has in the whole map.
+    tile_cols += tile_cols % 2
+    for i, r0 in enumerate(range(0, rows, tile_rows)):
+        for j, c0 in enumerate(range(0, cols, tile_cols)):
+            yield i, j, (c0, min(cols, c0 + tile_cols),
+                         r0, min(rows, r0 + tile_rows))
+
+class HexLayout:
+    def __init__(self, orientation, hex_w, hex_h, dx, dy, parity_offset,
+                 origin_x, origin_y, pad_w, pad_h):
+        # Tiling table of a blank hex brush of hex_w x hex_h pixels, either
+        # "flat" (flat top hexes in columns, the odd columns shifted down by
+        # parity_offset) or "pointy" (pointy top hexes in rows, the odd rows
+        # shifted right). dx and dy are the distances between columns and
+        # between rows, (origin_x, origin_y) the center of hex (0, 0), and
+        # pad_w and pad_h what the image spans beyond the centers of the
+        # hexes furthest apart, so that the image is
+        #
+        #   flat:   dx * (cols - 1) + pad_w  x  dy * (rows - 1) + parity + pad_h
+        #   pointy: dx * (cols - 1) + parity + pad_w  x  dy * (rows - 1) + pad_h
+        self.orientation = orientation
+        self.hex_w = hex_w
+        self.hex_h = hex_h
+        self.dx = dx
+        self.dy = dy
+        self.parity_offset = parity_offset
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.pad_w = pad_w
+        self.pad_h = pad_h
+
+    def __eq__(self, other):
+        return isinstance(other, HexLayout) and vars(self) == vars(other)
+
+    def __hash__(self):
+        return hash(tuple(vars(self).values()))
+
+    def to_dict(self):
+        # As kept in the brush cache and the maps, HexLayout(**d) rebuilds it
+        return dict(vars(self))
+
+    def overlap(self):
+        # Pixels the boxes of the brush stamped on neighbouring columns (flat)
+        # or hexes of a row (pointy) share
+        if self.orientation == "flat":
+            return self.hex_w - self.dx
+        return self.hex_h - self.dy
+
+    def image_size(self, rows, cols):
+        if self.orientation == "flat":
+            return (self.dx * (cols - 1) + self.pad_w,
+                    self.dy * (rows - 1) + self.parity_offset + self.pad_h)
+        return (self.dx * (cols - 1) + self.parity_offset + self.pad_w,
+                self.dy * (rows - 1) + self.pad_h)
+
+def formula_layout(hex_w, hex_h):
+    # These expressions where derived from the original hexgimp scheme code
+    # and work fine for hexgimp's brushes, where:
+    #
+    # hex_w = 36 -- width of the blank hex       --> even and multiple of 4
+    # hex_h = 31 -- height of the blank hex      --> odd
+    # dx    = 28 -- distance between hex columns
+    # dy    = 15 -- distance between hex rows
+    #
+    # The code might need to be addapted to work with other brushes,
+    # probably making adjustments in cases where hex_w is odd and/or hex_h
+    # even. mask_layout derives the table from the brush mask instead, and
+    # gives this one for the hexgimp brushes.
+    dx = (hex_w + 2) * 3 // 4 + 1
+    return HexLayout("flat", hex_w, hex_h, dx, hex_h + 1, hex_h // 2 + 1,
+                     1 + hex_w // 2, 1 + hex_h // 2, dx + (hex_w + 2) // 4,
+                     hex_h + 2)
+
+# Mask value from which a pixel of a brush counts as painted, so that soft or
+# anti-aliased edges are rounded to whole pixels, as the pencil paints them
+mask_threshold = 128
+
+def mask_rows(w, h, mask, bpp=1):
+    # Rows of a brush mask as integers, with bit x set where the brush
+    # paints pixel x of the row. mask holds bpp bytes per pixel, the last one
+    # being the mask value (the alpha of color brushes).
+    rows = []
+    for y in range(h):
+        row = mask[y * w * bpp:(y + 1) * w * bpp]
+        bits = 0
+        for x in range(w):
+            if row[x * bpp + bpp - 1] >= mask_threshold:
+                bits |= 1 << x
+        rows.append(bits)
+    return rows
+
+def transpose_rows(rows, w):
+    # Columns of a mask given by its rows, as the rows of the transposed mask
+    return [sum(((row >> x) & 1) << y for y, row in enumerate(rows))
+            for x in range(w)]
+
+def rows_overlap(rows, ox, oy):
+    # Whether the mask stamped at (0, 0) and at (ox, oy), ox >= 0, paint
+    # any pixel in common
+    h = len(rows)
+    return any(rows[y] & (rows[y - oy] << ox)
+               for y in range(max(0, oy), min(h, h + oy)))
+
+def mask_box(rows):
+    # Bounding box (x0, y0, x1, y1) of the painted pixels of a mask
+    painted = [y for y, row in enumerate(rows) if row]
+    if not painted:
+        raise ValueError("The blank hex brush is empty")
+    x0 = min((row & -row).bit_length() - 1 for row in rows if row)
+    x1 = max(row.bit_length() for row in rows)
+    return x0, painted[0], x1, painted[-1] + 1
+
+def is_hex_shaped(rows):
+    # Whether the corners of the box of a mask are left blank, as by a hex
+    # of either orientation, and not painted as by a square or a rectangle
+    x0, y0, x1, y1 = mask_box(rows)
+    return not any((rows[y] >> x) & 1 for x in (x0, x1 - 1)
+                   for y in (y0, y1 - 1))
+
+def flat_layout(rows, w, h, gap):
+    # Table of flat top hexes: the closest rows, and then columns, whose
+    # stamps do not overlap, gap pixels apart. The grid fills the gaps.
+    x0, y0, x1, y1 = mask_box(rows)
+    dy = next(s for s in range(1, h + 1) if not rows_overlap(rows, 0, s))
+    dy += gap
+    parity = (dy + 1) // 2
+    dx = next(s for s in range(1, w + 1)
+              if not rows_overlap(rows, s, parity) and
+                 not rows_overlap(rows, s, parity - dy))
+    dx += gap
+    return HexLayout("flat", w, h, dx, dy, parity, gap + w // 2 - x0,
+                     gap + h // 2 - y0, x1 - x0 + 2 * gap,
+                     y1 - y0 + 2 * gap)
+
+def tiles_plane(rows, layout, gap):
+    # Checks a flat table on a patch of stamps: no two stamps overlap, and
+    # every pixel around the central hexes is at most gap pixels from one
+    w, h = layout.hex_w, layout.hex_h
+    cols, nrows = 5, 4
+    width, height = layout.image_size(nrows, cols)
+    canvas = [0] * height
+    for c in range(cols):
+        for r in range(nrows):
+            x = c * layout.dx + layout.origin_x - w // 2
+            y = (r * layout.dy + (c % 2) * layout.parity_offset +
+                 layout.origin_y - h // 2)
+            for j, row in enumerate(rows):
+                # The mask may start right of the stamp
+                row = row << x if x >= 0 else row >> -x
+                if row:
+                    if canvas[y + j] & row:
+                        return False
+                    canvas[y + j] |= row
+    near = []
+    for y in range(height):
+        row = 0
+        for j in range(max(0, y - gap), min(height, y + gap + 1)):
+            row |= canvas[j]
+        for i in range(gap):
+            row |= (row << 1) | (row >> 1)
+        near.append(row)
+    # Between the centers of hexes (1, 1) and (3, 2)
+    x_a = layout.dx + layout.origin_x
+    x_b = 3 * layout.dx + layout.origin_x
+    y_a = layout.dy + layout.origin_y
+    y_b = 2 * layout.dy + layout.origin_y
+    span = ((1 << (x_b - x_a)) - 1) << x_a
+    return all(near[y] & span == span for y in range(y_a, y_b))
+
+def mask_layout(w, h, mask, bpp=1, gap=1):
+    # Tiling table of a blank hex brush derived from its mask (bpp bytes per
+    # pixel, as in mask_rows): the hexes as close as they can be with a gap
+    # of gap pixels between them for the grid. Pointy top brushes, taller
+    # than wide at their top, are laid out as flat top ones transposed.
+    # Raises ValueError when the brush is not a hex or does not tile the
+    # plane that way.
+    rows = mask_rows(w, h, mask, bpp)
+    if not is_hex_shaped(rows):
+        raise ValueError(f"A {w}x{h} brush with this shape is not a hex")
+    x0, y0, x1, y1 = mask_box(rows)
+    top = bin(rows[y0]).count("1")
+    left = sum((row >> x0) & 1 for row in rows)
+    if top >= left:
+        layout = flat_layout(rows, w, h, gap)
+        checked = tiles_plane(rows, layout, gap)
+    else:
+        columns = transpose_rows(rows, w)
+        flat = flat_layout(columns, h, w, gap)
+        checked = tiles_plane(columns, flat, gap)
+        layout = HexLayout("pointy", w, h, flat.dy, flat.dx,
+                           flat.parity_offset, flat.origin_y, flat.origin_x,
+                           flat.pad_h, flat.pad_w)
+    if not checked:
+        raise ValueError(f"A {w}x{h} brush with this shape does not tile "
+                         f"as a hex grid")
+    return layout
+
+class HexGeometry:
+    def __init__(self, hex_w, hex_h, layout=None):
+        # The grid follows the tiling table of the blank hex brush, see
+        # HexLayout, or else the one of formula_layout
+        layout = layout or formula_layout(hex_w, hex_h)
+        if layout.orientation != "flat":
+            raise ValueError("Maps of pointy top hexes are not supported "
+                             "yet, the blank hex brush must be flat top")
+        self.layout = layout
+        self.hex_w = hex_w
+        self.hex_h = hex_h
+        self.dx = layout.dx
+        self.dy = layout.dy
+        self.odd_col_offset = layout.parity_offset
+        self.origin_center_dx = layout.origin_x
+        self.origin_center_dy = layout.origin_y
+        self.gimp_grid_x = self.dx
+        self.gimp_grid_y = self.odd_col_offset
+
+    def hex_center(self, c, r):
+        # c and r may also be NumPy arrays, giving arrays of centers
+        x = c * self.dx + self.origin_center_dx
+        y = r * self.dy + (c % 2) * self.odd_col_offset + self.origin_center_dy
+        return x, y
+
+    def hex_centers(self, c0, c1, r0, r1):
+        # Centers of the hexes of columns [c0, c1) and rows [r0, r1), as two
+        # (rows, cols) arrays of x and y. Needs NumPy.
+        x, y = self.hex_center(np.arange(c0, c1)[None, :],
+                               np.arange(r0, r1)[:, None])
+        return np.broadcast_arrays(x, y)
+
+    def hex_center_list(self, c0, c1, r0, r1):
+        # The same centers as a list of (x, y), row by row
+        if np is None:
+            return [self.hex_center(c, r) for r in range(r0, r1)
+                                          for c in range(c0, c1)]
+        x, y = self.hex_centers(c0, c1, r0, r1)
+        return list(zip(x.ravel().tolist(), y.ravel().tolist()))
+
+    def hex_centers_of(self, hexes):
+        # Centers of a list of (c, r) hexes, as a list of (x, y)
+        if np is None or not hexes:
+            return [self.hex_center(c, r) for c, r in hexes]
+        c, r = np.array(hexes).T
+        x, y = self.hex_center(c, r)
+        return list(zip(x.tolist(), y.tolist()))
+
+    def stamp_origin(self, c, r):
+        # Top left pixel of the brush stamped on hex (c, r), placed as GIMP's
+        # paint core does for a brush centered on an integer point
+        x, y = self.hex_center(c, r)
+        return x - self.hex_w // 2, y - self.hex_h // 2
+
+    def set_dims(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.img_w, self.img_h = self.layout.image_size(rows, cols)
+        # Ranges of the hexes drawn, see set_halo
+        self.hex_cols = 0, cols
+        self.hex_rows = 0, rows
+        return self.img_w, self.img_h 
+
+    def set_halo(self, left, top, right, bottom):
+        # Also draws the column or row of hexes just outside the map on the
+        # given sides. On a tile of a larger map, these are the hexes of the
+        # neighbouring tiles that reach into its image, which then matches
+        # the same part of the whole map.
+        self.set_hex_ranges(-int(left), self.cols + int(right),
+                            -int(top), self.rows + int(bottom))
+
+    def set_hex_ranges(self, c0, c1, r0, r1):
+        # Draws only the hexes of columns [c0, c1) and rows [r0, r1)
+        self.hex_cols = c0, c1
+        self.hex_rows = r0, r1
+
+    def geometry(self):
+        # A plain HexGeometry with the same grid, dimensions and hex ranges,
+        # for instance to pass the geometry of a HexGrid to other processes
+        geom = HexGeometry(self.hex_w, self.hex_h, self.layout)
+        geom.set_dims(self.rows, self.cols)
+        geom.set_hex_ranges(*self.hex_cols, *self.hex_rows)
+        return geom
+
+    def extension_bands(self, rows, cols):
+        # Parts of the image that change when a map of rows x cols hexes is
+        # grown to the current dimensions, as (rect, hexes) pairs: the rect
+        # (x, y, width, height) and the (c0, c1, r0, r1) ranges of the hexes
+        # added in it. These are the new columns on the right, and the new
+        # rows at the bottom of the old columns.
+        left = self.origin_center_dx - self.hex_w // 2
+        top = self.origin_center_dy - self.hex_h // 2
+        bands = []
+        x = self.img_w
+        if cols < self.cols:
+            x = left + cols * self.dx
+            bands.append(((x, 0, self.img_w - x, self.img_h),
+                          (cols, self.cols, 0, self.rows)))
+        if rows < self.rows:
+            y = top + rows * self.dy
+            bands.append(((0, y, x, self.img_h - y),
+                          (0, cols, rows, self.rows)))
+        return bands
+
+    def tile_origin(self, c0, r0):
+        # Position in the whole map of the image of the tile whose first hex
+        # is (c0, r0), c0 being even
+        return c0 * self.dx, r0 * self.dy
+
+    def col_range_in(self, x0, x1):
+        # Columns whose hexes may have pixels in [x0, x1)
+        left = self.origin_center_dx - self.hex_w // 2
+        c0 = max(self.hex_cols[0], (x0 - left - self.hex_w) // self.dx + 1)
+        c1 = min(self.hex_cols[1], (x1 - 1 - left) // self.dx + 1)
+        return c0, max(c0, c1)
+
+    def row_range_in(self, y0, y1):
+        # Rows whose hexes (on even or odd columns) may have pixels in [y0, y1)
+        top = self.origin_center_dy - self.hex_h // 2
+        span = self.odd_col_offset + self.hex_h
+        r0 = max(self.hex_rows[0], (y0 - top - span) // self.dy + 1)
+        r1 = min(self.hex_rows[1], (y1 - 1 - top) // self.dy + 1)
+        return r0, max(r0, r1)
+
+    def hexes_in_rect(self, rect):
+        # Column and row ranges of the hexes that may have pixels in rect,
+        # given as (x, y, width, height)
+        x, y, w, h = rect
+        c0, c1 = self.col_range_in(x, x + w)
+        r0, r1 = self.row_range_in(y, y + h)
+        return c0, c1, r0, r1
+
+    def hex_at(self, x, y):
+        # The (c, r) hex whose hexagon, see hex_outline, holds pixel (x, y),
+        # or None when it is outside the map. In each of the three columns
+        # around x, the hex of the nearest center is checked, and the one the
+        # pixel is furthest inside of is taken.
+        r3 = self.dx / 3
+        h = self.dy / 2
+        c0 = math.floor((x - self.origin_center_dx) / self.dx + 0.5)
+        best, found = None, None
+        for c in (c0, c0 - 1, c0 + 1):
+            top = (c % 2) * self.odd_col_offset + self.origin_center_dy
+            r = math.floor((y - top) / self.dy + 0.5)
+            cx, cy = self.hex_center(c, r)
+            ax, ay = abs(x - cx), abs(y - cy)
+            # 1 on the sides of the hexagon
+            norm = max(ay / h, (ax + ay * r3 / h) / (2 * r3))
+            if best is None or norm < best:
+                best, found = norm, (c, r)
+        c, r = found
+        if not (0 <= c < self.cols and 0 <= r < self.rows):
+            return None
+        return found
+
+    def label_grid(self, x0, y0, x1, y1, ix, iy, separator):
+        # Layout of the labels numbering from ix, iy the hexes from column x0
+        # and row y0 to x1, y1: the (rows, cols) arrays of their centers, the
+        # column number of each column, the separator and the row number of
+        # each row. The label of a hex is its column number, the separator
+        # and its row number. Needs NumPy.
+        cx, cy = self.hex_centers(x0, x1 + 1, y0, y1 + 1)
+        col_tokens = [make_label_tokens(separator, ix + i, 0)[0]
+                      for i in range(x1 + 1 - x0)]
+        row_tokens = [make_label_tokens(separator, 0, iy + j)[2]
+                      for j in range(y1 + 1 - y0)]
+        return cx, cy, col_tokens, separator, row_tokens
+
+    def interior_rect(self):
+        # Part of the image that no hex outside the drawn ranges reaches (the
+        # column before them on the left, the column after them on the right,
+        # the row before them of the odd columns on top and the row after them
+        # of the even columns at the bottom). Inside it the Terrain layer is
+        # periodic, with a period of two columns and one row.
+        c0, c1 = self.hex_cols
+        r0, r1 = self.hex_rows
+        left = self.origin_center_dx - self.hex_w // 2
+        top = self.origin_center_dy - self.hex_h // 2
+        x0 = max(0, left + (c0 - 1) * self.dx + self.hex_w)
+        x1 = min(self.img_w, left + c1 * self.dx)
+        y0 = max(0, top + (r0 - 1) * self.dy + self.odd_col_offset +
+                    self.hex_h)
+        y1 = min(self.img_h, top + r1 * self.dy)
+        return x0, y0, x1, y1
+
+    def hex_outline(self):
+        # Vertices of the hexagon a hex covers in the grid, from its center,
+        # the hexagons of all the hexes tiling the plane. Their sides run
+        # along the gaps left between the blank hexes, that is, along the
+        # lines of the Grid layer.
+        r = self.dx / 3
+        h = self.dy / 2
+        return [(-r, -h), (r, -h), (2 * r, 0), (r, h), (-r, h), (-2 * r, 0)]
+
+    def lgrid_setup(self, scale, ccol, crow, levels=1):
+        # The large grid has hexes of scale x scale hexes, and with levels
+        # above 1 also the grids of scale ** 2, scale ** 3... hexes around
+        # the same center, each with its vertices on those of the one below
+        self.lgrid_scale = scale
+        self.lgrid_ccol = ccol
+        self.lgrid_crow = crow
+        self.lgrid_levels = levels
+
+    def lgrid_scales(self):
+        return [self.lgrid_scale ** n for n in range(1, self.lgrid_levels + 1)]
+
+    def lgrid_hex_dims(self, scale=None):
+        # Side, height and width of the large hexes, in pixels
+        scale = scale or self.lgrid_scale
+        hex_s = scale * self.dx - self.lgrid_corner(scale)
+        return hex_s, scale * self.dy, 2 * hex_s
+
+    def lgrid_corner(self, scale):
+        # Horizontal offset of the top and bottom corners of the large hexes
+        # from their center: a third of the distance between two columns of
+        # them, snapped to a column of vertices of the grid below, so that
+        # all vertices are whole pixels shared by the grids of every level
+        return self.lgrid_corner_column(scale)[0]
+
+    def lgrid_corner_column(self, scale):
+        # lgrid_corner, and the column of the large hexes of the level below,
+        # counted from the one under the center, whose top corner the top
+        # left corner is on, None on the first level
+        step = scale // self.lgrid_scale
+        if step <= 1:
+            return round(scale * self.dx / 3), None
+        inner = self.lgrid_corner(step)
+        width = step * self.dx
+        third = scale * self.dx / 3
+        j = int(third // width)
+        return min(((k * width + s * inner, k) for k in (j, j + 1)
+                    for s in (-1, 1) if k * width + s * inner > 0),
+                   key=lambda corner: abs(corner[0] - third))
+
+    def lgrid_top(self, c, r, scale=None):
+        # Row of pixels of the top side of large hex (c, r), half its height
+        # above its center, snapped on levels above the first to the closest
+        # row of top corners of the column of the level below its top
+        # corners are on, see lgrid_corner_column, so that they are vertices
+        # of that level too. The bottom side, a whole number of heights of
+        # the level below further down, then is as well. c and r may also be
+        # NumPy arrays.
+        scale = scale or self.lgrid_scale
+        h = scale * self.dy
+        top = self.lgrid_hex_center(c, r, scale)[1] - h // 2
+        k = self.lgrid_corner_column(scale)[1]
+        if k is None:
+            return top
+        step = scale // self.lgrid_scale
+        below = self.lgrid_top(c * self.lgrid_scale - k, 0, step)
+        h = step * self.dy
+        return below + (top - below + h // 2) // h * h
+
+    def lgrid_hex_center(self, c, r, scale=None):
+        # c and r may also be NumPy arrays, as in hex_center
+        scale = scale or self.lgrid_scale
+        hex_c = self.lgrid_ccol + c * scale
+        hex_r = self.lgrid_crow + r * scale + (c % 2) * (scale // 2)
+        return self.hex_center(hex_c, hex_r)
+
+    def lgrid_hex_vertices(self, c, r, scale=None):
+        # Vertices of large hex (c, r), clockwise from the top left corner,
+        # all whole pixels: the top and bottom sides run along lgrid_top,
+        # and the left and right vertices are the corners of the hexes of the
+        # next columns that share them. c and r may also be NumPy arrays.
+        scale = scale or self.lgrid_scale
+        a = self.lgrid_corner(scale)
+        b = scale * self.dx - a
+        h = scale * self.dy
+        x = self.lgrid_hex_center(c, r, scale)[0]
+        top = self.lgrid_top(c, r, scale)
+        bottom = top + h
+        # The hexes sharing them are those below the sides of the hex, of
+        # the same row for even columns, as odd columns are lower
+        right = self.lgrid_top(c + 1, r + c % 2, scale)
+        left = self.lgrid_top(c - 1, r + c % 2, scale)
+        return [(x - a, top), (x + a, top), (x + b, right),
+                (x + a, bottom), (x - a, bottom), (x - b, left)]
+
+    def lgrid_vertices(self, c0, c1, r0, r1, scale=None):
+        # Vertices of the large hexes of columns [c0, c1) and rows [r0, r1),
+        # as a (rows, cols, 6, 2) array of x, y. Needs NumPy.
+        vertices = self.lgrid_hex_vertices(np.arange(c0, c1)[None, :],
+                                           np.arange(r0, r1)[:, None], scale)
+        return np.stack([np.stack(np.broadcast_arrays(x, y), axis=-1)
+                         for x, y in vertices], axis=2)
+
+    def lgrid_bounds(self, rect=None):
+        # Pixels the large hexes must reach to be drawn: those of rect, or
+        # else of the image, as x0, y0, x1, y1, last ones excluded
+        x, y, w, h = rect or (0, 0, self.img_w, self.img_h)
+        return max(x, 0), max(y, 0), min(x + w, self.img_w), \
+            min(y + h, self.img_h)
+
+    def lgrid_col_range(self, rect=None, scale=None):
+        # Columns of large hexes, counted from the one centered on ccol,
+        # whose width reaches into the image, or rect. On a tile ccol may lie
+        # outside of it.
+        scale = scale or self.lgrid_scale
+        x0, y0, x1, y1 = self.lgrid_bounds(rect)
+        b = self.lgrid_hex_dims(scale)[0]
+        step = scale * self.dx
+        x = self.hex_center(self.lgrid_ccol, 0)[0]
+        return -((x + b - x0) // step), (x1 - 1 + b - x) // step + 1
+
+    def lgrid_row_range(self, rect=None, scale=None):
+        # Rows of large hexes, counted from the one centered on crow, whose
+        # height reaches into the image, or rect, on even or odd columns
+        scale = scale or self.lgrid_scale
+        x0, y0, x1, y1 = self.lgrid_bounds(rect)
+        h = scale * self.dy
+        first, last = [], []
+        for parity in (0, 1):
+            top = self.lgrid_top(parity, 0, scale)
+            first.append(-((top + h - y0) // h))
+            last.append((y1 - 1 - top) // h + 1)
+        return min(first), max(last)
+
+    def lgrid_polylines(self, rect=None, scales=None):
+        # The large grid, of every level or of the given scales, as a few
+        # long polylines instead of separate sides: the zig-zag right edge
+        # (sides 1 and 2) of every column of large hexes, and a walk along
+        # every row joining its top sides (0). From the top of an odd column
+        # the walk climbs to the top of the next even column along side 2 of
+        # the hex above, retracing it. Only the large hexes reaching into the
+        # image, or rect if given, are walked, and polylines are cut where
+        # they leave it, see clip_polyline.
+        clip = self.clip_bounds(rect)
+        polylines = []
+        for scale in scales or self.lgrid_scales():
+            if np is None:
+                polylines.extend(self.lgrid_polylines_scalar(clip, rect,
+                                                             scale))
+                continue
+            col_min, col_max = self.lgrid_col_range(rect, scale)
+            row_min, row_max = self.lgrid_row_range(rect, scale)
+            if col_max <= col_min or row_max <= row_min:
+                continue
+            # One extra row on top, for the sides borrowed from the hexes
+            # above
+            v = self.lgrid_vertices(col_min, col_max, row_min - 1, row_max,
+                                    scale)
+            col_walks = v[1:, :, 1:4].swapaxes(0, 1)
+            row_walks = v[1:, :, 0:3].copy()
+            odd = np.arange(col_min, col_max) % 2 == 1
+            row_walks[:, odd, 2] = v[:-1, odd, 2]
+            for walks in (col_walks, row_walks):
+                for steps in walks:
+                    polylines.extend(self.clip_polyline_array(
+                        steps.reshape(-1, 2), clip))
+        return polylines
+
+    def clip_bounds(self, rect=None):
+        # Bounds of the segments kept by clip_polyline, those with pixels in
+        # rect, (x, y, width, height), or else in the image
+        x, y, w, h = rect or (0, 0, self.img_w, self.img_h)
+        return x - 1, y - 1, x + w, y + h
+
+    def lgrid_polylines_scalar(self, clip, rect=None, scale=None):
+        # lgrid_polylines for one scale, computed one large hex at a time,
+        # without NumPy
+        col_min, col_max = self.lgrid_col_range(rect, scale)
+        row_min, row_max = self.lgrid_row_range(rect, scale)
+
+        def vertices(c, r):
+            return self.lgrid_hex_vertices(c, r, scale)
+
+        polylines = []
+        for c in range(col_min, col_max):
+            points = []
+            for r in range(row_min, row_max):
+                v = vertices(c, r)
+                points.extend((v[1], v[2], v[3]))
+            polylines.extend(self.clip_polyline(points, clip))
+        for r in range(row_min, row_max):
+            points = []
+            for c in range(col_min, col_max):
+                v = vertices(c, r)
+                if c % 2 == 0:
+                    points.extend((v[0], v[1], v[2]))
+                else:
+                    points.extend((v[0], v[1], vertices(c, r - 1)[2]))
+            polylines.extend(self.clip_polyline(points, clip))
+        return polylines
+
+    def clip_polyline(self, points, clip):
+        # Splits a polyline into the runs of consecutive segments that touch
+        # the clip bounds, from clip_bounds, dropping the segments lying
+        # wholly outside of them
+        x0, y0, x1, y1 = clip
+        runs = []
+        run = []
+        for p, q in zip(points, points[1:]):
+            outside = (max(p[0], q[0]) < x0 or min(p[0], q[0]) > x1 or
+                       max(p[1], q[1]) < y0 or min(p[1], q[1]) > y1)
+            if outside:
+                if run:
+                    runs.append(run)
+                run = []
+            elif run:
+                run.append(q)
+            else:
+                run = [p, q]
+        if run:
+            runs.append(run)
+        return runs
+
+    def clip_polyline_array(self, points, clip):
+        # clip_polyline for an (n, 2) array of points
+        x0, y0, x1, y1 = clip
+        p, q = points[:-1], points[1:]
+        lo, hi = np.minimum(p, q), np.maximum(p, q)
+        inside = ~((hi[:, 0] < x0) | (lo[:, 0] > x1) |
+                   (hi[:, 1] < y0) | (lo[:, 1] > y1))
+        edges = np.diff(np.concatenate(([0], inside.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        return [points[a:b + 1].tolist() for a, b in zip(starts, ends)]
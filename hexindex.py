@@ -0,0 +1,158 @@
+# NAME
+#       hexindex, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Index of the hexes of a map, for other tools to find them on the image
+#       without measuring it: a JSON header with the grid geometry, and two
+#       NumPy .npy files next to it, written without NumPy:
+#
+#           NAME.npy          (rows, cols, 6) int32, for every hex its center
+#                             x, y and the box left, top, right, bottom
+#                             (right and bottom excluded) of the blank hex
+#                             stamped on it
+#           NAME-labels.npy   (rows, cols) byte strings, the label of every
+#                             numbered hex, as written on the Numbers layer,
+#                             empty for the others
+#
+#       The .npy files can be memory-mapped (numpy.load(path, mmap_mode="r"))
+#       or read one hex at a time with HexIndex.record. HexIndex.hex_at finds
+#       the hex under a pixel from the header alone, in constant time. This
+#       module only needs hexgeometry.py.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import array, json, os, struct, sys
+
+from hexgeometry import HexGeometry, HexLayout, make_label
+
+# Version of the index format
+index_version = 1
+
+index_fields = ["x", "y", "left", "top", "right", "bottom"]
+
+def index_paths(path):
+    # The .npy files of the index whose header is path
+    root = os.path.splitext(path)[0]
+    return root + ".npy", root + "-labels.npy"
+
+def npy_header(descr, shape):
+    # Header of a version 1.0 .npy file, padded so that the data starts on
+    # a multiple of 64 bytes
+    header = repr({"descr": descr, "fortran_order": False,
+                   "shape": tuple(shape)})
+    size = 10 + len(header) + 1
+    header += " " * (-size % 64) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + \
+        header.encode("latin1")
+
+def int32_descr():
+    return ("<" if sys.byteorder == "little" else ">") + "i4"
+
+def numbered_range(spec):
+    # Columns and rows of the numbered hexes, as x0, x1, y0, y1 with the
+    # last ones included, and the label of the first one, or None when
+    # there is no numbering
+    if not spec["numbering"]:
+        return None
+    x0, x1 = max(spec["x0"], 0), min(spec["x1"], spec["cols"] - 1)
+    y0, y1 = max(spec["y0"], 0), min(spec["y1"], spec["rows"] - 1)
+    if x0 > x1 or y0 > y1:
+        return None
+    return (x0, x1, y0, y1, spec["ix"] + x0 - spec["x0"],
+            spec["iy"] + y0 - spec["y0"])
+
+def write_index(path, geom, spec):
+    # Writes the index of the map of spec, whose grid is geom (with its
+    # dimensions set), to the header path and the .npy files next to it
+    rows, cols = spec["rows"], spec["cols"]
+    records_path, labels_path = index_paths(path)
+    with open(records_path, "wb") as f:
+        f.write(npy_header(int32_descr(), (rows, cols, len(index_fields))))
+        for r in range(rows):
+            row = array.array("i")
+            for x, y in geom.hex_center_list(0, cols, r, r + 1):
+                left, top = x - geom.hex_w // 2, y - geom.hex_h // 2
+                row.extend((x, y, left, top, left + geom.hex_w,
+                            top + geom.hex_h))
+            f.write(row.tobytes())
+
+    numbered = numbered_range(spec)
+    labels = {}
+    if numbered is not None:
+        x0, x1, y0, y1, ix, iy = numbered
+        for r in range(y0, y1 + 1):
+            for c in range(x0, x1 + 1):
+                labels[c, r] = make_label(spec["separator"], ix + c - x0,
+                                          iy + r - y0).encode("utf-8")
+    width = max([len(label) for label in labels.values()] + [1])
+    with open(labels_path, "wb") as f:
+        f.write(npy_header(f"|S{width}", (rows, cols)))
+        for r in range(rows):
+            f.write(b"".join(labels.get((c, r), b"").ljust(width, b"\0")
+                             for c in range(cols)))
+
+    header = {"version": index_version, "rows": rows, "cols": cols,
+              "width": geom.img_w, "height": geom.img_h,
+              "layout": geom.layout.to_dict(), "fields": index_fields,
+              "byteorder": sys.byteorder,
+              "records": os.path.basename(records_path),
+              "labels": os.path.basename(labels_path),
+              "label_width": width,
+              "numbering": None if numbered is None else {
+                  "x0": numbered[0], "x1": numbered[1],
+                  "y0": numbered[2], "y1": numbered[3],
+                  "ix": numbered[4], "iy": numbered[5],
+                  "separator": spec["separator"]}}
+    with open(path, "w") as f:
+        json.dump(header, f, indent=1)
+
+class HexIndex:
+    def __init__(self, path):
+        # Reads the header of the index written by write_index to path
+        with open(path) as f:
+            self.header = json.load(f)
+        if self.header.get("version") != index_version:
+            raise ValueError(f"{path}: unsupported hex index version")
+        folder = os.path.dirname(path)
+        self.records_path = os.path.join(folder, self.header["records"])
+        self.labels_path = os.path.join(folder, self.header["labels"])
+        self.rows = self.header["rows"]
+        self.cols = self.header["cols"]
+        layout = HexLayout(**self.header["layout"])
+        self.geom = HexGeometry(layout.hex_w, layout.hex_h, layout)
+        self.geom.set_dims(self.rows, self.cols)
+
+    def hex_at(self, x, y):
+        # The (col, row) hex under pixel (x, y), None outside the map
+        return self.geom.hex_at(x, y)
+
+    def label(self, c, r):
+        # Label of hex (c, r), empty when it is not numbered, computed as in
+        # write_index
+        numbering = self.header["numbering"]
+        if (numbering is None or
+                not numbering["x0"] <= c <= numbering["x1"] or
+                not numbering["y0"] <= r <= numbering["y1"]):
+            return ""
+        return make_label(numbering["separator"],
+                          numbering["ix"] + c - numbering["x0"],
+                          numbering["iy"] + r - numbering["y0"])
+
+    def record(self, c, r):
+        # Fields of hex (c, r), as a dict, read from the records file
+        size = 4 * len(index_fields)
+        with open(self.records_path, "rb") as f:
+            f.seek(npy_data_offset(f) + (r * self.cols + c) * size)
+            values = array.array("i", f.read(size))
+        if self.header["byteorder"] != sys.byteorder:
+            values.byteswap()
+        return dict(zip(index_fields, values))
+
+def npy_data_offset(f):
+    # Offset of the data of the .npy file f, of version 1.0
+    f.seek(0)
+    magic = f.read(10)
+    if magic[:6] != b"\x93NUMPY":
+        raise ValueError("Not a .npy file")
+    return 10 + struct.unpack("<H", magic[8:10])[0]
@@ -87,84 +87,631 @@ import gi, math
 gi.require_version("Gimp", "3.0")
 gi.require_version("GimpUi", "3.0")
 from gi.repository import Gimp, Gegl, GimpUi, Gtk, Gdk, GLib, Babl, GObject
-import sys
+from gi.repository import Gio
+import json, os, sys
+
+from hexgeometry import (HexGeometry, HexLayout, formula_layout, make_label,
+                         map_tiles, mask_layout)
+from hexbrushes import BrushCache
+import hexfill, hexindex, hexpreview, hexprofile, hexprogress, hexsvg
+import hextemplates, hextiles
+
+try:
+    import hexraster, hexsprites
+except ImportError:
+    # NumPy is not available, the raster drawing mode and the label sprites
+    # are disabled
+    hexraster = hexsprites = None
 
 new_hexmap = "plug-in-hexgimp"
-
-class HexGrid:
-    def __init__(self, blank_hex_brush):
-        # These expressions where derived from the original hexgimp scheme code
-        # and work fine for hexgimp's brushes, where:
-        #
-        # hex_w = 36 -- width of the blank hex       --> even and multiple of 4
-        # hex_h = 31 -- height of the blank hex      --> odd
-        # dx    = 28 -- distance between hex columns
-        # dy    = 15 -- distance between hex rows
-        #
-        # The code might need to be addapted to work with other brushes,
-        # probably making adjustments in cases where hex_w is odd and/or hex_h
-        # even.
+batch_hexmap = "plug-in-hexgimp-batch"
+extend_hexmap = "plug-in-hexgimp-extend"
+regenerate_hexmap = "plug-in-hexgimp-regenerate"
+tiles_hexmap = "plug-in-hexgimp-tiles"
+fill_hexmap = "plug-in-hexgimp-fill"
+index_hexmap = "plug-in-hexgimp-index"
+
+# Image parasite keeping the settings a map was created with, as JSON, and the
+# version of its contents
+spec_parasite = "hexmap4gimp-spec"
+spec_version = 1
+
+# Modes for HexGrid.draw: stamp the blank hex once per hex with the pencil,
+# stamp a seed block and tile its two-column period over the Terrain buffer,
+# or rasterize the Terrain and Grid layers with NumPy and upload them. The
+# parallel mode rasterizes them, and the labels, in worker processes.
+draw_loop = "loop"
+draw_tiled = "tiled"
+draw_raster = "raster"
+draw_parallel = "parallel"
+raster_modes = (draw_raster, draw_parallel)
+
+# Worker processes of the parallel mode, None for one per CPU, and the bands
+# each of them gets, at least, to balance the work
+parallel_workers = None
+parallel_bands_per_worker = 4
+
+# Pixel format used to move layer data through Gegl buffers
+pixel_format = "R'G'B'A u8"
+
+# Largest buffer, in bytes, uploaded to a layer at once by the raster mode
+raster_band_bytes = 256 * 1024 * 1024
+
+# Brush stamps composited at once when filling hexes from a file, see
+# HexGrid.fill_hexes
+fill_chunk = 1024
+
+# Color of the gaps between hexes on the Grid layer
+grid_rgba = (150, 150, 150, 255)
+
+# Cache of brush sizes, in GIMP's configuration folder, see hexbrushes.py
+brush_cache_file = "hexmap4gimp-brushes.json"
+brush_cache = None
+
+# Warnings of the blank hex brushes whose mask gave no layout, by name, laid
+# out as the HexGimp brushes instead, see brush_layout
+layout_fallbacks = {}
+
+# Cache of label sprites, in GIMP's configuration folder, see hexsprites.py,
+# and the bytes its sprites may take, unless the environment variable sets
+# them, in MB, see label_cache_budget
+label_cache_file = "hexmap4gimp-labels.npz"
+label_cache_bytes = 4 * 1024 * 1024
+label_cache_env = "HEXMAP4GIMP_LABEL_CACHE_MB"
+label_cache = None
+
+# Cache of finished maps, a folder in GIMP's configuration folder, see
+# hextemplates.py, and the bytes its files may take, 0 to disable it
+template_cache_dir = "hexmap4gimp-templates"
+template_cache_bytes = 256 * 1024 * 1024
+template_cache = None
+
+# Version of the drawing of the maps, part of the template keys. Raise it
+# when a change draws the same settings differently, so that the maps
+# cached before are made again.
+drawing_version = 1
+
+# Font, size and color of the hex labels
+labels_font = "Sans-serif"
+labels_font_size = 7
+labels_color = "#646464"
+
+# Instrumentation of the map creation, see hexprofile.py. The counter of GIMP
+# calls is only set up when it is enabled.
+profiler = hexprofile.Profiler()
+gimp_calls = None
+
+# Progress of the map creation, see hexprogress.py, only reported by the
+# procedures creating maps, and the least number of chunks a layer is drawn
+# in, so that the progress moves, and the work can be stopped, between them
+progress = hexprogress.Progress()
+progress_chunks = 16
+
+# Milliseconds the dialog waits after a keystroke before checking the brush,
+# and after a change of the settings before redrawing the preview
+brush_check_delay = 250
+preview_delay = 150
+# Size, in pixels, of the preview of the map in the dialog
+preview_size = 320
+
+def write_pixels(layer, x, y, pixels):
+    h, w = pixels.shape[:2]
+    buffer = layer.get_buffer()
+    buffer.set(Gegl.Rectangle.new(x, y, w, h), pixel_format, pixels.tobytes())
+    buffer.flush()
+    layer.update(x, y, w, h)
+
+def read_pixels(layer, x, y, w, h):
+    data = layer.get_buffer().get(Gegl.Rectangle.new(x, y, w, h), 1.0,
+                                  pixel_format, Gegl.AbyssPolicy.NONE)
+    return hexraster.rgba_array(data, w, h)
+
+def brush_dirs():
+    # Folders GIMP loads brushes from, as set in its brush-path setting
+    path = Gimp.gimprc_query("brush-path")
+    if not path:
+        path = os.pathsep.join(["${gimp_dir}/brushes",
+                                "${gimp_data_dir}/brushes"])
+    folders = {"${gimp_dir}": Gimp.directory,
+               "${gimp_data_dir}": Gimp.data_directory,
+               "${gimp_sysconf_dir}": Gimp.sysconf_directory,
+               "${gimp_plug_in_dir}": Gimp.plug_in_directory}
+    dirs = []
+    for folder in path.split(os.pathsep):
+        for var, get_folder in folders.items():
+            if var in folder:
+                folder = folder.replace(var, get_folder())
+        dirs.append(os.path.expanduser(folder.strip().strip('"')))
+    return dirs
+
+def open_brush_cache():
+    global brush_cache
+    if brush_cache is None:
+        brush_cache = BrushCache(os.path.join(Gimp.directory(),
+                                              brush_cache_file), brush_dirs)
+    return brush_cache
+
+def brush_size(name):
+    # Width and height of a brush, from the brush cache or else from GIMP,
+    # None when the brush does not exist
+    size = open_brush_cache().lookup(name)
+    if size is None:
+        brush = Gimp.Brush.get_by_name(name)
+        if brush is None:
+            return None
+        ok, w, h, mask_bpp, color_bpp = brush.get_info()
+        size = w, h
+    return size
+
+def brush_layout(name):
+    # Tiling table of a blank hex brush, see hexgeometry.HexLayout, from the
+    # brush cache or else derived from the mask GIMP gives, None when the
+    # brush does not exist. When the mask is not a hex, or does not tile as
+    # a hex grid, the brush is laid out as the HexGimp ones, formula_layout,
+    # with a warning the first time, see layout_fallbacks.
+    try:
+        layout = open_brush_cache().layout(name)
+        if layout is None:
+            brush = Gimp.Brush.get_by_name(name)
+            if brush is None:
+                return None
+            ok, w, h, mask_bpp, mask, color_bpp, color = brush.get_pixels()
+            if hasattr(mask, "get_data"):
+                mask = mask.get_data()
+            layout = mask_layout(w, h, bytes(mask), mask_bpp)
+    except ValueError as error:
+        warning = f"{error}, it is laid out as the HexGimp brushes"
+        if layout_fallbacks.get(name) != warning:
+            layout_fallbacks[name] = warning
+            Gimp.message(f"HexMap4Gimp: {warning}")
+        layout = formula_layout(*brush_size(name))
+    return layout
+
+def start_profile(target=""):
+    # Starts the instrumentation if target, or else the environment variable
+    # of hexprofile, tells where to report it (a file, or "console"). Returns
+    # that target, empty when disabled.
+    global profiler, gimp_calls
+    target = target or os.environ.get(hexprofile.profile_env, "")
+    if not target:
+        profiler = hexprofile.Profiler()
+        return ""
+    if gimp_calls is None:
+        gimp_calls = hexprofile.CallCounter()
+        gimp_calls.wrap_module(Gimp)
+    profiler = hexprofile.Profiler(True, gimp_calls)
+    return target
+
+def cache_stats():
+    # Hits, misses and evictions of the caches opened so far
+    stats = {}
+    if label_cache is not None:
+        stats["label_cache"] = label_cache.stats()
+    if template_cache is not None:
+        stats["template_cache"] = template_cache.stats()
+    return stats
+
+def report_profile(target, **info):
+    # Reports the measures started by start_profile, and the use of the
+    # caches, as a JSON line
+    if not target:
+        return
+    line = hexprofile.results_line(profiler.results(**info,
+                                                    caches=cache_stats()))
+    if target == "console":
+        Gimp.message(line)
+        return
+    try:
+        hexprofile.append_line(target, line)
+    except OSError as error:
+        Gimp.message(f"HexMap4Gimp could not write its profile: {error}")
+
+def start_progress(text, window=None):
+    # Reports the progress on GIMP's progress bar, and on window, a
+    # ProgressWindow, whose Cancel button stops the work
+    global progress
+    Gimp.progress_init(text)
+    shown = {"text": text}
+
+    def report(fraction, text):
+        if text and text != shown["text"]:
+            Gimp.progress_set_text(text)
+            shown["text"] = text
+        Gimp.progress_update(fraction)
+        if window is not None:
+            window.set_progress(fraction, text)
+
+    progress = hexprogress.Progress(report, window and window.poll)
+
+def end_progress(window=None):
+    global progress
+    progress = hexprogress.Progress()
+    Gimp.progress_end()
+    if window is not None:
+        window.destroy()
+
+def label_cache_budget():
+    # Bytes the label sprites may take, label_cache_bytes unless set, in MB,
+    # by the label_cache_env variable. Values that are not a number of MB
+    # are ignored with a warning.
+    value = os.environ.get(label_cache_env, "").strip()
+    if not value:
+        return label_cache_bytes
+    try:
+        megabytes = float(value)
+        if not megabytes >= 0:
+            raise ValueError(value)
+    except ValueError:
+        Gimp.message(f"HexMap4Gimp: {label_cache_env} is not a number of "
+                     f"MB: {value!r}, the label cache keeps its default "
+                     f"{label_cache_bytes} bytes")
+        return label_cache_bytes
+    return int(megabytes * 1024 * 1024)
+
+def label_sprite_cache():
+    global label_cache
+    if label_cache is None:
+        label_cache = hexsprites.SpriteCache(
+            os.path.join(Gimp.directory(), label_cache_file),
+            label_cache_budget())
+    return label_cache
+
+def open_template_cache():
+    global template_cache
+    if template_cache is None and template_cache_bytes > 0:
+        template_cache = hextemplates.TemplateCache(
+            os.path.join(Gimp.directory(), template_cache_dir),
+            template_cache_bytes)
+    return template_cache
+
+def brush_arrays(brush):
+    # Mask and colors of a brush as NumPy arrays
+    ok, w, h, mask_bpp, mask, color_bpp, color = brush.get_pixels()
+    if hasattr(mask, "get_data"):
+        mask = mask.get_data()
+    if hasattr(color, "get_data"):
+        color = color.get_data()
+    return hexraster.brush_arrays(w, h, mask_bpp, mask, color_bpp, color)
+
+class HexGrid(HexGeometry):
+    def __init__(self, blank_hex_brush, size=None, layout=None):
+        # size is the (width, height) of the brush when already known, and
+        # layout its tiling table, see HexLayout
+        if size is None:
+            ok, hex_w, hex_h, mask_bpp, color_bpp = blank_hex_brush.get_info()
+        else:
+            hex_w, hex_h = size
+        super().__init__(hex_w, hex_h, layout)
         self.blank_hex_brush = blank_hex_brush
-        ok, hex_w, hex_h, mask_bpp, color_bpp = blank_hex_brush.get_info()
-        self.hex_w = hex_w
-        self.hex_h = hex_h
-        self.dx = (hex_w + 2) * 3 // 4 + 1
-        self.dy = hex_h + 1
-        self.odd_col_offset = hex_h // 2 + 1
-        self.origin_center_dx = 1 + hex_w // 2
-        self.origin_center_dy = 1 + hex_h // 2
-        self.gimp_grid_x = self.dx
-        self.gimp_grid_y = self.odd_col_offset
-
-    def hex_center(self, c, r):
-        x0 = c * self.dx
-        y0 = r * self.dy
-        if c % 2 != 0:
-            y0 += self.odd_col_offset 
-        return x0 + self.origin_center_dx, y0 + self.origin_center_dy
-
-    def set_dims(self, rows, cols):
-        self.rows = rows
-        self.cols = cols
-        self.img_w = self.dx * cols + (self.hex_w + 2) // 4
-        self.img_h = self.dy * rows + 1 + self.odd_col_offset
-        return self.img_w, self.img_h 
-
-    def draw(self, img):
+
+    def stamp(self, layer, centers):
+        for x, y in progress.chunks(centers):
+            Gimp.pencil(layer, [x, y])
+
+    def stamp_loop(self, layer):
+        self.stamp(layer, self.hex_center_list(*self.hex_cols,
+                                               *self.hex_rows))
+
+    def stamp_tiled(self, layer):
+        # Stamps only the hexes touching the image border, plus a seed block
+        # holding one full period, and then copies that period over the
+        # interior of the layer, one period-high band per Gegl buffer write.
+        # Falls back to the loop when the map is too small for this to pay.
+        x0, y0, x1, y1 = self.interior_rect()
+        tile_w = 2 * self.dx
+        tile_h = self.dy
+        if x1 - x0 < tile_w or y1 - y0 < tile_h:
+            self.stamp_loop(layer)
+            return
+
+        hexes = set()
+        cols = range(*self.hex_cols)
+        rows = range(*self.hex_rows)
+        for c0, c1 in (self.col_range_in(0, x0),
+                       self.col_range_in(x1, self.img_w)):
+            hexes.update((c, r) for c in range(c0, c1) for r in rows)
+        for r0, r1 in (self.row_range_in(0, y0),
+                       self.row_range_in(y1, self.img_h)):
+            hexes.update((c, r) for c in cols for r in range(r0, r1))
+        c0, c1 = self.col_range_in(x0, x0 + tile_w)
+        r0, r1 = self.row_range_in(y0, y0 + tile_h)
+        hexes.update((c, r) for c in range(c0, c1) for r in range(r0, r1))
+        if len(hexes) >= len(rows) * len(cols):
+            self.stamp_loop(layer)
+            return
+        hexes = sorted(hexes, key=lambda h: (h[1], h[0]))
+        part = progress.parts([("stamp", len(hexes)),
+                               ("copy", (x1 - x0) * (y1 - y0) // tile_w)])
+        with part("stamp"):
+            self.stamp(layer, self.hex_centers_of(hexes))
+
+        buffer = layer.get_buffer()
+        tile = buffer.get(Gegl.Rectangle.new(x0, y0, tile_w, tile_h), 1.0,
+                          pixel_format, Gegl.AbyssPolicy.NONE)
+        width = x1 - x0
+        row_bytes = tile_w * 4
+        reps = -(-width // tile_w)
+        band = b"".join(
+            (tile[j * row_bytes:(j + 1) * row_bytes] * reps)[:width * 4]
+            for j in range(tile_h))
+        with part("copy"):
+            bands = range(y0, y1, tile_h)
+            for y in progress.chunks(bands, len(bands)):
+                h = min(tile_h, y1 - y)
+                buffer.set(Gegl.Rectangle.new(x0, y, width, h), pixel_format,
+                           band[:h * width * 4])
+        buffer.flush()
+        layer.update(x0, y0, width, y1 - y0)
+
+    def raster_bands(self, rect=None, bands=1):
+        # Splits rect, or the image, in bands of rows of bounded size, and at
+        # least the given number of them when it has enough rows
+        x, y, w, h = rect or (0, 0, self.img_w, self.img_h)
+        band_h = max(1, raster_band_bytes // (4 * max(1, w)))
+        band_h = max(1, min(band_h, -(-h // bands)))
+        for band_y in range(y, y + h, band_h):
+            yield x, band_y, w, min(band_h, y + h - band_y)
+
+    def draw_raster(self, terrain_layer, grid_layer):
+        # Both layers are computed from the brush mask in one pass, without
+        # stamping or selecting, and uploaded in bands of bounded size
+        mask, color = brush_arrays(self.blank_hex_brush)
+        for rect in progress.chunks(self.raster_bands(None,
+                                                      progress_chunks)):
+            terrain, gap = hexraster.grid_masks(self, mask, color, rect)
+            write_pixels(terrain_layer, rect[0], rect[1], terrain)
+            write_pixels(grid_layer, rect[0], rect[1],
+                         hexraster.fill_mask(gap, grid_rgba))
+
+    def draw(self, img, mode=draw_tiled):
+        terrain_layer = img.get_layer_by_name("Terrain")
+        grid_layer = img.get_layer_by_name("Grid")
+        grid_layer.set_mode(Gimp.LayerMode.MULTIPLY)
+        grid_layer.set_opacity(75)
+        if mode in raster_modes:
+            if hexraster is not None:
+                with profiler.phase("raster"):
+                    self.draw_raster(terrain_layer, grid_layer)
+                return
+            mode = draw_tiled
+
         Gimp.context_push()
         Gimp.context_set_brush(self.blank_hex_brush)
+        part = progress.parts([("stamp", 9), ("select and fill", 1)])
+        with profiler.phase("stamp"), part("stamp"):
+            if mode == draw_tiled:
+                self.stamp_tiled(terrain_layer)
+            else:
+                self.stamp_loop(terrain_layer)
+
+        with profiler.phase("select and fill"), part("select and fill"):
+            grid_color = Gegl.Color.new("#969696")
+            Gimp.context_set_foreground(grid_color)
+            terrain_blank_color = Gegl.Color.new("#ffffff")
+            img.select_color(Gimp.ChannelOps.REPLACE,
+                             terrain_layer,
+                             terrain_blank_color)
+            Gimp.Selection.invert(img)
+            grid_layer.edit_fill(Gimp.FillType.FOREGROUND)
+            Gimp.Selection.none(img)
+        Gimp.context_pop()
+
+    def draw_extension(self, img, bands, mode=draw_tiled):
+        # Draws the hexes added to a grown map, given as bands by
+        # extension_bands: the blank hexes added on the Terrain layer, keeping
+        # whatever is painted around them, and the whole band of the Grid
+        # layer. The gaps are found from the grid geometry, or by stamping the
+        # band on a scratch layer, as the Terrain layer may be painted.
         terrain_layer = img.get_layer_by_name("Terrain")
-        for r in range(self.rows):
-            for c in range(self.cols):
-                x, y = self.hex_center(c, r)
-                Gimp.pencil(terrain_layer, [x, y])
+        grid_layer = img.get_layer_by_name("Grid")
+        if mode in raster_modes and hexraster is not None:
+            mask, color = brush_arrays(self.blank_hex_brush)
+            added = HexGeometry(self.hex_w, self.hex_h, self.layout)
+            added.set_dims(self.rows, self.cols)
+            for band, hexes in bands:
+                for rect in self.raster_bands(band):
+                    x, y, w, h = rect
+                    terrain, gap = hexraster.grid_masks(self, mask, color,
+                                                        rect)
+                    pixels = read_pixels(terrain_layer, x, y, w, h).copy()
+                    # Added hexes of one band may reach into the other
+                    for other_band, added_hexes in bands:
+                        added.set_hex_ranges(*added_hexes)
+                        blank, added_gap = hexraster.grid_masks(
+                            added, mask, color, rect)
+                        stamped = blank[..., 3] != 0
+                        pixels[stamped] = blank[stamped]
+                    write_pixels(terrain_layer, x, y, pixels)
+                    write_pixels(grid_layer, x, y,
+                                 hexraster.fill_mask(gap, grid_rgba))
+            return
 
-        grid_color = Gegl.Color.new("#969696")
-        Gimp.context_set_foreground(grid_color)
+        Gimp.context_push()
+        Gimp.context_set_brush(self.blank_hex_brush)
+        scratch = Gimp.Layer.new(img, "Scratch", self.img_w, self.img_h,
+                                 Gimp.ImageType.RGBA_IMAGE, 100,
+                                 Gimp.LayerMode.NORMAL)
+        img.insert_layer(scratch, None, 0)
+        for band, (c0, c1, r0, r1) in bands:
+            self.stamp(terrain_layer, self.hex_center_list(c0, c1, r0, r1))
+            c0, c1, r0, r1 = self.hexes_in_rect(band)
+            self.stamp(scratch, self.hex_center_list(c0, c1, r0, r1))
+
+        Gimp.context_set_foreground(Gegl.Color.new("#969696"))
         terrain_blank_color = Gegl.Color.new("#ffffff")
-        img.select_color(Gimp.ChannelOps.REPLACE,
-                         terrain_layer,
-                         terrain_blank_color)
-        Gimp.Selection.invert(img)
+        for band, hexes in bands:
+            img.select_rectangle(Gimp.ChannelOps.REPLACE, *band)
+            grid_layer.edit_clear()
+            img.select_color(Gimp.ChannelOps.REPLACE, scratch,
+                             terrain_blank_color)
+            Gimp.Selection.invert(img)
+            img.select_rectangle(Gimp.ChannelOps.INTERSECT, *band)
+            grid_layer.edit_fill(Gimp.FillType.FOREGROUND)
+        Gimp.Selection.none(img)
+        img.remove_layer(scratch)
+        Gimp.context_pop()
+
+    def redraw_grid(self, img, mode=draw_tiled):
+        # Draws the Grid layer again leaving the Terrain layer, which may be
+        # painted, untouched: the gaps are found from the grid geometry, or
+        # from the blank hexes stamped on a scratch layer
         grid_layer = img.get_layer_by_name("Grid")
-        grid_layer.set_mode(Gimp.LayerMode.MULTIPLY)
-        grid_layer.set_opacity(75)
+        if mode in raster_modes and hexraster is not None:
+            mask, color = brush_arrays(self.blank_hex_brush)
+            for rect in self.raster_bands():
+                terrain, gap = hexraster.grid_masks(self, mask, color, rect)
+                write_pixels(grid_layer, rect[0], rect[1],
+                             hexraster.fill_mask(gap, grid_rgba))
+            return
+
+        Gimp.context_push()
+        Gimp.context_set_brush(self.blank_hex_brush)
+        scratch = Gimp.Layer.new(img, "Scratch", self.img_w, self.img_h,
+                                 Gimp.ImageType.RGBA_IMAGE, 100,
+                                 Gimp.LayerMode.NORMAL)
+        img.insert_layer(scratch, None, 0)
+        if mode == draw_loop:
+            self.stamp_loop(scratch)
+        else:
+            self.stamp_tiled(scratch)
+
+        Gimp.Selection.none(img)
+        grid_layer.edit_clear()
+        Gimp.context_set_foreground(Gegl.Color.new("#969696"))
+        img.select_color(Gimp.ChannelOps.REPLACE, scratch,
+                         Gegl.Color.new("#ffffff"))
+        Gimp.Selection.invert(img)
         grid_layer.edit_fill(Gimp.FillType.FOREGROUND)
         Gimp.Selection.none(img)
+        img.remove_layer(scratch)
         Gimp.context_pop()
 
-    def draw_labels(self, img, x0, y0, x1, y1, ix, iy, separator):
-        def make_label(coord_separator, x, y):
-            return f"{x:02d}{coord_separator}{y:02d}"
+    def draw_labels(self, img, x0, y0, x1, y1, ix, iy, separator,
+                    over=False):
+        # The labels are written on the Numbers layer in bands covering them,
+        # composited over what the layer had when over is set
+        if hexraster is None:
+            self.draw_labels_merged(img, x0, y0, x1, y1, ix, iy, separator)
+            return
+
+        labels = self.label_placements(img, x0, y0, x1, y1, ix, iy,
+                                       separator)
+        if labels is None:
+            return
+        placements, sprites, rect = labels
+        numbers_layer = img.get_layer_by_name("Numbers")
+        for band in progress.chunks(self.raster_bands(rect,
+                                                      progress_chunks)):
+            pixels = hexraster.compose_labels(placements, sprites, band)
+            if over:
+                pixels = hexraster.over(pixels,
+                                        read_pixels(numbers_layer, *band))
+            write_pixels(numbers_layer, band[0], band[1], pixels)
+
+    def label_placements(self, img, x0, y0, x1, y1, ix, iy, separator):
+        # Placements and sprites of the labels, see hexraster, and the part
+        # of the image they cover, or None when none is in the image
+        layout = self.label_grid(x0, y0, x1, y1, ix, iy, separator)
+        cx, cy, col_tokens, separator, row_tokens = layout
+        tokens = set(col_tokens) | set(row_tokens) | {separator}
+        tokens.discard("")
+        sprites = self.label_sprites(img, tokens)
+
+        widths = {t: sprite.shape[1] for t, sprite in sprites.items()}
+        placements = hexraster.label_placements(self, layout, widths)
+        if not placements:
+            return None
+        x, y, w, h = hexraster.placements_rect(placements, sprites)
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.img_w, x + w), min(self.img_h, y + h)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return placements, sprites, (x0, y0, x1 - x0, y1 - y0)
+
+    def draw_parallel(self, img, labels_window=None, large_grid=False):
+        # Draws the Terrain and Grid layers, and the labels of labels_window
+        # (arguments of draw_labels), as the raster mode, but rendering them
+        # in bands in worker processes. The bands are uploaded as they are
+        # finished, and the large grid is drawn, if asked, in the meantime.
+        terrain_layer = img.get_layer_by_name("Terrain")
+        grid_layer = img.get_layer_by_name("Grid")
+        grid_layer.set_mode(Gimp.LayerMode.MULTIPLY)
+        grid_layer.set_opacity(75)
+        workers = parallel_workers or os.cpu_count() or 1
+        bands = workers * parallel_bands_per_worker
+        mask, color = brush_arrays(self.blank_hex_brush)
+        state = {"grid": self.geometry(), "mask": mask, "color": color,
+                 "grid_rgba": grid_rgba}
+        tasks = [("grid", rect) for rect in self.raster_bands(None, bands)]
+        if labels_window is not None:
+            labels = self.label_placements(img, *labels_window)
+            if labels is not None:
+                placements, sprites, rect = labels
+                state.update(placements=placements, sprites=sprites)
+                tasks += [("labels", band)
+                          for band in self.raster_bands(rect, bands)]
+
+        numbers_layer = img.get_layer_by_name("Numbers")
+        part = progress.parts([("large grid", large_grid),
+                               ("bands", 10)])
+        with hexraster.render_pool(workers, state) as pool:
+            results = pool.imap(hexraster.render_band, tasks)
+            if large_grid:
+                with part("large grid"):
+                    self.draw_large_grid(img)
+            with part("bands"):
+                for kind, (x, y, w, h), pixels in progress.chunks(
+                        results, len(tasks)):
+                    if kind == "grid":
+                        write_pixels(terrain_layer, x, y, pixels[0])
+                        write_pixels(grid_layer, x, y, pixels[1])
+                    else:
+                        write_pixels(numbers_layer, x, y, pixels[0])
+
+    def label_sprites(self, img, tokens):
+        # Pixels of every token, from the label cache, or rendered once as a
+        # text layer when not cached yet
+        cache = label_sprite_cache()
+        sprites = {}
+        missing = []
+        for token in tokens:
+            key = hexsprites.sprite_key(labels_font, labels_font_size,
+                                        labels_color, token)
+            sprites[token] = cache.lookup(key)
+            if sprites[token] is None:
+                missing.append((token, key))
+        if not missing:
+            return sprites
+
+        Gimp.context_push()
+        font = Gimp.Font.get_by_name(labels_font)
+        Gimp.context_set_foreground(Gegl.Color.new(labels_color))
+        with profiler.phase("render"):
+            for token, key in missing:
+                text_layer = Gimp.TextLayer.new(img,
+                                                token,
+                                                font,
+                                                labels_font_size,
+                                                Gimp.Unit.pixel())
+                img.insert_layer(text_layer, None, 0)
+                w, h = text_layer.get_width(), text_layer.get_height()
+                sprites[token] = read_pixels(text_layer, 0, 0, w, h)
+                img.remove_layer(text_layer)
+                cache.store(key, sprites[token])
+        Gimp.context_pop()
+        cache.save()
+        return sprites
 
+    def draw_labels_merged(self, img, x0, y0, x1, y1, ix, iy, separator):
+        # One text layer per label, merged down on the Numbers layer
         Gimp.context_push()
-        font = Gimp.Font.get_by_name("Sans-serif")
-        font_size = 7
-        labels_color = Gegl.Color.new("#646464")
-        Gimp.context_set_foreground(labels_color) # for 100, 100, 100
-        for r in range(y0, y1 + 1):
+        font = Gimp.Font.get_by_name(labels_font)
+        font_size = labels_font_size
+        Gimp.context_set_foreground(Gegl.Color.new(labels_color))
+        centers = iter(self.hex_center_list(x0, x1 + 1, y0, y1 + 1))
+        for r in progress.chunks(range(y0, y1 + 1)):
             for c in range(x0, x1 + 1):
-                cx, cy = self.hex_center(c, r)
+                cx, cy = next(centers)
                 label = make_label(separator, ix + (c - x0), iy + (r - y0))
                 text_layer = Gimp.TextLayer.new(img,
                                                 label,
@@ -182,37 +729,48 @@ class HexGrid:
         img.grid_set_offset(self.origin_center_dx, 0)
         img.grid_set_style(Gimp.GridStyle.DOTS)
 
-    def lgrid_setup(self, scale, ccol, crow):
-        self.lgrid_scale = scale
-        self.lgrid_ccol = ccol
-        self.lgrid_crow = crow
-
-    def lgrid_hex_dims(self):
-        hex_h = (self.hex_h + 1) * self.lgrid_scale
-        hex_w = (self.hex_w + 2) * self.lgrid_scale + self.lgrid_scale / 2
-        hex_s = hex_w / 2
-        return hex_s, hex_h, hex_w
-
-    def lgrid_hex_center(self, c, r):
-        hex_c = self.lgrid_ccol +  c*self.lgrid_scale
-        hex_r = self.lgrid_crow + r*self.lgrid_scale
-        if c % 2 != 0:
-            hex_r = hex_r + self.lgrid_scale // 2
-        return self.hex_center(hex_c, hex_r)
-
-    def lgrid_row_range(self):
-        crow = self.lgrid_crow
-        scale = self.lgrid_scale
-        rows = 2 + max(crow // scale , (self.rows - crow) // scale)
-        return -rows, rows
-
-    def lgrid_col_range(self):
-        ccol = self.lgrid_ccol
-        scale = self.lgrid_scale
-        cols = 2 + max(ccol // scale , (self.cols - ccol) // scale)
-        return -cols, cols
-
-    def draw_large_grid(self, img):
+    def fill_hexes(self, layer, brushes, groups):
+        # Paints every brush of brushes, by name, on its hexes in groups, as
+        # given by hexfill.read_fill, brush after brush. Color brushes are
+        # composited with NumPy as the pencil stamps them centered on the
+        # hexes, in bands of the part of the layer they cover. Plain mask
+        # brushes, painted with the foreground color, are stamped with the
+        # pencil, the brush set once for all its hexes.
+        stamped = {}
+        if hexraster is not None:
+            for name, hexes in groups.items():
+                mask, color = brush_arrays(brushes[name])
+                if color is not None:
+                    h, w = mask.shape
+                    stamped[name] = (hexraster.brush_pixels(mask, color),
+                                     hexraster.painted(mask),
+                                     *hexraster.stamp_origins(self, hexes,
+                                                              w, h))
+        if stamped:
+            x, y, w, h = hexraster.stamps_rect(stamped.values())
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(self.img_w, x + w), min(self.img_h, y + h)
+            bands = self.raster_bands((x0, y0, x1 - x0, y1 - y0)) \
+                if x0 < x1 and y0 < y1 else []
+            for rect in bands:
+                x, y, w, h = rect
+                pixels = read_pixels(layer, x, y, w, h).copy()
+                for src, mask, xs, ys in stamped.values():
+                    hexraster.stamp_rect(pixels, rect, src, mask, xs, ys,
+                                         fill_chunk)
+                write_pixels(layer, x, y, pixels)
+
+        Gimp.context_push()
+        for name, hexes in groups.items():
+            if name in stamped:
+                continue
+            Gimp.context_set_brush(brushes[name])
+            self.stamp(layer, self.hex_centers_of(list(zip(hexes[0::2],
+                                                           hexes[1::2]))))
+        Gimp.context_pop()
+
+    def draw_large_grid(self, img, rects=None):
+        # With rects, only the sides crossing them are drawn
         Gimp.context_push()
         pixel_brush = Gimp.Brush.get_by_name("1. Pixel")
         Gimp.context_set_brush(pixel_brush)
@@ -223,35 +781,54 @@ class HexGrid:
         layer.set_mode(Gimp.LayerMode.MULTIPLY)
         layer.set_opacity(75)
 
-        hex_s, hex_h, hex_w = self.lgrid_hex_dims()
-        # Hex vertices offsets from the center of the hex
-        vert_offsets = [
-            (-hex_s/2, -hex_h/2),
-            ( hex_s/2, -hex_h/2),
-            ( hex_s  ,     0   ),
-            ( hex_s/2,  hex_h/2),
-            (-hex_s/2,  hex_h/2),
-            (-hex_s  ,     0   ),
-        ]
-
-        # Draw the grid, centered on column ccol and row crow
-        col_min, col_max = self.lgrid_col_range()
-        row_min, row_max = self.lgrid_row_range()
-        for c in range(col_min, col_max):
-            for r in range(row_min, row_max):
-                cx, cy = self.lgrid_hex_center(c, r)
-                sides = [0, 1, 2] # always drawn
-                if r == row_min:
-                    sides.append(3) # upper side only on first row
-                if c == col_min:
-                    sides.extend([4,5]) # left sides only on first column
-                for i in sides:
-                    v1 = vert_offsets[i]
-                    v2 = vert_offsets[(i + 1) % 6]
-                    side = [cx + v1[0], cy + v1[1], cx + v2[0], cy + v2[1]]
-                    Gimp.pencil(layer, side)
+        # Draw the grid, centered on column ccol and row crow, with one
+        # pencil stroke per polyline, the grids of all levels in one go
+        polylines = [points for rect in rects or [None]
+                     for points in self.lgrid_polylines(rect)]
+        for points in progress.chunks(polylines):
+            Gimp.pencil(layer, [coord for point in points for coord in point])
         Gimp.context_pop()
 
+class ProgressWindow(Gtk.Window):
+    # Progress of the maps being created, with a Cancel button. GTK events
+    # are handled when the progress is polled, between chunks of the work.
+    def __init__(self, title):
+        super().__init__(title=title)
+        self.cancelled = False
+        self.set_default_size(320, -1)
+        self.set_resizable(False)
+        self.get_style_context().add_class("gimp-dialog")
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        vbox.set_margin_top(6)
+        vbox.set_margin_bottom(6)
+        vbox.set_margin_start(6)
+        vbox.set_margin_end(6)
+        self.add(vbox)
+        self.bar = Gtk.ProgressBar(show_text=True)
+        vbox.pack_start(self.bar, False, False, 0)
+        button = Gtk.Button(label="Cancel")
+        button.set_halign(Gtk.Align.END)
+        button.connect("clicked", self.on_cancel)
+        vbox.pack_start(button, False, False, 0)
+        self.connect("delete-event", self.on_cancel)
+        self.show_all()
+        self.poll()
+
+    def on_cancel(self, *args):
+        self.cancelled = True
+        self.bar.set_text("Cancelling...")
+        return True
+
+    def set_progress(self, fraction, text):
+        self.bar.set_fraction(fraction)
+        if not self.cancelled:
+            self.bar.set_text(text)
+
+    def poll(self):
+        while Gtk.events_pending():
+            Gtk.main_iteration_do(False)
+        return self.cancelled
+
 class HexMapDialog(Gtk.Window):
     def __init__(self, title):
         super().__init__(title=title)
@@ -269,10 +846,13 @@ class HexMapDialog(Gtk.Window):
         vbox.set_margin_end(6)
         self.add(vbox)
 
-        # Grid for widgets
+        # Grid for widgets, with the preview of the map on its right
+        hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        vbox.pack_start(hbox, True, True, 0)
         self.grid = Gtk.Grid(column_spacing=10, row_spacing=10)
-        vbox.pack_start(self.grid, True, True, 0)
+        hbox.pack_start(self.grid, True, True, 0)
         self.widget_row = 0
+        self.add_preview(hbox)
 
         # Button box (OK / Cancel)
         action_box = Gtk.Box(
@@ -299,6 +879,7 @@ class HexMapDialog(Gtk.Window):
 
         # Build the widget UI
         self.add_widgets()
+        self.connect_preview()
 
     def run_dialog(self):
         self.show_all()
@@ -306,11 +887,19 @@ class HexMapDialog(Gtk.Window):
         return self.response
 
     def on_ok(self, widget):
+        self.cancel_preview()
+        if self.brush_check is not None:
+            # The brush name was being typed and is not checked yet
+            GLib.source_remove(self.brush_check)
+            self.validate_brush_name()
+            if not self.ok_button.get_sensitive():
+                return
         self.response = Gtk.ResponseType.OK
         self.close()
         Gtk.main_quit()
 
     def on_cancel(self, widget):
+        self.cancel_preview()
         self.response = Gtk.ResponseType.CANCEL
         self.close()
         Gtk.main_quit()
@@ -377,6 +966,19 @@ class HexMapDialog(Gtk.Window):
         self.coord_separator.set_hexpand(True)
         self.push_widget_labeled(label, self.coord_separator)
 
+    def add_draw_mode(self):
+        label = Gtk.Label(label="Grid drawing:")
+        label.set_halign(Gtk.Align.START)
+        self.draw_mode = Gtk.ComboBoxText()
+        if hexraster is not None:
+            self.draw_mode.append(draw_raster, "Raster (NumPy)")
+            self.draw_mode.append(draw_parallel,
+                                  "Raster, in parallel (NumPy)")
+        self.draw_mode.append(draw_tiled, "Tiled stamps")
+        self.draw_mode.append(draw_loop, "One stamp per hex")
+        self.draw_mode.set_active(0)
+        self.push_widget_labeled(label, self.draw_mode)
+
     def add_large_grid(self):
         self.large_grid = Gtk.CheckButton(label="Additional large grid")
         self.push_widget_unlabeled(self.large_grid)
@@ -390,6 +992,60 @@ class HexMapDialog(Gtk.Window):
     def add_spin_lgrid_crow(self):
         self.add_spin("Center row:", "spin_lgrid_crow", 8, 0, 1000, 1, 10)
 
+    def add_spin_lgrid_levels(self):
+        self.add_spin("Nested levels:", "spin_lgrid_levels", 1, 1, 3, 1, 1)
+
+    def add_preview(self, box):
+        # The map as set in the dialog, redrawn shortly after the settings
+        # change, see hexpreview.py
+        self.preview = hexpreview.MapPreview()
+        self.preview_redraw = None
+        self.hex_size = None
+        self.hex_layout = None
+        frame = Gtk.Frame()
+        frame.set_valign(Gtk.Align.START)
+        self.preview_area = Gtk.DrawingArea()
+        self.preview_area.set_size_request(preview_size, preview_size)
+        self.preview_area.connect("draw", self.on_preview_draw)
+        frame.add(self.preview_area)
+        box.pack_start(frame, False, False, 0)
+
+    def connect_preview(self):
+        for widget in self.grid.get_children():
+            if isinstance(widget, Gtk.SpinButton):
+                widget.connect("value-changed", self.schedule_preview)
+            elif isinstance(widget, Gtk.CheckButton):
+                widget.connect("toggled", self.schedule_preview)
+            elif (isinstance(widget, Gtk.Entry) and
+                    widget is not self.brush_entry):
+                # The brush is only drawn once it is checked
+                widget.connect("changed", self.schedule_preview)
+
+    def schedule_preview(self, widget=None):
+        # Redraws the preview once the settings stop changing, as while
+        # holding a spin button, not on every change
+        self.cancel_preview()
+        self.preview_redraw = GLib.timeout_add(preview_delay,
+                                               self.redraw_preview)
+
+    def cancel_preview(self):
+        if self.preview_redraw is not None:
+            GLib.source_remove(self.preview_redraw)
+            self.preview_redraw = None
+
+    def redraw_preview(self):
+        self.preview_redraw = None
+        self.preview_area.queue_draw()
+        return GLib.SOURCE_REMOVE
+
+    def on_preview_draw(self, area, cr):
+        if self.hex_layout is None:
+            return False
+        self.preview.draw(cr, area.get_allocated_width(),
+                          area.get_allocated_height(), *self.hex_size,
+                          self.get_spec(), self.hex_layout)
+        return False
+
     # def add_brush_picker(self):
     #     # This brush picker is not working, at least with wayland on linux, the
     #     # code crashes when the button is pushed. I leave the code here for
@@ -432,29 +1088,59 @@ class HexMapDialog(Gtk.Window):
         self.brush_error.get_style_context().add_class("error")
         self.brush_error.set_no_show_all(True)
 
-        def validate_brush_name(entry):
+        def validate_brush_name():
+            self.brush_check = None
+            entry = self.brush_entry
             name = entry.get_text().strip()
-            brush = Gimp.Brush.get_by_name(name)
 
-            if brush is None:
+            self.hex_size = brush_size(name)
+            self.hex_layout = None
+            error = None
+            if self.hex_size is None:
+                error = "Brush does not exist"
+            else:
+                self.hex_layout = brush_layout(name)
+                if (self.hex_layout is not None and
+                        self.hex_layout.orientation != "flat"):
+                    error = "Pointy top brushes are not supported yet"
+                    self.hex_layout = None
+            self.schedule_preview()
+            if error is not None:
                 entry.get_style_context().add_class("error")
-                self.brush_error.set_text("Brush does not exist")
+                self.brush_error.set_text(error)
                 self.brush_error.show()
                 self.ok_button.set_sensitive(False)
+            elif name in layout_fallbacks:
+                # The map can be made, the warning stays in sight
+                entry.get_style_context().remove_class("error")
+                self.brush_error.set_text(layout_fallbacks[name])
+                self.brush_error.show()
+                self.ok_button.set_sensitive(True)
             else:
                 entry.get_style_context().remove_class("error")
                 self.brush_error.hide()
                 self.ok_button.set_sensitive(True)
+            return GLib.SOURCE_REMOVE
+
+        def schedule_validation(entry):
+            # Checks the name once typing pauses, not on every keystroke
+            if self.brush_check is not None:
+                GLib.source_remove(self.brush_check)
+            self.brush_check = GLib.timeout_add(brush_check_delay,
+                                                validate_brush_name)
 
         self.push_widget_labeled(label, self.brush_entry)
         self.push_widget_unlabeled(self.brush_error)
-        self.brush_entry.connect("changed", validate_brush_name)
-        validate_brush_name(self.brush_entry)
+        self.brush_check = None
+        self.validate_brush_name = validate_brush_name
+        self.brush_entry.connect("changed", schedule_validation)
+        validate_brush_name()
 
     def add_widgets(self):
         self.add_brush_entry()
         self.add_spin_rows()
         self.add_spin_cols()
+        self.add_draw_mode()
         self.add_numbering()
         self.add_spin_x0()
         self.add_spin_y0()
@@ -498,10 +1184,12 @@ class HexMapDialog(Gtk.Window):
         self.add_spin_scale()
         self.add_spin_lgrid_ccol()
         self.add_spin_lgrid_crow()
+        self.add_spin_lgrid_levels()
 
         def update_large_grid_scale(check):
             st = check.get_active()
             self.spin_scale.set_sensitive(st)
+            self.spin_lgrid_levels.set_sensitive(st)
             self.spin_lgrid_crow.set_sensitive(st)
             self.spin_lgrid_ccol.set_sensitive(st)
 
@@ -522,18 +1210,671 @@ class HexMapDialog(Gtk.Window):
         adjust_lgrid_spin(self.spin_cols, self.spin_lgrid_ccol)
         adjust_lgrid_spin(self.spin_rows, self.spin_lgrid_crow)
 
+    def get_spec(self):
+        return complete_spec({
+            "brush": self.brush_entry.get_text().strip(),
+            "rows": self.spin_rows.get_value_as_int(),
+            "cols": self.spin_cols.get_value_as_int(),
+            "draw_mode": self.draw_mode.get_active_id(),
+            "numbering": self.numbering.get_active(),
+            "x0": self.spin_x0.get_value_as_int(),
+            "y0": self.spin_y0.get_value_as_int(),
+            "x1": self.spin_x1.get_value_as_int(),
+            "y1": self.spin_y1.get_value_as_int(),
+            "ix": self.spin_ix.get_value_as_int(),
+            "iy": self.spin_iy.get_value_as_int(),
+            "separator": self.coord_separator.get_text(),
+            "large_grid": self.large_grid.get_active(),
+            "lgrid_scale": self.spin_scale.get_value_as_int(),
+            "lgrid_ccol": self.spin_lgrid_ccol.get_value_as_int(),
+            "lgrid_crow": self.spin_lgrid_crow.get_value_as_int(),
+            "lgrid_levels": self.spin_lgrid_levels.get_value_as_int(),
+        })
+
+
+# Settings of a hex map, as given by the dialog, by the arguments of the batch
+# procedure or by the entries of a batch specs file. The numbering range and
+# the large grid center default to the whole map and its central hex when left
+# as None. A map with tile_rows or tile_cols set is created and exported as
+# tiles of that many hexes, see export_tiled_hex_map. The settings only used
+# by the batch procedure are listed in batch_keys.
+default_spec = {
+    "brush": "hex blank",
+    "rows": 16,
+    "cols": 16,
+    "draw_mode": draw_tiled if hexraster is None else draw_raster,
+    "numbering": False,
+    "x0": 0,
+    "y0": 0,
+    "x1": None,
+    "y1": None,
+    "ix": 0,
+    "iy": 0,
+    "separator": "",
+    "large_grid": False,
+    "lgrid_scale": 4,
+    "lgrid_ccol": None,
+    "lgrid_crow": None,
+    "lgrid_levels": 1,
+    "output": "",
+    "tile_rows": 0,
+    "tile_cols": 0,
+}
+batch_keys = ("output", "tile_rows", "tile_cols")
+
+# Ranges of the whole number settings checked by complete_spec, None for no
+# bound. Maps grow past the rows and columns of the dialog when extended.
+spec_ranges = {
+    "rows": (1, None),
+    "cols": (1, None),
+    "lgrid_scale": (2, 10),
+    "lgrid_levels": (1, 3),
+    "tile_rows": (0, None),
+    "tile_cols": (0, None),
+}
+
+def complete_spec(spec):
+    # The settings of spec, with the defaults of those left out. Raises
+    # ValueError when some is unknown or out of range.
+    unknown = set(spec) - set(default_spec)
+    if unknown:
+        raise ValueError("Unknown hex map settings: " +
+                         ", ".join(sorted(unknown)))
+    full = dict(default_spec)
+    full.update(spec)
+    modes = (draw_raster, draw_parallel, draw_tiled, draw_loop)
+    if full["draw_mode"] not in modes:
+        raise ValueError(f"Unknown draw_mode {full['draw_mode']!r}, "
+                         f"expected one of " + ", ".join(modes))
+    for key, (lower, upper) in spec_ranges.items():
+        value = full[key]
+        if (not isinstance(value, int) or isinstance(value, bool) or
+                value < lower or (upper is not None and value > upper)):
+            bounds = (f"at least {lower}" if upper is None else
+                      f"from {lower} to {upper}")
+            raise ValueError(f"{key} must be a whole number {bounds}, "
+                             f"not {value!r}")
+    for key, size in (("x1", "cols"), ("y1", "rows")):
+        if full[key] is None:
+            full[key] = full[size] - 1
+    for key, size in (("lgrid_ccol", "cols"), ("lgrid_crow", "rows")):
+        if full[key] is None:
+            full[key] = full[size] // 2
+    return full
+
+def load_specs(path):
+    # A batch specs file is a JSON list of objects, each overriding some of
+    # the settings given as arguments to the batch procedure
+    with open(path) as f:
+        specs = json.load(f)
+    if not isinstance(specs, list) or not all(isinstance(s, dict)
+                                              for s in specs):
+        raise ValueError(f"{path}: expected a JSON list of hex map settings")
+    return specs
+
+def batch_specs(base, entries, write_index=False):
+    # The settings and output file of each map of a batch: base, the
+    # settings given as arguments, overridden by each entry of the specs
+    # file. All of them are checked before any map is made, raising
+    # ValueError for the first one that is wrong.
+    batch = []
+    for index, entry in enumerate(entries):
+        where = f"Hex map {index + 1} of {len(entries)}"
+        try:
+            spec = complete_spec(dict(base, **entry))
+        except ValueError as error:
+            raise ValueError(f"{where}: {error}") from None
+        if brush_size(spec["brush"]) is None:
+            raise ValueError(f"{where}: brush does not exist: "
+                             f"{spec['brush']}")
+        pattern = spec["output"]
+        if not isinstance(pattern, str):
+            raise ValueError(f"{where}: output must be a file name, not "
+                             f"{pattern!r}")
+        try:
+            output = pattern.format(index=index, **spec)
+        except (KeyError, IndexError, AttributeError, TypeError,
+                ValueError) as error:
+            raise ValueError(f"{where}: wrong output file name {pattern!r}, "
+                             f"it may only include {{index}} and the "
+                             f"settings: {error!r}") from None
+        if write_index and not output:
+            raise ValueError(f"{where}: the hex index is written next to "
+                             f"the output file, none was given")
+        batch.append((spec, output))
+    return batch
+
+def spec_hex_grid(spec, grid=None):
+    # The grid of a new map, laid out as the blank hex brush tiles, or of a
+    # map with the grid kept in it, see image_spec
+    hex_brush = Gimp.Brush.get_by_name(spec["brush"])
+    if hex_brush is None:
+        raise ValueError(f"Brush does not exist: {spec['brush']}")
+    size = brush_size(spec["brush"])
+    if grid is None:
+        layout = brush_layout(spec["brush"])
+    elif "layout" in grid:
+        layout = HexLayout(**grid["layout"])
+    else:
+        # Maps made before the tables were kept in them
+        layout = formula_layout(grid["hex_w"], grid["hex_h"])
+    return HexGrid(hex_brush, size, layout)
+
+def create_hex_map(spec, tile=None):
+    # Creates the map, or only the tile given by its (c0, c1, r0, r1) column
+    # and row ranges (see map_tiles). A tile is drawn as that part of the
+    # whole map: with the hexes of the neighbouring tiles that reach into it,
+    # numbered with the map coordinates and with the large grid aligned to
+    # the map.
+    hexgrid = spec_hex_grid(spec)
+    rows, cols = spec["rows"], spec["cols"]
+    c0, c1, r0, r1 = tile or (0, cols, 0, rows)
+
+    img_w, img_h = hexgrid.set_dims(r1 - r0, c1 - c0)
+    hexgrid.set_halo(c0 > 0, r0 > 0, c1 < cols, r1 < rows)
+
+    # Layers are created transparent, and GIMP only stores the pixels that
+    # get painted, so they are not filled. The Numbers and LargeGrid layers
+    # are only created when they are drawn.
+    layer_names=["Terrain","Rivers","Roads","Cities", "Grid",
+                 "LargeGrid", "Borders","Numbers"]
+    if not spec["large_grid"]:
+        layer_names.remove("LargeGrid")
+    if not spec["numbering"]:
+        layer_names.remove("Numbers")
+    layers = {}
+    with profiler.phase("layers"):
+        img = Gimp.Image.new(img_w, img_h, Gimp.ImageBaseType.RGB)
+        for name in layer_names:
+            layer = Gimp.Layer.new(
+                img, name, img_w, img_h, Gimp.ImageType.RGBA_IMAGE, 100,
+                Gimp.LayerMode.NORMAL 
+            )
+            img.insert_layer(layer, None, 0)
+            layers[name] = layer
+
+    window = None
+    if spec["numbering"]:
+        window = label_window(spec, c0 + hexgrid.hex_cols[0],
+                              c0 + hexgrid.hex_cols[1],
+                              r0 + hexgrid.hex_rows[0],
+                              r0 + hexgrid.hex_rows[1], c0, r0)
+    if spec["large_grid"]:
+        hexgrid.lgrid_setup(spec["lgrid_scale"], spec["lgrid_ccol"] - c0,
+                            spec["lgrid_crow"] - r0, spec["lgrid_levels"])
+
+    # A map stopped half way, or failing, is dropped
+    part = progress.parts([("grid", 6), ("labels", 3 * (window is not None)),
+                           ("large grid", spec["large_grid"])])
+    try:
+        if spec["draw_mode"] == draw_parallel and hexraster is not None:
+            with profiler.phase("parallel"), progress.part(
+                    0, 1, "Drawing the map"):
+                hexgrid.draw_parallel(img, window, spec["large_grid"])
+        else:
+            with profiler.phase("grid"), part("grid", "Drawing the grid"):
+                hexgrid.draw(img, spec["draw_mode"])
+            if window is not None:
+                with profiler.phase("labels"), part("labels",
+                                                    "Writing the labels"):
+                    hexgrid.draw_labels(img, *window)
+            if spec["large_grid"]:
+                with profiler.phase("large grid"), part(
+                        "large grid", "Drawing the large grid"):
+                    hexgrid.draw_large_grid(img)
+    except Exception:
+        img.delete()
+        raise
+
+    with profiler.phase("finish"):
+        hexgrid.set_gimp_grid(img)
+        img.set_selected_layers([layers["Terrain"]])
+        if tile is None:
+            attach_spec(img, spec, hexgrid)
+    return img
+
+def template_key(spec):
+    # Key of the map of spec in the template cache: the settings kept in the
+    # map, the look of the labels, the brush file and the drawing version.
+    # None when the brush is not found in the brush folders.
+    brush = open_brush_cache().identity(spec["brush"])
+    if brush is None:
+        return None
+    settings = {key: spec[key] for key in default_spec
+                if key not in batch_keys}
+    settings["labels"] = [labels_font, labels_font_size, labels_color]
+    settings["drawing_version"] = drawing_version
+    return hextemplates.template_key(settings, brush)
+
+def template_hex_map(spec):
+    # create_hex_map, or a copy of the same map made before, loaded from the
+    # template cache. New maps are added to the cache.
+    cache = open_template_cache()
+    key = None if cache is None else template_key(spec)
+    if key is None:
+        return create_hex_map(spec)
+    path = cache.lookup(key)
+    if path is not None:
+        with profiler.phase("template load"):
+            img = load_template(path)
+        if img is not None:
+            return img
+        cache.discard(key)
+    img = create_hex_map(spec)
+    if template_bytes(img) <= cache.budget:
+        with profiler.phase("template save"):
+            save_template(img, cache, key)
+    return img
+
+def template_bytes(img):
+    # Rough size of the template file of a map, before saving it: the pixels
+    # of one layer, as the Grid, LargeGrid and Numbers layers are mostly
+    # transparent and compress to little. Maps over the budget of the cache
+    # are not saved at all, which would take long and be thrown away.
+    return img.get_width() * img.get_height() * 4
+
+def load_template(path):
+    # The map of a template file, as a new untitled image, so that saving it
+    # never writes to the cache. None when it cannot be loaded.
+    try:
+        loaded = Gimp.file_load(Gimp.RunMode.NONINTERACTIVE,
+                                Gio.File.new_for_path(path))
+    except GLib.Error:
+        return None
+    if loaded is None:
+        return None
+    img = loaded.duplicate()
+    loaded.delete()
+    img.set_selected_layers([img.get_layer_by_name("Terrain")])
+    return img
+
+def save_template(img, cache, key):
+    # Saves a copy of the map, which stays untitled, to the template cache.
+    # The map is made anyway when it cannot be saved.
+    copy = img.duplicate()
+    try:
+        path = cache.prepare(key)
+        if Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, copy,
+                          Gio.File.new_for_path(path), None):
+            cache.store(key)
+    except (GLib.Error, OSError):
+        pass
+    finally:
+        copy.delete()
+
+def label_window(spec, c0, c1, r0, r1, dc=0, dr=0):
+    # Arguments of draw_labels for the numbered hexes among the columns
+    # [c0, c1) and rows [r0, r1) of the map, on an image whose first hex is
+    # (dc, dr) of the map. None when none of them is numbered.
+    x0, x1 = max(spec["x0"], c0), min(spec["x1"], c1 - 1)
+    y0, y1 = max(spec["y0"], r0), min(spec["y1"], r1 - 1)
+    if x0 > x1 or y0 > y1:
+        return None
+    return (x0 - dc, y0 - dr, x1 - dc, y1 - dr,
+            spec["ix"] + x0 - spec["x0"], spec["iy"] + y0 - spec["y0"],
+            spec["separator"])
+
+def attach_spec(img, spec, hexgrid):
+    # Keeps the settings of the map in the image, saved with it in XCF files,
+    # along with the geometry of its grid
+    settings = {key: spec[key] for key in default_spec
+                if key not in batch_keys}
+    grid = {"hex_w": hexgrid.hex_w, "hex_h": hexgrid.hex_h,
+            "dx": hexgrid.dx, "dy": hexgrid.dy,
+            "odd_col_offset": hexgrid.odd_col_offset,
+            "width": hexgrid.img_w, "height": hexgrid.img_h,
+            "layout": hexgrid.layout.to_dict()}
+    data = json.dumps({"version": spec_version, "spec": settings,
+                       "grid": grid})
+    img.attach_parasite(Gimp.Parasite.new(spec_parasite,
+                                          Gimp.PARASITE_PERSISTENT,
+                                          data.encode()))
+
+def image_spec(img):
+    # Settings a map was created with, and the geometry of its grid, from
+    # its parasite
+    parasite = img.get_parasite(spec_parasite)
+    if parasite is None:
+        raise ValueError("The image is not a hex map made by HexMap4Gimp")
+    data = json.loads(bytes(parasite.get_data()).decode())
+    if data.get("version") != spec_version:
+        raise ValueError("The hex map was made by an unsupported version "
+                         "of HexMap4Gimp")
+    return complete_spec(data["spec"]), data.get("grid")
+
+def map_layer(img, name):
+    # The named layer of the map, cleared, or a new one when it was removed.
+    # New layers go on top, or, for LargeGrid, just above the Grid layer.
+    layer = img.get_layer_by_name(name)
+    if layer is not None:
+        Gimp.Selection.none(img)
+        layer.edit_clear()
+        return layer
+    position = 0
+    if name == "LargeGrid":
+        position = img.get_item_position(img.get_layer_by_name("Grid"))
+    layer = Gimp.Layer.new(img, name, img.get_width(), img.get_height(),
+                           Gimp.ImageType.RGBA_IMAGE, 100,
+                           Gimp.LayerMode.NORMAL)
+    img.insert_layer(layer, None, position)
+    return layer
+
+def regenerate_hex_map(img, brush=""):
+    # Draws the Grid, Numbers and LargeGrid layers again from the settings
+    # kept in the map, with another blank hex brush if given. The brush must
+    # have the size of the one the map was made with, as the painted layers
+    # are not touched.
+    spec, grid = image_spec(img)
+    if brush:
+        spec = dict(spec, brush=brush)
+    hexgrid = spec_hex_grid(spec, grid)
+    if grid is not None and ((hexgrid.hex_w, hexgrid.hex_h) !=
+                             (grid["hex_w"], grid["hex_h"])):
+        raise ValueError(f"Brush {spec['brush']} is "
+                         f"{hexgrid.hex_w}x{hexgrid.hex_h}, the map was made "
+                         f"with a {grid['hex_w']}x{grid['hex_h']} brush")
+    hexgrid.set_dims(spec["rows"], spec["cols"])
+    if img.get_layer_by_name("Grid") is None:
+        raise ValueError("The hex map has no Grid layer")
+
+    # The undo group is closed even when stopped half way
+    img.undo_group_start()
+    try:
+        hexgrid.redraw_grid(img, spec["draw_mode"])
+        if spec["numbering"]:
+            map_layer(img, "Numbers")
+            window = label_window(spec, 0, spec["cols"], 0, spec["rows"])
+            if window is not None:
+                hexgrid.draw_labels(img, *window)
+        if spec["large_grid"]:
+            map_layer(img, "LargeGrid")
+            hexgrid.lgrid_setup(spec["lgrid_scale"], spec["lgrid_ccol"],
+                                spec["lgrid_crow"], spec["lgrid_levels"])
+            hexgrid.draw_large_grid(img)
+        attach_spec(img, spec, hexgrid)
+    finally:
+        img.undo_group_end()
+
+def extend_hex_map(img, add_rows, add_cols):
+    # Grows the map by add_rows rows at the bottom and add_cols columns on
+    # the right, only drawing what the new hexes change. Numbering that
+    # reached the last column, or row, goes on to the new last one.
+    spec, grid = image_spec(img)
+    rows, cols = spec["rows"], spec["cols"]
+    grown = dict(spec, rows=rows + add_rows, cols=cols + add_cols)
+    for key, size in (("x1", "cols"), ("y1", "rows")):
+        if spec[key] == spec[size] - 1:
+            grown[key] = grown[size] - 1
+    hexgrid = spec_hex_grid(grown, grid)
+    img_w, img_h = hexgrid.set_dims(grown["rows"], grown["cols"])
+    bands = hexgrid.extension_bands(rows, cols)
+    if not bands:
+        return
+
+    img.undo_group_start()
+    try:
+        img.resize(img_w, img_h, 0, 0)
+        for layer in img.get_layers():
+            layer.resize_to_image_size()
+        hexgrid.draw_extension(img, bands, grown["draw_mode"])
+        if grown["numbering"]:
+            for rect, hexes in bands:
+                window = label_window(grown, *hexes)
+                if window is not None:
+                    hexgrid.draw_labels(img, *window, over=True)
+        if grown["large_grid"]:
+            hexgrid.lgrid_setup(grown["lgrid_scale"], grown["lgrid_ccol"],
+                                grown["lgrid_crow"], grown["lgrid_levels"])
+            hexgrid.draw_large_grid(img, [rect for rect, hexes in bands])
+        attach_spec(img, grown, hexgrid)
+    finally:
+        img.undo_group_end()
+
+def fill_hex_map(img, path, layer_name="Terrain"):
+    # Paints the hexes of the map with the brushes given by a hex fill file,
+    # see hexfill.py. Returns the number of hexes painted and of records
+    # skipped, as their hex is outside the map.
+    spec, grid = image_spec(img)
+    hexgrid = spec_hex_grid(spec, grid)
+    hexgrid.set_dims(spec["rows"], spec["cols"])
+    layer = img.get_layer_by_name(layer_name)
+    if layer is None:
+        raise ValueError(f"The hex map has no {layer_name} layer")
+    groups, skipped = hexfill.read_fill(path, spec["rows"], spec["cols"])
+    brushes = {name: Gimp.Brush.get_by_name(name) for name in groups}
+    missing = sorted(name for name, brush in brushes.items() if brush is None)
+    if missing:
+        raise ValueError("Brushes do not exist: " + ", ".join(missing))
+
+    img.undo_group_start()
+    try:
+        hexgrid.fill_hexes(layer, brushes, groups)
+    finally:
+        img.undo_group_end()
+    return sum(len(hexes) // 2 for hexes in groups.values()), skipped
+
+def export_hex_map(img, path):
+    Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, img, Gio.File.new_for_path(path),
+                   None)
+
+def export_tiled_hex_map(spec, path):
+    # Creates and exports the map one tile at a time, so that a single tile
+    # is kept in memory. Tile files are named after path with their row and
+    # column of tiles added, and a JSON manifest with the place of each tile
+    # in the whole map is written next to them, named after path too. Tiles
+    # overlap where the hexes of their border columns and rows interleave,
+    # with the same pixels in both tiles.
+    if not path:
+        raise ValueError("Tiled hex maps must be exported to an output file")
+    rows, cols = spec["rows"], spec["cols"]
+    size = brush_size(spec["brush"])
+    if size is None:
+        raise ValueError(f"Brush does not exist: {spec['brush']}")
+    hexgrid = HexGeometry(*size, brush_layout(spec["brush"]))
+    map_w, map_h = hexgrid.set_dims(rows, cols)
+    root, ext = os.path.splitext(path)
+    tiles = []
+    all_tiles = list(map_tiles(rows, cols, spec["tile_rows"] or rows,
+                               spec["tile_cols"] or cols))
+    count = len(all_tiles)
+    for i, j, tile in all_tiles:
+        c0, c1, r0, r1 = tile
+        tile_path = f"{root}-r{i:03d}-c{j:03d}{ext}"
+        with progress.part(len(tiles) / count, (len(tiles) + 1) / count,
+                           f"Tile {len(tiles) + 1} of {count}"):
+            img = create_hex_map(spec, tile)
+        try:
+            with profiler.phase("export"):
+                export_hex_map(img, tile_path)
+            x, y = hexgrid.tile_origin(c0, r0)
+            tiles.append({"file": os.path.basename(tile_path),
+                          "row": i, "col": j,
+                          "hex_cols": [c0, c1], "hex_rows": [r0, r1],
+                          "x": x, "y": y, "width": img.get_width(),
+                          "height": img.get_height()})
+        finally:
+            img.delete()
+    manifest = {"rows": rows, "cols": cols, "width": map_w, "height": map_h,
+                "tiles": tiles}
+    with open(root + ".json", "w") as f:
+        json.dump(manifest, f, indent=1)
+    return len(tiles)
+
+def export_svg_hex_map(spec, path):
+    # Writes the grid, labels and large grid of the map as an SVG drawing,
+    # from the geometry alone, without creating an image
+    size = brush_size(spec["brush"])
+    if size is None:
+        raise ValueError(f"Brush does not exist: {spec['brush']}")
+    hexsvg.export_svg(path, *size, spec, brush_layout(spec["brush"]))
+
+def export_hex_index(path, spec, grid=None):
+    # Writes the index of the hexes of the map, see hexindex.py, from the
+    # grid kept in the map, or else laid out as the blank hex brush tiles
+    if grid is None:
+        size = brush_size(spec["brush"])
+        if size is None:
+            raise ValueError(f"Brush does not exist: {spec['brush']}")
+        geom = HexGeometry(*size, brush_layout(spec["brush"]))
+    else:
+        layout = (HexLayout(**grid["layout"]) if "layout" in grid else
+                  formula_layout(grid["hex_w"], grid["hex_h"]))
+        geom = HexGeometry(grid["hex_w"], grid["hex_h"], layout)
+    geom.set_dims(spec["rows"], spec["cols"])
+    hexindex.write_index(path, geom, spec)
+
+def index_path(output):
+    # Index written along with a map exported to output
+    return os.path.splitext(output)[0] + "-index.json"
+
+def export_map_tiles(img, directory, tile_size=256, tile_format="png",
+                     snap=True):
+    # Writes the map, as displayed, as a z/x/y tile pyramid for web viewers,
+    # see hextiles.py. Each tile is composed on its own from the visible
+    # layers, see compose_tile, scaled down by Gegl on the lower zoom levels,
+    # so only one tile is in memory at a time, in the plugin and in GIMP.
+    # Tiles read from the same layer pixels as an earlier one, as the grid
+    # repeats, are linked to it without blending them again. With snap the
+    # tile size is rounded to the period of the grid, so that they repeat.
+    writer = hextiles.TileWriter(directory, tile_format)
+    tile_w = tile_h = tile_size
+    if snap:
+        try:
+            grid = image_spec(img)[1]
+        except ValueError:
+            grid = None
+        if grid is not None:
+            tile_w = hextiles.snap_tile_size(tile_size, 2 * grid["dx"])
+            tile_h = hextiles.snap_tile_size(tile_size, grid["dy"])
+    width, height = img.get_width(), img.get_height()
+
+    tile_img, layers = tile_layers(img, tile_w, tile_h)
+    try:
+        for z, x, y, scale in hextiles.pyramid_tiles(width, height,
+                                                     tile_w, tile_h):
+            pixels = read_tile(layers, x * tile_w, y * tile_h, tile_w,
+                               tile_h, scale)
+            source = hextiles.tile_key(*(data + mask_data
+                                         for data, mask_data in pixels))
+            if writer.reuse(z, x, y, source):
+                continue
+            data = compose_tile(tile_img, layers, pixels, tile_w, tile_h)
+            writer.write(z, x, y, tile_w, tile_h, data, source)
+    finally:
+        tile_img.delete()
+    return writer.write_manifest(width, height, tile_w, tile_h)
+
+def tile_layers(img, tile_w, tile_h):
+    # An image of the size of a tile, where the tiles are composed, with a
+    # layer blended as each visible layer of the map, bottom to top, and a
+    # list of the buffer, offsets and mask buffer of each map layer, with
+    # its tile layer and the buffers of this one
+    tile_img = Gimp.Image.new(tile_w, tile_h, Gimp.ImageBaseType.RGB)
+    layers = []
+    for layer in reversed(img.get_layers()):
+        if not layer.get_visible():
+            continue
+        copy = Gimp.Layer.new(tile_img, layer.get_name(), tile_w, tile_h,
+                              Gimp.ImageType.RGBA_IMAGE, layer.get_opacity(),
+                              layer.get_mode())
+        tile_img.insert_layer(copy, None, 0)
+        mask = layer.get_mask()
+        copy_mask = None
+        if mask is not None and layer.get_apply_mask():
+            copy.add_mask(copy.create_mask(Gimp.AddMaskType.WHITE))
+            mask = mask.get_buffer()
+            copy_mask = copy.get_mask().get_buffer()
+        else:
+            mask = None
+        ok, off_x, off_y = layer.get_offsets()
+        layers.append((layer.get_buffer(), off_x, off_y, mask, copy,
+                       copy.get_buffer(), copy_mask))
+    return tile_img, layers
+
+def read_tile(layers, x, y, w, h, scale):
+    # Pixels and mask, empty without one, of every layer of layers, see
+    # tile_layers, in the w x h tile whose top left corner is (x, y) on the
+    # map scaled by scale
+    pixels = []
+    for buffer, off_x, off_y, mask, copy, tile_buffer, tile_mask in layers:
+        rect = Gegl.Rectangle.new(x - round(off_x * scale),
+                                  y - round(off_y * scale), w, h)
+        data = buffer.get(rect, scale, pixel_format, Gegl.AbyssPolicy.NONE)
+        mask_data = b""
+        if mask is not None:
+            mask_data = mask.get(rect, scale, "Y u8", Gegl.AbyssPolicy.NONE)
+        pixels.append((data, mask_data))
+    return pixels
+
+def compose_tile(tile_img, layers, pixels, w, h):
+    # Pixels of a w x h tile, blended from the pixels of every layer read by
+    # read_tile: they are written into the layers of tile_img, see
+    # tile_layers, which GIMP then blends as the map. Tiles where all the
+    # layers are transparent are not blended.
+    if not any(any(data[3::4]) for data, mask_data in pixels):
+        return bytes(w * h * 4)
+    whole = Gegl.Rectangle.new(0, 0, w, h)
+    for (data, mask_data), layer in zip(pixels, layers):
+        buffer, off_x, off_y, mask, copy, tile_buffer, tile_mask = layer
+        tile_buffer.set(whole, pixel_format, data)
+        tile_buffer.flush()
+        if mask is not None:
+            tile_mask.set(whole, "Y u8", mask_data)
+            tile_mask.flush()
+        copy.update(0, 0, w, h)
+    composed = Gimp.Layer.new_from_visible(tile_img, tile_img, "Tile")
+    data = composed.get_buffer().get(whole, 1.0, pixel_format,
+                                     Gegl.AbyssPolicy.NONE)
+    composed.delete()
+    return data
+
+def return_values(procedure, *values):
+    retvals = procedure.new_return_values(Gimp.PDBStatusType.SUCCESS, None)
+    for i, value in enumerate(values, 1):
+        retvals.remove(i)
+        retvals.insert(i, value)
+    return retvals
+
+def procedure_dialog(procedure, run_mode, config, title):
+    # Lets the arguments be edited in the dialog of the procedure when run
+    # interactively. Returns the values of a cancelled run, else None.
+    if run_mode != Gimp.RunMode.INTERACTIVE:
+        return None
+    GimpUi.init("hex-map-gimp")
+    dialog = GimpUi.ProcedureDialog.new(procedure, config, title)
+    dialog.fill(None)
+    ok = dialog.run()
+    dialog.destroy()
+    if not ok:
+        return procedure.new_return_values(Gimp.PDBStatusType.CANCEL, None)
+    return None
 
 class HexMap4Gimp(Gimp.PlugIn):
     def do_set_i18n(self, proc_name):
         return (False, None, None)
 
     def do_query_procedures(self):
-        return [new_hexmap]
+        return [new_hexmap, batch_hexmap, extend_hexmap, regenerate_hexmap,
+                tiles_hexmap, fill_hexmap, index_hexmap]
 
     def do_create_procedure(self, name):
-        if name != new_hexmap:
-            return None
-
+        if name == new_hexmap:
+            return self.create_new_hexmap_procedure(name)
+        if name == batch_hexmap:
+            return self.create_batch_procedure(name)
+        if name == extend_hexmap:
+            return self.create_extend_procedure(name)
+        if name == regenerate_hexmap:
+            return self.create_regenerate_procedure(name)
+        if name == tiles_hexmap:
+            return self.create_tiles_procedure(name)
+        if name == fill_hexmap:
+            return self.create_fill_procedure(name)
+        if name == index_hexmap:
+            return self.create_index_procedure(name)
+        return None
+
+    def create_new_hexmap_procedure(self, name):
         proc = Gimp.ImageProcedure.new(
             self,
             name,
@@ -553,6 +1894,277 @@ class HexMap4Gimp(Gimp.PlugIn):
         proc.set_sensitivity_mask(Gimp.ProcedureSensitivityMask.ALWAYS)
         return proc
 
+    def create_extend_procedure(self, name):
+        proc = Gimp.ImageProcedure.new(
+            self,
+            name,
+            Gimp.PDBProcType.PLUGIN,
+            self.extend_hex_map,
+            None
+        )
+
+        proc.set_menu_label("Extend Hex Map...")
+        proc.add_menu_path("<Image>/File/HexMap4Gimp")
+        proc.set_documentation(
+            "Extend Hex Map",
+            "Adds rows and columns to a hex map made by HexMap4Gimp.",
+            "Rows are added at the bottom and columns on the right, drawing "
+            "only the new hexes, their labels and the large grid over them. "
+            "What is painted on the map is kept."
+        )
+        proc.set_attribution("Christian", "Christian Tenllado", "2025")
+        proc.set_image_types("*")
+        proc.set_sensitivity_mask(
+            Gimp.ProcedureSensitivityMask.DRAWABLE |
+            Gimp.ProcedureSensitivityMask.DRAWABLES |
+            Gimp.ProcedureSensitivityMask.NO_DRAWABLES)
+
+        flags = GObject.ParamFlags.READWRITE
+        proc.add_int_argument("add-rows", "Rows to add",
+                              "Rows added at the bottom", 0, 1000, 0, flags)
+        proc.add_int_argument("add-cols", "Columns to add",
+                              "Columns added on the right", 0, 1000, 0, flags)
+        return proc
+
+    def create_regenerate_procedure(self, name):
+        proc = Gimp.ImageProcedure.new(
+            self,
+            name,
+            Gimp.PDBProcType.PLUGIN,
+            self.regenerate_hex_map,
+            None
+        )
+
+        proc.set_menu_label("Regenerate Hex Grid...")
+        proc.add_menu_path("<Image>/File/HexMap4Gimp")
+        proc.set_documentation(
+            "Regenerate Hex Grid",
+            "Draws again the grid, labels and large grid of a hex map made "
+            "by HexMap4Gimp.",
+            "The Grid, Numbers and LargeGrid layers are drawn again from the "
+            "settings kept in the map, optionally with another blank hex "
+            "brush of the same size. Terrain, Rivers, Roads and the other "
+            "layers are not touched."
+        )
+        proc.set_attribution("Christian", "Christian Tenllado", "2025")
+        proc.set_image_types("*")
+        proc.set_sensitivity_mask(
+            Gimp.ProcedureSensitivityMask.DRAWABLE |
+            Gimp.ProcedureSensitivityMask.DRAWABLES |
+            Gimp.ProcedureSensitivityMask.NO_DRAWABLES)
+
+        flags = GObject.ParamFlags.READWRITE
+        proc.add_string_argument("brush", "Blank hex brush",
+                                 "Brush to use instead of the map's, empty "
+                                 "to keep it", "", flags)
+        return proc
+
+    def create_tiles_procedure(self, name):
+        proc = Gimp.ImageProcedure.new(
+            self,
+            name,
+            Gimp.PDBProcType.PLUGIN,
+            self.export_map_tiles,
+            None
+        )
+
+        proc.set_menu_label("Export Map Tiles...")
+        proc.add_menu_path("<Image>/File/HexMap4Gimp")
+        proc.set_documentation(
+            "Export Map Tiles",
+            "Exports the map as a tile pyramid for web map viewers.",
+            "Tiles are written to directory/z/x/y.png (or .webp), the whole "
+            "map fitting in one tile on zoom 0, along with a tiles.json "
+            "description of the pyramid. Tiles with the same pixels are "
+            "encoded once, and fully transparent tiles are not written."
+        )
+        proc.set_attribution("Christian", "Christian Tenllado", "2025")
+        proc.set_image_types("*")
+        proc.set_sensitivity_mask(
+            Gimp.ProcedureSensitivityMask.DRAWABLE |
+            Gimp.ProcedureSensitivityMask.DRAWABLES |
+            Gimp.ProcedureSensitivityMask.NO_DRAWABLES)
+
+        flags = GObject.ParamFlags.READWRITE
+        proc.add_string_argument("directory", "Directory",
+                                 "Folder the tiles are written to", "",
+                                 flags)
+        proc.add_int_argument("tile-size", "Tile size",
+                              "Width and height of the tiles, in pixels",
+                              16, 4096, 256, flags)
+        proc.add_string_argument("format", "Format", "png or webp", "png",
+                                 flags)
+        proc.add_boolean_argument("snap-to-grid", "Snap to grid",
+                                  "Round the tile size to the period of the "
+                                  "hex grid, so that tiles line up with it",
+                                  True, flags)
+        return proc
+
+    def create_fill_procedure(self, name):
+        proc = Gimp.ImageProcedure.new(
+            self,
+            name,
+            Gimp.PDBProcType.PLUGIN,
+            self.fill_hex_map,
+            None
+        )
+
+        proc.set_menu_label("Fill Hexes From File...")
+        proc.add_menu_path("<Image>/File/HexMap4Gimp")
+        proc.set_documentation(
+            "Fill Hexes From File",
+            "Paints terrain brushes on the hexes listed in a file.",
+            "The file lists col, row and brush records, as CSV (.csv), a "
+            "JSON list (.json) or JSON Lines (.jsonl), columns and rows "
+            "counting from 0. Each brush is painted on its hexes as the "
+            "pencil would, centered on the hex. Records of hexes outside the "
+            "map are skipped."
+        )
+        proc.set_attribution("Christian", "Christian Tenllado", "2025")
+        proc.set_image_types("*")
+        proc.set_sensitivity_mask(
+            Gimp.ProcedureSensitivityMask.DRAWABLE |
+            Gimp.ProcedureSensitivityMask.DRAWABLES |
+            Gimp.ProcedureSensitivityMask.NO_DRAWABLES)
+
+        flags = GObject.ParamFlags.READWRITE
+        proc.add_string_argument("file", "Fill file",
+                                 "CSV, JSON or JSON Lines file of col, row "
+                                 "and brush records", "", flags)
+        proc.add_string_argument("layer", "Layer", "Layer painted",
+                                 "Terrain", flags)
+        proc.add_int_return_value("hexes", "Hexes", "Hexes painted",
+                                  0, GLib.MAXINT, 0, flags)
+        proc.add_int_return_value("skipped", "Skipped",
+                                  "Records outside the map", 0,
+                                  GLib.MAXINT, 0, flags)
+        return proc
+
+    def create_index_procedure(self, name):
+        proc = Gimp.ImageProcedure.new(
+            self,
+            name,
+            Gimp.PDBProcType.PLUGIN,
+            self.export_hex_index,
+            None
+        )
+
+        proc.set_menu_label("Export Hex Index...")
+        proc.add_menu_path("<Image>/File/HexMap4Gimp")
+        proc.set_documentation(
+            "Export Hex Index",
+            "Exports the center, box and label of every hex of the map.",
+            "The file given is a JSON header with the grid geometry. The "
+            "hexes are written next to it as NumPy .npy files, named after "
+            "it: NAME.npy with the center x, y and the left, top, right and "
+            "bottom of the box of each hex, as int32, and NAME-labels.npy "
+            "with their labels. See hexindex.py for finding the hex under a "
+            "pixel."
+        )
+        proc.set_attribution("Christian", "Christian Tenllado", "2025")
+        proc.set_image_types("*")
+        proc.set_sensitivity_mask(
+            Gimp.ProcedureSensitivityMask.DRAWABLE |
+            Gimp.ProcedureSensitivityMask.DRAWABLES |
+            Gimp.ProcedureSensitivityMask.NO_DRAWABLES)
+
+        flags = GObject.ParamFlags.READWRITE
+        proc.add_string_argument("file", "Index file",
+                                 "JSON header of the index", "", flags)
+        return proc
+
+    def create_batch_procedure(self, name):
+        proc = Gimp.Procedure.new(
+            self,
+            name,
+            Gimp.PDBProcType.PLUGIN,
+            self.batch_hex_maps,
+            None
+        )
+        proc.set_documentation(
+            "Create hex maps in batch",
+            "Creates one hex map from the arguments, or one per entry of a "
+            "JSON specs file, and exports each of them to a file.",
+            "Each entry of the specs file is an object overriding some of "
+            "the arguments, with the argument names written with "
+            "underscores (e.g. {\"rows\": 30, \"large_grid\": true}). "
+            "The output file name may use {index} and any setting, e.g. "
+            "\"map-{index:03d}-{rows}x{cols}.png\". Maps are not displayed "
+            "nor kept open once exported. Maps with tile-rows or tile-cols "
+            "set are exported as tiles of that size, to files named after "
+            "the output with -rROW-cCOL added, plus a JSON manifest. With "
+            "index set, the index of the hexes of each map is written too."
+        )
+        proc.set_attribution("Christian", "Christian Tenllado", "2025")
+
+        flags = GObject.ParamFlags.READWRITE
+        proc.add_enum_argument("run-mode", "Run mode", "The run mode",
+                               Gimp.RunMode, Gimp.RunMode.NONINTERACTIVE,
+                               flags)
+        proc.add_string_argument("brush", "Brush", "Blank hex brush name",
+                                 default_spec["brush"], flags)
+        proc.add_int_argument("rows", "Rows", "Number of rows",
+                              1, 1000, default_spec["rows"], flags)
+        proc.add_int_argument("cols", "Columns", "Number of columns",
+                              1, 1000, default_spec["cols"], flags)
+        proc.add_string_argument("draw-mode", "Grid drawing",
+                                 "raster, parallel, tiled or loop",
+                                 default_spec["draw_mode"], flags)
+        proc.add_boolean_argument("numbering", "Numbering",
+                                  "Hex numbering (CCRR)", False, flags)
+        for arg, blurb in (("x0", "First numbered column"),
+                           ("y0", "First numbered row"),
+                           ("x1", "Last numbered column, -1 for the last"),
+                           ("y1", "Last numbered row, -1 for the last")):
+            default = 0 if arg in ("x0", "y0") else -1
+            proc.add_int_argument(arg, arg, blurb, default, 999, default,
+                                  flags)
+        proc.add_int_argument("ix", "ix", "Label of the first column",
+                              0, 999, 0, flags)
+        proc.add_int_argument("iy", "iy", "Label of the first row",
+                              0, 999, 0, flags)
+        proc.add_string_argument("separator", "Separator",
+                                 "Coordinate separator", "", flags)
+        proc.add_boolean_argument("large-grid", "Large grid",
+                                  "Additional large grid", False, flags)
+        proc.add_int_argument("lgrid-scale", "Large grid scale",
+                              "Hexes covered by a large hex",
+                              2, 10, default_spec["lgrid_scale"], flags)
+        proc.add_int_argument("lgrid-ccol", "Center column",
+                              "Large grid center column, -1 for the middle",
+                              -1, 999, -1, flags)
+        proc.add_int_argument("lgrid-crow", "Center row",
+                              "Large grid center row, -1 for the middle",
+                              -1, 999, -1, flags)
+        proc.add_int_argument("lgrid-levels", "Large grid levels",
+                              "Nested large grids, of scale, scale^2... "
+                              "hexes", 1, 3, default_spec["lgrid_levels"],
+                              flags)
+        proc.add_string_argument("output", "Output",
+                                 "File to export each map to", "", flags)
+        proc.add_int_argument("tile-rows", "Tile rows",
+                              "Rows of the tiles, 0 for no tiling",
+                              0, 1000, 0, flags)
+        proc.add_int_argument("tile-cols", "Tile columns",
+                              "Columns of the tiles, rounded up to even, "
+                              "0 for no tiling", 0, 1000, 0, flags)
+        proc.add_boolean_argument("index", "Index",
+                                  "Also write the index of the hexes, see "
+                                  "hexindex.py, named after the output with "
+                                  "-index.json", False, flags)
+        proc.add_string_argument("specs", "Specs file",
+                                 "JSON list of maps to create", "", flags)
+        proc.add_string_argument("profile", "Profile",
+                                 "File the time and GIMP calls of each phase "
+                                 "are appended to as a JSON line, or "
+                                 "\"console\", empty to disable", "", flags)
+        proc.add_int_return_value("maps", "Maps", "Number of maps created",
+                                  0, GLib.MAXINT, 0, flags)
+        proc.add_image_return_value("image", "Image",
+                                    "Last map, if it was not exported",
+                                    True, flags)
+        return proc
+
     def new_hex_map(self, procedure, run_mode, image, drawable, args, data):
         GimpUi.init("hex-map-gimp")
         Gegl.init(None)
@@ -564,59 +2176,211 @@ class HexMap4Gimp(Gimp.PlugIn):
             dialog.destroy()
             return procedure.new_return_values(Gimp.PDBStatusType.CANCEL, None)
 
-        brush_name = dialog.brush_entry.get_text().strip()
-        hex_brush = Gimp.Brush.get_by_name(brush_name)
-        hexgrid = HexGrid(hex_brush)
+        spec = dialog.get_spec()
+        dialog.destroy()
+        profile = start_profile()
+        window = ProgressWindow("Creating hex map")
+        start_progress("Creating hex map", window)
+        try:
+            img = template_hex_map(spec)
+        except hexprogress.Cancelled:
+            return procedure.new_return_values(Gimp.PDBStatusType.CANCEL,
+                                               None)
+        finally:
+            end_progress(window)
+        report_profile(profile, procedure=new_hexmap, rows=spec["rows"],
+                       cols=spec["cols"], draw_mode=spec["draw_mode"])
+        Gimp.Display.new(img)
+        return procedure.new_return_values(Gimp.PDBStatusType.SUCCESS, None)
 
-        rows = dialog.spin_rows.get_value_as_int()
-        cols = dialog.spin_cols.get_value_as_int()
-        img_w, img_h = hexgrid.set_dims(rows, cols)
-        img = Gimp.Image.new(img_w, img_h, Gimp.ImageBaseType.RGB)
+    def extend_hex_map(self, procedure, run_mode, image, drawables, config,
+                       data):
+        cancelled = procedure_dialog(procedure, run_mode, config,
+                                     "Extend Hex Map")
+        if cancelled is not None:
+            return cancelled
 
-        layer_names=["Terrain","Rivers","Roads","Cities", "Grid",
-                     "LargeGrid", "Borders","Numbers"]
-        layers = {}
-        for name in layer_names:
-            layer = Gimp.Layer.new(
-                img, name, img_w, img_h, Gimp.ImageType.RGBA_IMAGE, 100,
-                Gimp.LayerMode.NORMAL 
-            )
-            img.insert_layer(layer, None, 0)
-            layer.fill(0)
-            layer.edit_clear()
-            layers[name] = layer
+        Gegl.init(None)
+        try:
+            extend_hex_map(image, config.get_property("add-rows"),
+                           config.get_property("add-cols"))
+        except ValueError as error:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.EXECUTION_ERROR, GLib.Error(str(error)))
+        Gimp.displays_flush()
+        return procedure.new_return_values(Gimp.PDBStatusType.SUCCESS, None)
 
+    def regenerate_hex_map(self, procedure, run_mode, image, drawables, config,
+                           data):
+        cancelled = procedure_dialog(procedure, run_mode, config,
+                                     "Regenerate Hex Grid")
+        if cancelled is not None:
+            return cancelled
 
-        hexgrid.draw(img)
+        Gegl.init(None)
+        try:
+            regenerate_hex_map(image, config.get_property("brush").strip())
+        except ValueError as error:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.EXECUTION_ERROR, GLib.Error(str(error)))
+        Gimp.displays_flush()
+        return procedure.new_return_values(Gimp.PDBStatusType.SUCCESS, None)
 
-        numbering = dialog.numbering.get_active()
-        if numbering:
-            x0 = dialog.spin_x0.get_value_as_int()
-            y0 = dialog.spin_y0.get_value_as_int()
-            x1 = dialog.spin_x1.get_value_as_int()
-            y1 = dialog.spin_y1.get_value_as_int()
-            ix = dialog.spin_ix.get_value_as_int()
-            iy = dialog.spin_iy.get_value_as_int()
-            separator = dialog.coord_separator.get_text()
-            hexgrid.draw_labels(img, x0, y0, x1, y1, ix, iy, separator)
-        else:
-            img.remove_layer(layers["Numbers"])
-
-        large_grid = dialog.large_grid.get_active()
-        if large_grid:
-            lgrid_crow = dialog.spin_lgrid_crow.get_value_as_int()
-            lgrid_ccol = dialog.spin_lgrid_ccol.get_value_as_int()
-            lgrid_scale = dialog.spin_scale.get_value_as_int()
-            hexgrid.lgrid_setup(lgrid_scale, lgrid_ccol, lgrid_crow)
-            hexgrid.draw_large_grid(img)
-        else:
-            img.remove_layer(layers["LargeGrid"])
+    def export_map_tiles(self, procedure, run_mode, image, drawables, config,
+                         data):
+        cancelled = procedure_dialog(procedure, run_mode, config,
+                                     "Export Map Tiles")
+        if cancelled is not None:
+            return cancelled
 
-        hexgrid.set_gimp_grid(img)
-        img.set_selected_layers([layers["Terrain"]])
+        Gegl.init(None)
+        directory = config.get_property("directory")
+        if not directory:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.CALLING_ERROR,
+                GLib.Error("No directory given for the tiles"))
+        try:
+            export_map_tiles(image, directory,
+                             config.get_property("tile-size"),
+                             config.get_property("format").strip().lower(),
+                             config.get_property("snap-to-grid"))
+        except (ValueError, OSError) as error:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.EXECUTION_ERROR, GLib.Error(str(error)))
+        return procedure.new_return_values(Gimp.PDBStatusType.SUCCESS, None)
 
-        dialog.destroy()
-        Gimp.Display.new(img)
+    def export_hex_index(self, procedure, run_mode, image, drawables, config,
+                         data):
+        cancelled = procedure_dialog(procedure, run_mode, config,
+                                     "Export Hex Index")
+        if cancelled is not None:
+            return cancelled
+
+        path = config.get_property("file")
+        if not path:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.CALLING_ERROR,
+                GLib.Error("No hex index file given"))
+        try:
+            spec, grid = image_spec(image)
+            export_hex_index(path, spec, grid)
+        except (ValueError, OSError) as error:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.EXECUTION_ERROR, GLib.Error(str(error)))
         return procedure.new_return_values(Gimp.PDBStatusType.SUCCESS, None)
 
-Gimp.main(HexMap4Gimp.__gtype__, sys.argv)
+    def fill_hex_map(self, procedure, run_mode, image, drawables, config,
+                     data):
+        cancelled = procedure_dialog(procedure, run_mode, config,
+                                     "Fill Hexes From File")
+        if cancelled is not None:
+            return cancelled
+
+        Gegl.init(None)
+        path = config.get_property("file")
+        if not path:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.CALLING_ERROR,
+                GLib.Error("No hex fill file given"))
+        try:
+            hexes, skipped = fill_hex_map(image, path,
+                                          config.get_property("layer"))
+        except (ValueError, OSError) as error:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.EXECUTION_ERROR, GLib.Error(str(error)))
+        Gimp.displays_flush()
+        return return_values(procedure, hexes, skipped)
+
+    def batch_hex_maps(self, procedure, config, data):
+        Gegl.init(None)
+        run_mode = config.get_property("run-mode")
+        base = {}
+        for key in default_spec:
+            value = config.get_property(key.replace("_", "-"))
+            base[key] = None if value == -1 else value
+        specs_path = config.get_property("specs")
+        write_index = config.get_property("index")
+
+        if run_mode == Gimp.RunMode.INTERACTIVE and not specs_path:
+            GimpUi.init("hex-map-gimp")
+            dialog = HexMapDialog(title="HexMap Properties")
+            response = dialog.run_dialog()
+            if response != Gtk.ResponseType.OK:
+                dialog.destroy()
+                return procedure.new_return_values(
+                    Gimp.PDBStatusType.CANCEL, None)
+            # The dialog has no batch settings, those of the arguments stay
+            base.update(dialog.get_spec(),
+                        **{key: base[key] for key in batch_keys})
+            dialog.destroy()
+
+        # Wrong settings, in the arguments or the specs file, are a calling
+        # error found before any map is made. Failures making the maps are
+        # execution errors.
+        try:
+            entries = load_specs(specs_path) if specs_path else [{}]
+            batch = batch_specs(base, entries, write_index)
+        except (ValueError, OSError) as error:
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.CALLING_ERROR, GLib.Error(str(error)))
+
+        img = None
+        count = 0
+        profile = start_profile(config.get_property("profile"))
+        # The maps are made one after the other, their progress reported as
+        # parts of the whole batch. When stopped, the maps already exported
+        # are kept.
+        window = None
+        if run_mode == Gimp.RunMode.INTERACTIVE:
+            GimpUi.init("hex-map-gimp")
+            window = ProgressWindow("Creating hex maps")
+        start_progress("Creating hex maps", window)
+        try:
+            for index, (spec, output) in enumerate(batch):
+                if write_index:
+                    export_hex_index(index_path(output), spec)
+                with progress.part(index / len(batch),
+                                   (index + 1) / len(batch),
+                                   f"Hex map {index + 1} of {len(batch)}"):
+                    if output.lower().endswith(".svg"):
+                        export_svg_hex_map(spec, output)
+                        count += 1
+                        continue
+                    if spec["tile_rows"] or spec["tile_cols"]:
+                        export_tiled_hex_map(spec, output)
+                        count += 1
+                        continue
+                    if img is not None:
+                        # Only the last map, not exported, is shown
+                        img.delete()
+                        img = None
+                    img = template_hex_map(spec)
+                    count += 1
+                    if output:
+                        with profiler.phase("export"):
+                            export_hex_map(img, output)
+                        img.delete()
+                        img = None
+        except (ValueError, KeyError, OSError) as error:
+            if img is not None:
+                img.delete()
+            return procedure.new_return_values(
+                Gimp.PDBStatusType.EXECUTION_ERROR,
+                GLib.Error(f"Hex map {index + 1} of {len(batch)}: {error}"))
+        except hexprogress.Cancelled:
+            if img is not None:
+                img.delete()
+            return procedure.new_return_values(Gimp.PDBStatusType.CANCEL,
+                                               None)
+        finally:
+            end_progress(window)
+        report_profile(profile, procedure=batch_hexmap, maps=count)
+
+        if img is not None and run_mode == Gimp.RunMode.INTERACTIVE:
+            Gimp.Display.new(img)
+        return return_values(procedure,
+                             GObject.Value(GObject.TYPE_INT, count),
+                             GObject.Value(Gimp.Image, img))
+
+if __name__ == "__main__":
+    Gimp.main(HexMap4Gimp.__gtype__, sys.argv)
@@ -0,0 +1,201 @@
+# NAME
+#       hexpreview, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Preview of a map in the dialog, drawn with Cairo from the grid
+#       geometry of hexgeometry.py, scaled down to fit the preview area: the
+#       hex outlines, the range of numbered hexes and the large grid, with
+#       its central hex marked. It takes milliseconds where rendering the map
+#       on GIMP layers takes seconds, so the dialog redraws it as the settings
+#       change.
+#
+#       Only the hexes within the clip region of the Cairo context, the part
+#       of the area being redrawn, are drawn. The hex outlines, which only
+#       change with the brush and the map size, are kept as a Cairo pattern
+#       and painted back when other settings change. Hexes too small to be
+#       told apart are drawn as a plain tint, and the labels are only written
+#       when they can be read.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import math
+
+from hexgeometry import HexGeometry, make_label
+
+# Colors, as Cairo RGBA
+background_color = (1, 1, 1, 1)
+border_color = (0.3, 0.3, 0.3, 1)
+grid_color = (0.59, 0.59, 0.59, 0.75)
+numbering_color = (0.25, 0.5, 0.9, 0.2)
+labels_color = (0.39, 0.39, 0.39, 1)
+lgrid_color = (0.85, 0.2, 0.1, 0.9)
+lgrid_center_color = (0.85, 0.2, 0.1, 0.5)
+
+labels_font = "sans-serif"
+labels_font_size = 7
+
+# Pixels of the preview area left around the map
+margin = 4
+# Smallest width, in pixels of the preview, of a hex drawn with its outline,
+# and smallest height of a label written
+min_hex_px = 4
+min_label_px = 5
+
+class MapPreview:
+    def __init__(self):
+        # Hex outlines of the last map drawn: the settings they depend on,
+        # the part of the map drawn and the Cairo pattern with them
+        self.grid_key = None
+        self.grid_rect = None
+        self.grid_pattern = None
+
+    def draw(self, cr, width, height, hex_w, hex_h, spec, layout=None):
+        # Draws the map of spec (settings as in hexmap4gimp.default_spec,
+        # with x1, y1, lgrid_ccol and lgrid_crow given) for a blank hex brush
+        # of hex_w x hex_h pixels, tiling as layout, centered in an area of
+        # width x height
+        geom = HexGeometry(hex_w, hex_h, layout)
+        img_w, img_h = geom.set_dims(spec["rows"], spec["cols"])
+        scale = min((width - 2 * margin) / img_w,
+                    (height - 2 * margin) / img_h, 1)
+        if scale <= 0:
+            return
+        cr.save()
+        cr.translate(round((width - img_w * scale) / 2),
+                     round((height - img_h * scale) / 2))
+        cr.scale(scale, scale)
+        cr.rectangle(0, 0, img_w, img_h)
+        cr.set_source_rgba(*background_color)
+        cr.fill_preserve()
+        cr.save()
+        cr.clip()
+        rect = self.clip_rect(cr)
+        if rect is not None:
+            key = (hex_w, hex_h, geom.layout, spec["rows"], spec["cols"],
+                   width, height)
+            self.paint_grid(cr, geom, scale, key, rect)
+            if spec["numbering"]:
+                self.draw_numbering(cr, geom, scale, rect, spec)
+            if spec["large_grid"]:
+                self.draw_large_grid(cr, geom, scale, rect, spec)
+        cr.restore()
+        cr.rectangle(0, 0, img_w, img_h)
+        cr.set_line_width(1 / scale)
+        cr.set_source_rgba(*border_color)
+        cr.stroke()
+        cr.restore()
+
+    def clip_rect(self, cr):
+        # Part of the map being redrawn, as (x, y, width, height) in map
+        # pixels, None when it is empty
+        x0, y0, x1, y1 = cr.clip_extents()
+        x0, y0 = math.floor(x0), math.floor(y0)
+        x1, y1 = math.ceil(x1), math.ceil(y1)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1 - x0, y1 - y0
+
+    def paint_grid(self, cr, geom, scale, key, rect):
+        if key != self.grid_key or not contains(self.grid_rect, rect):
+            # The pattern only holds the part of the map in the clip region
+            cr.push_group()
+            self.draw_grid(cr, geom, scale, rect)
+            self.grid_pattern = cr.pop_group()
+            self.grid_key = key
+            self.grid_rect = rect
+        cr.set_source(self.grid_pattern)
+        cr.paint()
+
+    def draw_grid(self, cr, geom, scale, rect):
+        cr.set_source_rgba(*grid_color)
+        if geom.dx * scale < min_hex_px:
+            cr.rectangle(*rect)
+            cr.fill()
+            return
+        c0, c1, r0, r1 = geom.hexes_in_rect(rect)
+        self.hex_paths(cr, geom, geom.hex_center_list(c0, c1, r0, r1))
+        cr.set_line_width(1 / scale)
+        cr.stroke()
+
+    def hex_paths(self, cr, geom, centers):
+        outline = geom.hex_outline()
+        for x, y in centers:
+            ox, oy = outline[-1]
+            cr.move_to(x + ox, y + oy)
+            for ox, oy in outline:
+                cr.line_to(x + ox, y + oy)
+            cr.close_path()
+
+    def draw_numbering(self, cr, geom, scale, rect, spec):
+        # Tints the range of numbered hexes, and writes their labels when
+        # they can be read
+        x0, x1 = max(spec["x0"], 0), min(spec["x1"], spec["cols"] - 1)
+        y0, y1 = max(spec["y0"], 0), min(spec["y1"], spec["rows"] - 1)
+        if x1 < x0 or y1 < y0:
+            return
+        c0, c1, r0, r1 = geom.hexes_in_rect(rect)
+        c0, c1 = max(c0, x0), min(c1, x1 + 1)
+        r0, r1 = max(r0, y0), min(r1, y1 + 1)
+        if c1 <= c0 or r1 <= r0:
+            return
+        if geom.dx * scale < min_hex_px:
+            # The hexes of the range, or the part of it being redrawn, as
+            # a box
+            outline = geom.hex_outline()
+            left = geom.hex_center(c0, r0)[0] + outline[-1][0]
+            right = geom.hex_center(c1 - 1, r0)[0] + outline[2][0]
+            top = geom.hex_center(c0, r0)[1] + outline[0][1]
+            bottom = geom.hex_center(c0 + 1, r1 - 1)[1] + outline[3][1]
+            cr.rectangle(left, top, right - left, bottom - top)
+            cr.set_source_rgba(*numbering_color)
+            cr.fill()
+            return
+        centers = geom.hex_center_list(c0, c1, r0, r1)
+        self.hex_paths(cr, geom, centers)
+        cr.set_source_rgba(*numbering_color)
+        cr.fill()
+        if labels_font_size * scale < min_label_px:
+            return
+        # Labels centered on the hex, their top touching the top of the hex
+        ix, iy = spec["ix"] + x0 - spec["x0"], spec["iy"] + y0 - spec["y0"]
+        cr.select_font_face(labels_font)
+        cr.set_font_size(labels_font_size)
+        cr.set_source_rgba(*labels_color)
+        ascent = cr.font_extents()[0]
+        top = geom.hex_h // 2 + 1
+        for i, (x, y) in enumerate(centers):
+            c, r = c0 + i % (c1 - c0), r0 + i // (c1 - c0)
+            label = make_label(spec["separator"], ix + c - x0, iy + r - y0)
+            extents = cr.text_extents(label)
+            cr.move_to(x - extents[4] / 2, y - top + ascent)
+            cr.show_text(label)
+
+    def draw_large_grid(self, cr, geom, scale, rect, spec):
+        geom.lgrid_setup(spec["lgrid_scale"], spec["lgrid_ccol"],
+                         spec["lgrid_crow"], spec["lgrid_levels"])
+        # The hex the large grid is centered on
+        center = geom.hex_center(spec["lgrid_ccol"], spec["lgrid_crow"])
+        self.hex_paths(cr, geom, [center])
+        cr.set_source_rgba(*lgrid_center_color)
+        cr.fill()
+        # The levels whose large hexes can be told apart
+        scales = [s for s in geom.lgrid_scales()
+                  if geom.lgrid_hex_dims(s)[2] * scale >= min_hex_px]
+        if not scales:
+            return
+        for polyline in geom.lgrid_polylines(rect, scales):
+            cr.move_to(*polyline[0])
+            for x, y in polyline[1:]:
+                cr.line_to(x, y)
+        cr.set_line_width(1.5 / scale)
+        cr.set_source_rgba(*lgrid_color)
+        cr.stroke()
+
+def contains(outer, inner):
+    # Whether rect outer, (x, y, width, height), covers rect inner
+    if outer is None:
+        return False
+    ox, oy, ow, oh = outer
+    x, y, w, h = inner
+    return ox <= x and oy <= y and x + w <= ox + ow and y + h <= oy + oh
@@ -0,0 +1,140 @@
+# NAME
+#       hexprofile, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Instrumentation of the creation of hex maps: the time spent in each
+#       phase (layer creation, grid drawing, labels, ...), the calls made to
+#       GIMP in it and the peak memory of the plugin process, reported as one
+#       JSON line per run. It is disabled unless asked for, see profile_env,
+#       and then phases cost nothing but a function call.
+#
+#       GIMP calls are counted by wrapping the functions and methods of the
+#       Gimp module, see CallCounter. Most of them run a PDB procedure.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import contextlib, json, sys, time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory is not reported
+    resource = None
+
+# Environment variable enabling the instrumentation: the file the results
+# are appended to, or "console" for GIMP's error console
+profile_env = "HEXMAP4GIMP_PROFILE"
+
+def peak_rss_kb():
+    # Peak resident memory of this process, in KiB, None when unknown. GIMP
+    # itself, where the layers live, is another process.
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+class CallCounter:
+    def __init__(self):
+        self.calls = 0
+        self.wrapped = set()
+
+    def __call__(self):
+        return self.calls
+
+    def counted(self, function):
+        def call(*args, **kwargs):
+            self.calls += 1
+            return function(*args, **kwargs)
+        call.__name__ = getattr(function, "__name__", "call")
+        call.__doc__ = getattr(function, "__doc__", None)
+        return call
+
+    def wrap_module(self, module):
+        # Counts the calls to the functions of module and to the methods of
+        # its classes, once however many times it is wrapped
+        if module.__name__ in self.wrapped:
+            return
+        self.wrapped.add(module.__name__)
+        for name in dir(module):
+            if name.startswith("_"):
+                continue
+            try:
+                value = getattr(module, name)
+            except Exception:
+                # Some introspected names cannot be loaded
+                continue
+            if isinstance(value, type):
+                if (value.__module__ == module.__name__ and
+                        not issubclass(value, int)):
+                    self.wrap_class(value)
+            elif callable(value):
+                setattr(module, name, self.counted(value))
+
+    def wrap_class(self, cls):
+        # Methods defined by cls itself, so that inherited ones are only
+        # counted once. Introspected functions that are not methods, as
+        # constructors, stay static.
+        for name, value in list(vars(cls).items()):
+            if name.startswith("_"):
+                continue
+            if isinstance(value, (staticmethod, classmethod)):
+                wrapper = type(value)(self.counted(value.__func__))
+            elif not callable(value) or isinstance(value, type):
+                continue
+            elif hasattr(value, "is_method") and not value.is_method():
+                wrapper = staticmethod(self.counted(value))
+            else:
+                wrapper = self.counted(value)
+            try:
+                setattr(cls, name, wrapper)
+            except (AttributeError, TypeError):
+                pass
+
+class Profiler:
+    def __init__(self, enabled=False, counter=None):
+        # counter returns the GIMP calls made so far, as a CallCounter
+        self.enabled = enabled
+        self.counter = counter or (lambda: 0)
+        self.phases = {}
+        self.stack = []
+        self.start = time.perf_counter()
+        self.start_calls = self.counter()
+
+    def phase(self, name):
+        # Context measuring a phase. Phases inside another one are named
+        # after both, as "grid/fill", and phases run many times add up.
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.measure(name)
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        self.stack.append(name)
+        name = "/".join(self.stack)
+        start, calls = time.perf_counter(), self.counter()
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            stats = self.phases.setdefault(name, {"seconds": 0.0,
+                                                  "pdb_calls": 0, "runs": 0})
+            stats["seconds"] += time.perf_counter() - start
+            stats["pdb_calls"] += self.counter() - calls
+            stats["runs"] += 1
+
+    def results(self, **info):
+        # The measures as a dict, along with info about the run
+        results = dict(info)
+        results.update(seconds=time.perf_counter() - self.start,
+                       pdb_calls=self.counter() - self.start_calls,
+                       peak_rss_kb=peak_rss_kb(),
+                       phases=self.phases)
+        return results
+
+def results_line(results):
+    return json.dumps(results, default=str)
+
+def append_line(path, line):
+    with open(path, "a") as f:
+        f.write(line + "\n")
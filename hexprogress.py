@@ -0,0 +1,89 @@
+# NAME
+#       hexprogress, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Progress of the creation of hex maps. The drawing is split in chunks
+#       (bands of the layers, batches of hexes stamped or of large grid
+#       sides...) and the drawing routines call Progress.step after each one,
+#       which reports the fraction of the work done and checks whether the
+#       user asked to stop, raising Cancelled then.
+#
+#       The work is divided in nested parts, see Progress.part: a batch of
+#       maps in maps, a map in its phases (grid, labels, large grid), so each
+#       routine only counts its own chunks. Progress is disabled unless asked
+#       for, and then steps cost nothing but a function call.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import contextlib, time
+
+# Seconds between two reports of the progress
+report_interval = 0.1
+
+class Cancelled(Exception):
+    pass
+
+class Progress:
+    def __init__(self, report=None, poll=None):
+        # report(fraction, text) shows the progress, and poll() returns
+        # whether the user asked to stop
+        self.report = report
+        self.poll = poll
+        self.enabled = report is not None or poll is not None
+        self.start, self.end = 0.0, 1.0
+        self.text = ""
+        self.reported = None
+
+    @contextlib.contextmanager
+    def part(self, start, end, text=None):
+        # Context where the work goes from start to end, as fractions of the
+        # enclosing part, with text shown
+        outer = self.start, self.end, self.text
+        span = self.end - self.start
+        self.start, self.end = (outer[0] + span * start,
+                                outer[0] + span * end)
+        if text is not None:
+            self.text = text
+        try:
+            self.step(0, 1)
+            yield
+            # Not when leaving on an error, which a Cancelled raised by this
+            # step would hide
+            self.step(1, 1)
+        finally:
+            self.start, self.end, self.text = outer
+
+    def parts(self, weights):
+        # Contexts of consecutive parts of the given weights, as (name,
+        # weight) pairs, by name
+        total = sum(weight for name, weight in weights) or 1
+        done = 0
+        parts = {}
+        for name, weight in weights:
+            parts[name] = (done / total, (done + weight) / total)
+            done += weight
+        return lambda name, text=None: self.part(*parts[name], text)
+
+    def step(self, done, total):
+        # done chunks of total were finished in the current part
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if (self.reported is not None and done < total and
+                now - self.reported < report_interval):
+            return
+        self.reported = now
+        if self.report is not None:
+            fraction = self.start + (self.end - self.start) * done / total
+            self.report(min(1.0, fraction), self.text)
+        if self.poll is not None and self.poll():
+            raise Cancelled()
+
+    def chunks(self, items, total=None):
+        # The items, stepping after each of them
+        items = list(items) if total is None else items
+        total = len(items) if total is None else total
+        for i, item in enumerate(items):
+            yield item
+            self.step(i + 1, total)
@@ -0,0 +1,311 @@
+# NAME
+#       hexraster, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       NumPy rasterization of the hex grid, independent of GIMP. The blank hex
+#       brush mask is read once and placed on every hex center of the grid as
+#       array operations, giving the hex interiors drawn on the Terrain layer
+#       and the gaps between them filled on the Grid layer, which the plugin
+#       then writes to the layers with a single Gegl buffer upload each.
+#
+#       Hex labels are composited the same way: each distinct piece of text is
+#       rendered once by GIMP as a small sprite, and all the labels are built
+#       from those sprites into the buffer uploaded to the Numbers layer.
+#
+#       The functions take the grid geometry as a HexGeometry, from
+#       hexgeometry.py, with its dimensions set.
+#
+#       Bands of those layers can also be rendered in a pool of worker
+#       processes, see render_pool, while the plugin uploads the finished
+#       ones and draws the rest of the map.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import multiprocessing
+import numpy as np
+
+from hexgeometry import mask_threshold
+
+def full_rect(grid):
+    return 0, 0, grid.img_w, grid.img_h
+
+def paste(dst, rect, src, x, y):
+    # Adds src, whose top left pixel is (x, y) in image coordinates, to the
+    # part of dst covering rect. Stamps never overlap, so or-ing them in
+    # leaves every painted pixel with the value of the stamp that painted it.
+    rx, ry, rw, rh = rect
+    x0, y0 = max(x, rx), max(y, ry)
+    x1, y1 = min(x + src.shape[1], rx + rw), min(y + src.shape[0], ry + rh)
+    if x0 >= x1 or y0 >= y1:
+        return
+    dst[y0 - ry:y1 - ry, x0 - rx:x1 - rx] |= src[y0 - y:y1 - y, x0 - x:x1 - x]
+
+def painted(mask):
+    # Where the pencil paints with a brush mask, soft edges rounded to whole
+    # pixels as for the tiling tables, see hexgeometry.mask_threshold
+    return np.asarray(mask) >= mask_threshold
+
+def stamps_overlap(grid, mask):
+    # True when the brush stamped on a hex overlaps the stamp on one of its
+    # neighbours, which a blank hex brush leaving a gap between hexes never
+    # does. Checked against the hexes below, and right, of hex (0, 0).
+    mask = painted(mask)
+    h, w = mask.shape
+    for ox, oy in ((0, grid.dy),
+                   (grid.dx, grid.odd_col_offset),
+                   (grid.dx, grid.odd_col_offset - grid.dy)):
+        a = mask[max(0, oy):h + min(0, oy), ox:]
+        b = mask[max(0, -oy):h - max(0, oy), :w - ox]
+        if a.size and (a & b).any():
+            return True
+    return False
+
+def to_words(pixels):
+    # RGBA u8 pixels as one uint32 word per pixel
+    return np.ascontiguousarray(pixels, dtype=np.uint8).view(np.uint32)[..., 0]
+
+def to_rgba(words):
+    return words[..., None].view(np.uint8)
+
+def stamp_hexes(grid, stamp, rect=None):
+    # Stamps a brush on every hex of the grid with pixels inside rect and
+    # returns what gets painted. The stamp is either a boolean mask or an
+    # array of uint32 RGBA words, zero where the brush does not paint. Hexes
+    # of the same column parity are two columns and one row apart, further
+    # than the brush size, so the stamps of each parity are laid out as a
+    # single broadcast block.
+    rect = rect or full_rect(grid)
+    x, y, w, h = rect
+    stamp = np.asarray(stamp)
+    hex_h, hex_w = stamp.shape
+    cell_w, cell_h = 2 * grid.dx, grid.dy
+    if hex_w > cell_w or hex_h > cell_h or stamps_overlap(grid, stamp):
+        return stamp_hexes_reference(grid, stamp, rect)
+
+    painted = np.zeros((h, w), dtype=stamp.dtype)
+    c0, c1, r0, r1 = grid.hexes_in_rect(rect)
+    nrows = r1 - r0
+    cell = np.zeros((cell_h, cell_w), dtype=stamp.dtype)
+    cell[:hex_h, :hex_w] = stamp
+    for parity in (0, 1):
+        first = c0 + (parity - c0) % 2
+        ncols = len(range(first, c1, 2))
+        if ncols <= 0 or nrows <= 0:
+            continue
+        block = np.broadcast_to(cell[None, :, None, :],
+                                (nrows, cell_h, ncols, cell_w))
+        block = block.reshape(nrows * cell_h, ncols * cell_w)
+        bx, by = grid.stamp_origin(first, r0)
+        paste(painted, rect, block, bx, by)
+    return painted
+
+def stamp_hexes_reference(grid, stamp, rect=None):
+    # One stamp per hex, in the order HexGrid.draw uses with the pencil, later
+    # stamps painting over earlier ones. This is the reference stamp_hexes is
+    # checked against.
+    rect = rect or full_rect(grid)
+    rx, ry, w, h = rect
+    stamp = np.asarray(stamp)
+    where = stamp != 0
+    painted = np.zeros((h, w), dtype=stamp.dtype)
+    c0, c1, r0, r1 = grid.hexes_in_rect(rect)
+    for r in range(r0, r1):
+        for c in range(c0, c1):
+            x, y = grid.stamp_origin(c, r)
+            x0, y0 = max(x, rx), max(y, ry)
+            x1 = min(x + stamp.shape[1], rx + w)
+            y1 = min(y + stamp.shape[0], ry + h)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            s = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+            np.copyto(painted[y0 - ry:y1 - ry, x0 - rx:x1 - rx], stamp[s],
+                      where=where[s])
+    return painted
+
+def brush_arrays(w, h, mask_bpp, mask_data, color_bpp, color_data):
+    # Brush mask and, for color brushes, RGB colors from the raw data returned
+    # by Gimp.Brush.get_pixels
+    mask = np.frombuffer(mask_data, dtype=np.uint8)
+    mask = mask.reshape(h, w, mask_bpp)[..., 0]
+    color = None
+    if color_bpp >= 3 and color_data:
+        color = np.frombuffer(color_data, dtype=np.uint8)
+        color = color.reshape(h, w, color_bpp)[..., :3]
+    return mask, color
+
+def brush_pixels(mask, color=None):
+    # RGBA pixels the pencil paints with a brush: the brush colors, or white
+    # for plain mask brushes, at full opacity where the mask is set
+    mask = np.asarray(mask)
+    pixels = np.full(mask.shape + (4,), 255, dtype=np.uint8)
+    if color is not None:
+        pixels[..., :3] = color
+    return pixels
+
+def grid_masks(grid, mask, color=None, rect=None):
+    # Returns the RGBA Terrain pixels and the gap mask, the pixels that are
+    # not covered by a white blank hex (what select_color + invert selects)
+    pixels = brush_pixels(mask, color)
+    words = np.where(painted(mask), to_words(pixels), 0)
+    terrain = stamp_hexes(grid, words.astype(np.uint32), rect)
+    white = to_words(np.full(4, 255, dtype=np.uint8))
+    return to_rgba(terrain), terrain != white
+
+def fill_mask(mask, rgba):
+    # RGBA pixels with the given color where mask is set, transparent elsewhere
+    pixels = np.zeros(mask.shape + (4,), dtype=np.uint8)
+    pixels[mask] = rgba
+    return pixels
+
+def rgba_array(data, w, h):
+    return np.frombuffer(data, dtype=np.uint8).reshape(h, w, 4)
+
+def over(s, d):
+    # RGBA pixels s composited over d (straight alpha)
+    sa = s[..., 3:4] / np.float32(255)
+    da = d[..., 3:4] / np.float32(255) * (1 - sa)
+    alpha = sa + da
+    rgb = s[..., :3] * sa + d[..., :3] * da
+    np.divide(rgb, alpha, out=rgb, where=alpha > 0)
+    out = np.empty_like(d)
+    out[..., :3] = np.rint(rgb)
+    out[..., 3:4] = np.rint(alpha * 255)
+    return out
+
+def blit_over(dst, rect, src, xs, ys):
+    # Composites the RGBA src over the part of dst covering rect, with its
+    # top left pixel on each of the image coordinates xs, ys (arrays). The
+    # copies must not overlap each other.
+    rx, ry, rw, rh = rect
+    src_h, src_w = src.shape[:2]
+    y = (np.asarray(ys) - ry)[:, None, None] + np.arange(src_h)[:, None]
+    x = (np.asarray(xs) - rx)[:, None, None] + np.arange(src_w)
+    y, x = np.broadcast_arrays(y, x)
+    inside = (y >= 0) & (y < rh) & (x >= 0) & (x < rw)
+    s = np.broadcast_to(src, y.shape + (4,))[inside]
+    y, x = y[inside], x[inside]
+    dst[y, x] = over(s, dst[y, x])
+
+def blit_mask(dst, rect, src, mask, xs, ys):
+    # Copies the RGBA src pixels where mask is set to the part of dst
+    # covering rect, with its top left pixel on each of the image coordinates
+    # xs, ys (arrays), as the pencil stamps a brush
+    rx, ry, rw, rh = rect
+    my, mx = np.nonzero(mask)
+    y = (np.asarray(ys) - ry)[:, None] + my
+    x = (np.asarray(xs) - rx)[:, None] + mx
+    inside = (y >= 0) & (y < rh) & (x >= 0) & (x < rw)
+    s = np.broadcast_to(src[my, mx], y.shape + (4,))[inside]
+    dst[y[inside], x[inside]] = s
+
+def stamp_rect(dst, rect, src, mask, xs, ys, chunk=1024):
+    # blit_mask of the copies reaching into rect, a chunk of them at a time,
+    # later copies painting over earlier ones
+    x, y, w, h = rect
+    reach = np.flatnonzero((ys < y + h) & (ys + mask.shape[0] > y) &
+                           (xs < x + w) & (xs + mask.shape[1] > x))
+    for i in range(0, len(reach), chunk):
+        copies = reach[i:i + chunk]
+        blit_mask(dst, rect, src, mask, xs[copies], ys[copies])
+
+def stamp_origins(grid, hexes, w, h):
+    # Top left pixel of a w x h brush stamped on the hexes of an array of
+    # col, row pairs, as two arrays of x and y
+    c, r = np.asarray(hexes, dtype=np.int64).reshape(-1, 2).T
+    x, y = grid.hex_center(c, r)
+    return x - w // 2, y - h // 2
+
+def stamps_rect(stamps):
+    # Bounding box (x, y, width, height) of the brushes of stamps, (pixels,
+    # mask, xs, ys) as stamp_rect takes them, stamped on their origins
+    stamps = [(src, xs, ys) for src, mask, xs, ys in stamps if xs.size]
+    if not stamps:
+        return 0, 0, 0, 0
+    x0 = min(int(xs.min()) for src, xs, ys in stamps)
+    y0 = min(int(ys.min()) for src, xs, ys in stamps)
+    x1 = max(int(xs.max()) + src.shape[1] for src, xs, ys in stamps)
+    y1 = max(int(ys.max()) + src.shape[0] for src, xs, ys in stamps)
+    return x0, y0, x1 - x0, y1 - y0
+
+def label_placements(grid, layout, widths):
+    # Top left pixel of every copy of each token sprite in the labels, as
+    # {token: (tops, lefts)} arrays sorted by top, from the layout given by
+    # HexGeometry.label_grid and the width of each sprite. Labels are
+    # centered on the hex and touch its top, as draw_labels_merged places
+    # its text layers.
+    cx, cy, col_tokens, sep, row_tokens = layout
+    if cx.size == 0:
+        return {}
+    col_w = np.array([widths[t] for t in col_tokens], dtype=int)
+    row_w = np.array([widths[t] for t in row_tokens], dtype=int)
+    sep_w = widths.get(sep, 0)
+    left = cx - (col_w + sep_w + row_w[:, None]) // 2
+    top = cy - grid.hex_h // 2 - 1
+    groups = {}
+    for i, token in enumerate(col_tokens):
+        groups.setdefault(token, []).append((top[:, i], left[:, i]))
+    if sep:
+        groups.setdefault(sep, []).append((top, left + col_w))
+    left = left + col_w + sep_w
+    for j, token in enumerate(row_tokens):
+        groups.setdefault(token, []).append((top[j], left[j]))
+    placements = {}
+    for token, parts in groups.items():
+        tops = np.concatenate([t.ravel() for t, l in parts])
+        lefts = np.concatenate([l.ravel() for t, l in parts])
+        order = np.argsort(tops, kind="stable")
+        placements[token] = tops[order], lefts[order]
+    return placements
+
+def placements_rect(placements, sprites):
+    # Bounding box (x, y, width, height) of the labels
+    x0 = min(int(lefts.min()) for tops, lefts in placements.values())
+    y0 = min(int(tops[0]) for tops, lefts in placements.values())
+    x1 = max(int(lefts.max()) + sprites[token].shape[1]
+             for token, (tops, lefts) in placements.items())
+    y1 = max(int(tops[-1]) + sprites[token].shape[0]
+             for token, (tops, lefts) in placements.items())
+    return x0, y0, x1 - x0, y1 - y0
+
+def compose_labels(placements, sprites, rect, chunk=4096):
+    # RGBA pixels of rect with the sprites of the labels composited on their
+    # placements, token by token and a chunk of copies at a time
+    x, y, w, h = rect
+    pixels = np.zeros((h, w, 4), dtype=np.uint8)
+    for token, (tops, lefts) in placements.items():
+        sprite = sprites[token]
+        start = np.searchsorted(tops, y - sprite.shape[0] + 1)
+        end = np.searchsorted(tops, y + h)
+        for i in range(start, end, chunk):
+            j = min(end, i + chunk)
+            blit_over(pixels, rect, sprite, lefts[i:j], tops[i:j])
+    return pixels
+
+# What the worker processes of a render_pool render, set once in each of them
+worker_state = None
+
+def init_worker(state):
+    global worker_state
+    worker_state = state
+
+def render_pool(processes, state):
+    # Pool of processes running render_band. state is a dict with the grid
+    # (a plain HexGeometry), the blank hex "mask" and "color" arrays and the
+    # "grid_rgba" color for the grid bands, and the label "placements" and
+    # "sprites" for the label bands. Processes are spawned, not forked, as
+    # the plugin process holds its connection to GIMP.
+    context = multiprocessing.get_context("spawn")
+    return context.Pool(processes, init_worker, (state,))
+
+def render_band(task):
+    # Renders a ("grid", rect) task as the Terrain and Grid pixels of rect,
+    # or a ("labels", rect) task as the Numbers pixels of rect
+    kind, rect = task
+    state = worker_state
+    if kind == "grid":
+        terrain, gap = grid_masks(state["grid"], state["mask"],
+                                  state["color"], rect)
+        return kind, rect, (terrain, fill_mask(gap, state["grid_rgba"]))
+    return kind, rect, (compose_labels(state["placements"], state["sprites"],
+                                       rect),)
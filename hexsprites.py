@@ -0,0 +1,102 @@
+# NAME
+#       hexsprites, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Cache of the label sprites, the pixels of each piece of a hex label
+#       (column number, separator and row number) rendered by GIMP's text
+#       engine, so that they are only rendered the first time they are used
+#       with a given font, size and color. The sprites are kept in a NumPy
+#       .npz file, with the least recently used ones dropped when they take
+#       more bytes than the budget of the cache.
+#
+#       The cache counts its hits, misses and evictions, see stats.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import collections, json, os
+import numpy as np
+
+# Version of the cache file format, older files are ignored
+cache_version = 1
+
+def sprite_key(font, size, color, text):
+    return json.dumps([font, size, color, text])
+
+class SpriteCache:
+    def __init__(self, path, budget):
+        # path is the cache file and budget the bytes its sprites may take
+        self.path = path
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.changed = False
+        # Sprites by key, the most recently used last
+        self.sprites = self.load()
+        self.bytes = sum(sprite.nbytes for sprite in self.sprites.values())
+
+    def load(self):
+        sprites = collections.OrderedDict()
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                index = json.loads(str(data["index"]))
+                if index.get("version") != cache_version:
+                    return sprites
+                for i, key in enumerate(index["keys"]):
+                    sprites[key] = data[f"s{i}"]
+        except (OSError, EOFError, ValueError, KeyError):
+            # Missing, truncated or corrupt files are an empty cache
+            return collections.OrderedDict()
+        return sprites
+
+    def save(self):
+        # Written aside and renamed, as the brush cache, and only when
+        # sprites were added, evicted or used in another order
+        if not self.changed:
+            return
+        keys = list(self.sprites)
+        index = json.dumps({"version": cache_version, "keys": keys})
+        arrays = {f"s{i}": self.sprites[key] for i, key in enumerate(keys)}
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, index=np.array(index), **arrays)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+        self.changed = False
+
+    def lookup(self, key):
+        # The sprite, as an RGBA array, or None when it is not cached
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if next(reversed(self.sprites)) != key:
+            self.sprites.move_to_end(key)
+            self.changed = True
+        return sprite
+
+    def store(self, key, sprite):
+        if key in self.sprites:
+            self.bytes -= self.sprites.pop(key).nbytes
+        self.sprites[key] = np.ascontiguousarray(sprite)
+        self.bytes += self.sprites[key].nbytes
+        self.changed = True
+        self.evict()
+
+    def evict(self):
+        # Drops the least recently used sprites until the rest fit in the
+        # budget
+        while self.sprites and self.bytes > self.budget:
+            key, sprite = self.sprites.popitem(last=False)
+            self.bytes -= sprite.nbytes
+            self.evictions += 1
+            self.changed = True
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "sprites": len(self.sprites),
+                "bytes": self.bytes}
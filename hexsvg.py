@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# NAME
+#       hexsvg, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Export of the hex grid, the hex labels and the large grid of a map as
+#       an SVG drawing, computed from the grid geometry of hexgeometry.py
+#       without rasterizing anything, so it does not need GIMP. The outline
+#       of a hex is defined once as a symbol and placed on every hex center,
+#       and the file is written one row of hexes at a time, so big maps take
+#       little memory however large the drawing gets.
+#
+#       The plugin writes it for batch outputs ending in .svg. It can also be
+#       run from the command line, taking the blank hex size from the brush
+#       file:
+#
+#           python3 hexsvg.py --brush-file blank.gbr --rows 40 --cols 60 \
+#               --numbering --large-grid map.svg
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import argparse, json, sys
+from xml.sax.saxutils import escape
+
+from hexbrushes import read_gbr_mask
+from hexgeometry import HexGeometry, make_label, mask_layout
+
+# Colors and sizes of the drawing, as the plugin draws the layers
+grid_color = "#969696"
+grid_opacity = 0.75
+labels_color = "#646464"
+labels_font = "sans-serif"
+labels_font_size = 7
+
+# Rows of large hexes whose sides are computed at once
+lgrid_band_rows = 16
+
+def number(value):
+    # Coordinates with at most two decimals, and no trailing zeros
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+def points(polyline):
+    # SVG points of a polyline drawn with the pencil, whose pixels are
+    # centered half a pixel right and below their coordinates
+    return " ".join(f"{number(x + 0.5)},{number(y + 0.5)}"
+                    for x, y in polyline)
+
+def write_svg(f, hex_w, hex_h, spec, layout=None):
+    # Writes the map of spec (settings as in hexmap4gimp.default_spec, with
+    # x1, y1, lgrid_ccol and lgrid_crow given) for a blank hex brush of
+    # hex_w x hex_h pixels, tiling as layout, to the text file f
+    geom = HexGeometry(hex_w, hex_h, layout)
+    rows, cols = spec["rows"], spec["cols"]
+    img_w, img_h = geom.set_dims(rows, cols)
+    outline = " ".join(f"{number(x)},{number(y)}"
+                       for x, y in geom.hex_outline())
+
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" '
+            f'xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{img_w}" height="{img_h}" '
+            f'viewBox="0 0 {img_w} {img_h}">\n'
+            f'<defs><symbol id="hex" overflow="visible">'
+            f'<polygon points="{outline}"/></symbol></defs>\n')
+
+    # The blank hexes are centered half a pixel below their center pixel,
+    # as their height is odd
+    f.write(f'<g id="Grid" fill="none" stroke="{grid_color}" '
+            f'stroke-width="1" opacity="{grid_opacity}" '
+            f'style="mix-blend-mode:multiply">\n')
+    for r in range(rows):
+        centers = geom.hex_center_list(0, cols, r, r + 1)
+        f.write("".join(f'<use xlink:href="#hex" x="{x}" '
+                        f'y="{number(y + 0.5)}"/>\n' for x, y in centers))
+    f.write("</g>\n")
+
+    if spec["large_grid"]:
+        geom.lgrid_setup(spec["lgrid_scale"], spec["lgrid_ccol"],
+                         spec["lgrid_crow"], spec["lgrid_levels"])
+        f.write(f'<g id="LargeGrid" fill="none" stroke="{grid_color}" '
+                f'stroke-width="1" opacity="{grid_opacity}" '
+                f'style="mix-blend-mode:multiply">\n')
+        # Written in bands of large hex rows, the sides crossing from one
+        # band to the next in both
+        band_h = lgrid_band_rows * geom.lgrid_hex_dims()[1]
+        for y in range(0, img_h, band_h):
+            for polyline in geom.lgrid_polylines(
+                    (0, y, img_w, min(band_h, img_h - y))):
+                f.write(f'<polyline points="{points(polyline)}"/>\n')
+        f.write("</g>\n")
+
+    if spec["numbering"]:
+        # Labels centered on the hex, their top touching the top of the hex
+        x0, x1 = max(spec["x0"], 0), min(spec["x1"], cols - 1)
+        y0, y1 = max(spec["y0"], 0), min(spec["y1"], rows - 1)
+        ix, iy = spec["ix"] + x0 - spec["x0"], spec["iy"] + y0 - spec["y0"]
+        separator = spec["separator"]
+        f.write(f'<g id="Numbers" fill="{labels_color}" '
+                f'font-family="{labels_font}" '
+                f'font-size="{labels_font_size}" text-anchor="middle" '
+                f'dominant-baseline="hanging">\n')
+        for r in range(y0, y1 + 1):
+            centers = geom.hex_center_list(x0, x1 + 1, r, r + 1)
+            f.write("".join(
+                f'<text x="{x}" y="{y - hex_h // 2 - 1}">'
+                f'{escape(make_label(separator, ix + c, iy + r - y0))}'
+                f'</text>\n'
+                for c, (x, y) in enumerate(centers)))
+        f.write("</g>\n")
+    f.write("</svg>\n")
+
+def export_svg(path, hex_w, hex_h, spec, layout=None):
+    with open(path, "w", encoding="utf-8") as f:
+        write_svg(f, hex_w, hex_h, spec, layout)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exports a hex map as an SVG drawing, without GIMP")
+    parser.add_argument("output", help="SVG file to write, - for stdout")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--brush-file", help="blank hex brush (.gbr) whose "
+                                           "size is used")
+    size.add_argument("--hex-size", default="36x31",
+                      help="size of the blank hex brush, as WxH (%(default)s, "
+                           "the HexGimp brush)")
+    parser.add_argument("--spec", help="JSON object with the map settings, "
+                                       "as in a batch specs file entry")
+    parser.add_argument("--rows", type=int)
+    parser.add_argument("--cols", type=int)
+    parser.add_argument("--numbering", action="store_true", default=None)
+    parser.add_argument("--large-grid", action="store_true", default=None)
+    parser.add_argument("--lgrid-scale", type=int)
+    parser.add_argument("--lgrid-levels", type=int)
+    args = parser.parse_args()
+
+    spec = {"rows": 16, "cols": 16, "numbering": False, "x0": 0, "y0": 0,
+            "x1": None, "y1": None, "ix": 0, "iy": 0, "separator": "",
+            "large_grid": False, "lgrid_scale": 4, "lgrid_ccol": None,
+            "lgrid_crow": None, "lgrid_levels": 1}
+    if args.spec:
+        with open(args.spec) as f:
+            spec.update(json.load(f))
+    for key in ("rows", "cols", "numbering", "large_grid", "lgrid_scale",
+                "lgrid_levels"):
+        if getattr(args, key) is not None:
+            spec[key] = getattr(args, key)
+    for key, size_key in (("x1", "cols"), ("y1", "rows")):
+        if spec[key] is None:
+            spec[key] = spec[size_key] - 1
+    for key, size_key in (("lgrid_ccol", "cols"), ("lgrid_crow", "rows")):
+        if spec[key] is None:
+            spec[key] = spec[size_key] // 2
+
+    layout = None
+    if args.brush_file:
+        # The grid is laid out as the brush mask tiles
+        brush = read_gbr_mask(args.brush_file)
+        if brush is None:
+            parser.error(f"{args.brush_file} is not a GIMP brush file")
+        hex_w, hex_h, depth, pixels = brush
+        try:
+            layout = mask_layout(hex_w, hex_h, pixels, depth)
+        except ValueError as error:
+            # Laid out as the HexGimp brushes, as the plugin does
+            print(f"{args.brush_file}: {error}, laid out as the HexGimp "
+                  f"brushes", file=sys.stderr)
+        try:
+            HexGeometry(hex_w, hex_h, layout)
+        except ValueError as error:
+            parser.error(f"{args.brush_file}: {error}")
+    else:
+        hex_w, hex_h = (int(v) for v in args.hex_size.lower().split("x"))
+
+    if args.output == "-":
+        write_svg(sys.stdout, hex_w, hex_h, spec, layout)
+    else:
+        export_svg(args.output, hex_w, hex_h, spec, layout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# NAME
+#       hextemplates, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Cache of finished hex maps, kept as XCF files in a folder of GIMP's
+#       configuration folder, so that a map made again with the same settings
+#       and the same blank hex brush is loaded instead of drawn. Maps are
+#       keyed by a hash of their settings and of the name, file and
+#       modification time of the brush, see template_key, so editing the
+#       brush makes new maps. The least recently used maps are deleted when
+#       the files take more than the budget of the cache, and maps larger
+#       than the whole budget are not kept.
+#
+#       The folder has an index, a JSON file with the key and size of each
+#       map, the most recently used last. Map files not in the index, such as
+#       those left by a plugin stopped while saving one, are ignored, and
+#       deleted with the next map saved.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import collections, hashlib, json, os
+
+# Version of the index format, older indexes are ignored
+cache_version = 1
+
+index_file = "index.json"
+
+def template_key(settings, brush):
+    # Key of the map made with settings, a JSON-able dict, and brush, a dict
+    # identifying the blank hex brush file
+    data = json.dumps({"settings": settings, "brush": brush},
+                      sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+class TemplateCache:
+    def __init__(self, directory, budget):
+        # directory is the folder of the maps, created when the first one is
+        # saved, and budget the bytes their files may take
+        self.directory = directory
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Sizes of the map files by key, the most recently used last
+        self.templates = self.load()
+        self.bytes = sum(self.templates.values())
+
+    def load(self):
+        templates = collections.OrderedDict()
+        try:
+            with open(os.path.join(self.directory, index_file)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return templates
+        if not isinstance(index, dict) or index.get("version") != cache_version:
+            return templates
+        for key, size in index.get("templates", []):
+            templates[key] = size
+        return templates
+
+    def save(self):
+        # Written aside and renamed, as the brush cache
+        path = os.path.join(self.directory, index_file)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"version": cache_version,
+                           "templates": list(self.templates.items())}, f,
+                          indent=1)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".xcf")
+
+    def temp_path(self, key):
+        # File a map is saved to before it is added, see store
+        return os.path.join(self.directory, key + "-tmp.xcf")
+
+    def lookup(self, key):
+        # The file of the map, or None when it is not cached or its file
+        # was removed or changed
+        size = self.templates.get(key)
+        if size is not None:
+            try:
+                if os.path.getsize(self.path(key)) != size:
+                    size = None
+            except OSError:
+                size = None
+            if size is None:
+                self.discard(key)
+        if size is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if next(reversed(self.templates)) != key:
+            self.templates.move_to_end(key)
+            self.save()
+        return self.path(key)
+
+    def prepare(self, key):
+        # Creates the folder, and returns the file the map of key must be
+        # saved to before calling store
+        os.makedirs(self.directory, exist_ok=True)
+        return self.temp_path(key)
+
+    def store(self, key):
+        # Adds the map saved to temp_path(key), dropping the least recently
+        # used ones until the rest fit in the budget. A map larger than the
+        # whole budget is deleted instead, and False returned.
+        size = os.path.getsize(self.temp_path(key))
+        if size > self.budget:
+            os.remove(self.temp_path(key))
+            self.discard(key)
+            return False
+        os.replace(self.temp_path(key), self.path(key))
+        self.bytes -= self.templates.pop(key, 0)
+        self.templates[key] = size
+        self.bytes += size
+        while self.bytes > self.budget:
+            old, size = self.templates.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            self.remove(old)
+        self.remove_strays()
+        self.save()
+        return True
+
+    def discard(self, key):
+        self.bytes -= self.templates.pop(key, 0)
+        self.remove(key)
+        self.save()
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def remove_strays(self):
+        # Deletes the map files not in the index
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            key, extension = os.path.splitext(name)
+            if extension == ".xcf" and key not in self.templates:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "templates": len(self.templates), "bytes": self.bytes}
@@ -0,0 +1,163 @@
+# NAME
+#       hextiles, part of HexMap4Gimp, Christian Tenllado
+#
+# DESCRIPTION
+#
+#       Tile pyramid of a map for web map viewers (Leaflet and the like),
+#       independent of GIMP. The map is cut into tiles of a fixed size, saved
+#       as z/x/y files, at the full resolution on the highest zoom level and
+#       halving the resolution on each level below, down to zoom 0, where the
+#       whole map fits in one tile. The plugin reads the pixels of each tile
+#       from the map and hands them to a TileWriter, so only one tile is kept
+#       in memory at a time.
+#
+#       Tiles are written as PNG, with the encoder below, or as WebP when
+#       Pillow is available. Tiles with the same pixels, as the grid and
+#       blank hexes repeat all over an unpainted map, are encoded once and
+#       their file is linked, or copied, for the other ones. Tiles made from
+#       the same source, the pixels of the layers the plugin blends into
+#       them, are linked without being made again. Fully transparent tiles
+#       are not written at all.
+#
+# LICENSE: GPLv3, see hexmap4gimp.py
+
+import hashlib, io, json, math, os, shutil, struct, zlib
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is not available, tiles can only be written as PNG
+    Image = None
+
+tile_formats = ("png", "webp")
+
+def png_chunk(kind, data):
+    chunk = kind + data
+    return (struct.pack(">I", len(data)) + chunk +
+            struct.pack(">I", zlib.crc32(chunk) & 0xffffffff))
+
+def png_bytes(width, height, rgba):
+    # PNG file of width x height RGBA u8 pixels, each row unfiltered
+    stride = width * 4
+    raw = b"".join(b"\0" + rgba[y * stride:(y + 1) * stride]
+                   for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header) +
+            png_chunk(b"IDAT", zlib.compress(raw, 6)) +
+            png_chunk(b"IEND", b""))
+
+def webp_bytes(width, height, rgba):
+    out = io.BytesIO()
+    Image.frombytes("RGBA", (width, height), bytes(rgba)).save(
+        out, "WEBP", lossless=True)
+    return out.getvalue()
+
+def snap_tile_size(size, period):
+    # Multiple of the grid period closest to size, so that tiles of the
+    # same part of the grid look the same wherever they are in the map
+    return max(1, round(size / period)) * period
+
+def max_zoom(width, height, tile_w, tile_h):
+    # Zoom level with the map at full resolution, the map fitting in one
+    # tile on zoom 0
+    tiles = max(width / tile_w, height / tile_h)
+    return max(0, math.ceil(math.log2(tiles)))
+
+def pyramid_tiles(width, height, tile_w, tile_h):
+    # Yields the zoom, column and row of every tile of the pyramid, with
+    # the scale of its level, from the highest zoom down. The tile covers
+    # the pixels (x * tile_w, y * tile_h) to ((x + 1) * tile_w, (y + 1) *
+    # tile_h) of the map scaled by that scale.
+    top = max_zoom(width, height, tile_w, tile_h)
+    for z in range(top, -1, -1):
+        scale = 0.5 ** (top - z)
+        cols = math.ceil(math.ceil(width * scale) / tile_w)
+        rows = math.ceil(math.ceil(height * scale) / tile_h)
+        for y in range(rows):
+            for x in range(cols):
+                yield z, x, y, scale
+
+def tile_key(*parts):
+    # Digest of the pixels of a tile, or of the pixels it is made from
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part)
+    return digest.digest()
+
+class TileWriter:
+    def __init__(self, directory, tile_format="png"):
+        if tile_format not in tile_formats:
+            raise ValueError(f"Unknown tile format: {tile_format}")
+        if tile_format == "webp" and Image is None:
+            raise ValueError("WebP tiles need Pillow, which is not available")
+        self.directory = directory
+        self.tile_format = tile_format
+        self.encode = png_bytes if tile_format == "png" else webp_bytes
+        # File of the first tile written with each content, and with each
+        # source, None for transparent tiles
+        self.files = {}
+        self.sources = {}
+        self.written = 0
+        self.reused = 0
+        self.empty = 0
+
+    def path(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x),
+                            f"{y}.{self.tile_format}")
+
+    def link(self, first, path):
+        self.reused += 1
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.link(first, path)
+        except OSError:
+            shutil.copyfile(first, path)
+
+    def reuse(self, z, x, y, source):
+        # Writes the tile as the first one written from the same source, a
+        # key of what it is made from, if any. Returns whether it did.
+        if source not in self.sources:
+            return False
+        first = self.sources[source]
+        if first is None:
+            self.empty += 1
+        else:
+            path = self.path(z, x, y)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.link(first, path)
+        return True
+
+    def write(self, z, x, y, width, height, rgba, source=None):
+        if not any(rgba[3::4]):
+            self.empty += 1
+            if source is not None:
+                self.sources[source] = None
+            return
+        path = self.path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        key = tile_key(rgba)
+        first = self.files.get(key)
+        if first is not None:
+            self.link(first, path)
+        else:
+            with open(path, "wb") as f:
+                f.write(self.encode(width, height, rgba))
+            self.files[key] = first = path
+            self.written += 1
+        if source is not None:
+            self.sources[source] = first
+
+    def write_manifest(self, width, height, tile_w, tile_h):
+        # Description of the pyramid for the viewer, next to the zoom levels
+        manifest = {"width": width, "height": height,
+                    "tile_width": tile_w, "tile_height": tile_h,
+                    "min_zoom": 0,
+                    "max_zoom": max_zoom(width, height, tile_w, tile_h),
+                    "format": self.tile_format,
+                    "url": "{z}/{x}/{y}." + self.tile_format,
+                    "tiles": self.written + self.reused,
+                    "unique_tiles": self.written}
+        with open(os.path.join(self.directory, "tiles.json"), "w") as f:
+            json.dump(manifest, f, indent=1)
+        return manifest